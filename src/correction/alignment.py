@@ -0,0 +1,321 @@
+"""Local token alignment between the two normalized OCR outputs.
+
+Replaces the LLM comparison stage. The word arrays produced by
+correction.normalize are aligned by anchoring on words that occur once in both
+outputs (patience diff) and running difflib between anchors; unequal stretches
+are then paired with a banded edit-distance alignment scored by per-token
+Levenshtein similarity, and the comparison rules from tasks.yaml are applied to
+produce the `flagged_words` list consumed by the report stage.
+"""
+import re
+from difflib import SequenceMatcher
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from correction import settings
+from correction.normalize import NormalizedText
+
+# Two tokens at or above this similarity are a shared/similar misspelling, not an error
+FUZZY_MATCH_THRESHOLD = 0.8
+
+# Replace blocks larger than this are paired positionally instead of with the DP
+MAX_BLOCK_SIZE = 200
+
+# Extra diagonal width allowed beyond the length difference of a block
+BAND_WIDTH = 8
+
+# Cost of leaving a token unpaired; below 1 so split/merged words pair with their closest match
+GAP_COST = 0.6
+
+RULE_MISMATCH = "ocr_mismatch"
+RULE_ALPHANUMERIC = "alphanumeric_mix"
+RULE_LOW_CONFIDENCE = "low_confidence"
+
+# One-letter rule codes used in the compact encodings exchanged with the crew
+RULE_CODES = {RULE_MISMATCH: "M", RULE_ALPHANUMERIC: "A", RULE_LOW_CONFIDENCE: "L"}
+
+_ORDINAL_RE = re.compile(r"^\d+(st|nd|rd|th)$")
+
+
+def levenshtein(a: str, b: str, max_distance: Optional[int] = None) -> int:
+    """Return the edit distance between `a` and `b`, stopping early past `max_distance`."""
+    if a == b:
+        return 0
+    if len(a) < len(b):
+        a, b = b, a
+    if not b:
+        return len(a)
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb),
+            ))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def similarity(a: str, b: str) -> float:
+    """Levenshtein similarity in [0, 1] between two tokens."""
+    if a == b:
+        return 1.0
+    longest = max(len(a), len(b))
+    return 1.0 - levenshtein(a, b) / longest
+
+
+def is_alphanumeric_junk(word: str) -> bool:
+    """True for tokens mixing letters and digits like '0rder2' (but not '2nd' or '2023-10-01')."""
+    has_alpha = any(ch.isalpha() for ch in word)
+    has_digit = any(ch.isdigit() for ch in word)
+    return has_alpha and has_digit and not _ORDINAL_RE.match(word)
+
+
+def _align_block(a: List[str], b: List[str]) -> List[Tuple[Optional[int], Optional[int]]]:
+    """Pair tokens of two unequal stretches with a banded edit-distance alignment.
+
+    Returns (i, j) pairs of block-relative indices; a None side is a gap.
+    """
+    n, m = len(a), len(b)
+    if n > MAX_BLOCK_SIZE or m > MAX_BLOCK_SIZE:
+        pairs = [(i, i) for i in range(min(n, m))]
+        pairs += [(i, None) for i in range(m, n)]
+        pairs += [(None, j) for j in range(n, m)]
+        return pairs
+
+    band = abs(n - m) + BAND_WIDTH
+    inf = float("inf")
+    cost = [[inf] * (m + 1) for _ in range(n + 1)]
+    move = [[None] * (m + 1) for _ in range(n + 1)]
+    cost[0][0] = 0.0
+
+    for i in range(n + 1):
+        for j in range(max(0, i - band), min(m, i + band) + 1):
+            if i == 0 and j == 0:
+                continue
+            best, step = inf, None
+            if i > 0 and j > 0 and cost[i - 1][j - 1] < inf:
+                best = cost[i - 1][j - 1] + (1.0 - similarity(a[i - 1], b[j - 1]))
+                step = "pair"
+            if i > 0 and cost[i - 1][j] + GAP_COST < best:
+                best, step = cost[i - 1][j] + GAP_COST, "gap_b"
+            if j > 0 and cost[i][j - 1] + GAP_COST < best:
+                best, step = cost[i][j - 1] + GAP_COST, "gap_a"
+            cost[i][j], move[i][j] = best, step
+
+    pairs = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        step = move[i][j]
+        if step == "pair":
+            pairs.append((i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif step == "gap_b":
+            pairs.append((i - 1, None))
+            i -= 1
+        else:
+            pairs.append((None, j - 1))
+            j -= 1
+    pairs.reverse()
+    return pairs
+
+
+def _unique_anchors(a: List[str], b: List[str], a_lo: int, a_hi: int, b_lo: int, b_hi: int) -> List[Tuple[int, int]]:
+    """Pairs of tokens occurring exactly once in both ranges, reduced to their longest increasing run."""
+    counts: Dict[str, List[int]] = {}
+    for i in range(a_lo, a_hi):
+        entry = counts.setdefault(a[i], [0, i, 0, -1])
+        entry[0] += 1
+    for j in range(b_lo, b_hi):
+        entry = counts.get(b[j])
+        if entry is not None:
+            entry[2] += 1
+            entry[3] = j
+
+    candidates = sorted((entry[1], entry[3]) for entry in counts.values()
+                        if entry[0] == 1 and entry[2] == 1)
+    if not candidates:
+        return []
+
+    # Longest increasing subsequence on the OCR2 side (patience sorting)
+    tails: List[int] = []
+    tail_index: List[int] = []
+    parents: List[int] = [-1] * len(candidates)
+    for k, (_, j) in enumerate(candidates):
+        lo, hi = 0, len(tails)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if tails[mid] < j:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo > 0:
+            parents[k] = tail_index[lo - 1]
+        if lo == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[lo] = j
+            tail_index[lo] = k
+
+    anchors = []
+    k = tail_index[-1]
+    while k != -1:
+        anchors.append(candidates[k])
+        k = parents[k]
+    anchors.reverse()
+    return anchors
+
+
+def _opcodes(a: List[str], b: List[str], a_lo: int, a_hi: int, b_lo: int, b_hi: int, out: List[Tuple]):
+    """Append difflib-style opcodes for the given ranges, anchoring on unique shared tokens first."""
+    # Peel off common prefix and suffix
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        out.append(("equal", a_lo, a_lo + 1, b_lo, b_lo + 1))
+        a_lo, b_lo = a_lo + 1, b_lo + 1
+    suffix = []
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+        suffix.append(("equal", a_hi - 1, a_hi, b_hi - 1, b_hi))
+        a_hi, b_hi = a_hi - 1, b_hi - 1
+
+    if a_lo < a_hi or b_lo < b_hi:
+        anchors = _unique_anchors(a, b, a_lo, a_hi, b_lo, b_hi)
+        if anchors:
+            prev_i, prev_j = a_lo, b_lo
+            for i, j in anchors:
+                _opcodes(a, b, prev_i, i, prev_j, j, out)
+                out.append(("equal", i, i + 1, j, j + 1))
+                prev_i, prev_j = i + 1, j + 1
+            _opcodes(a, b, prev_i, a_hi, prev_j, b_hi, out)
+        else:
+            # Long anchorless stretches are highly repetitive; let difflib skip popular tokens there
+            autojunk = (a_hi - a_lo) + (b_hi - b_lo) > 2 * MAX_BLOCK_SIZE
+            matcher = SequenceMatcher(None, a[a_lo:a_hi], b[b_lo:b_hi], autojunk=autojunk)
+            for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+                out.append((tag, a_lo + i1, a_lo + i2, b_lo + j1, b_lo + j2))
+
+    out.extend(reversed(suffix))
+
+
+def align_tokens(ocr1: NormalizedText, ocr2: NormalizedText) -> List[Tuple[Optional[int], Optional[int]]]:
+    """Align two normalized word arrays, returning (ocr1 index, ocr2 index) pairs."""
+    a, b = ocr1.words, ocr2.words
+    opcodes: List[Tuple] = []
+    _opcodes(a, b, 0, len(a), 0, len(b), opcodes)
+
+    pairs = []
+    pending_a: List[int] = []
+    pending_b: List[int] = []
+
+    def flush():
+        # Adjacent non-equal opcodes are merged into one block before pairing
+        if pending_a and pending_b:
+            block = _align_block([a[i] for i in pending_a], [b[j] for j in pending_b])
+            for i, j in block:
+                pairs.append((None if i is None else pending_a[i], None if j is None else pending_b[j]))
+        else:
+            pairs.extend((i, None) for i in pending_a)
+            pairs.extend((None, j) for j in pending_b)
+        pending_a.clear()
+        pending_b.clear()
+
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            flush()
+            pairs.extend((i1 + k, j1 + k) for k in range(i2 - i1))
+        else:
+            pending_a.extend(range(i1, i2))
+            pending_b.extend(range(j1, j2))
+    flush()
+    return pairs
+
+
+def agreement_score(ocr1: NormalizedText, ocr2: NormalizedText,
+                    pairs: Optional[List[Tuple[Optional[int], Optional[int]]]] = None) -> float:
+    """Token-level agreement in [0, 1]: 2 * identical aligned tokens / total tokens."""
+    total = len(ocr1) + len(ocr2)
+    if total == 0:
+        return 1.0
+    if pairs is None:
+        pairs = align_tokens(ocr1, ocr2)
+    matched = sum(1 for i, j in pairs
+                  if i is not None and j is not None and ocr1.words[i] == ocr2.words[j])
+    return 2.0 * matched / total
+
+
+def compare_tokens(ocr1: NormalizedText, ocr2: NormalizedText,
+                   pairs: Optional[List[Tuple[Optional[int], Optional[int]]]] = None,
+                   ocr2_confidences: Optional[Sequence[float]] = None,
+                   low_confidence: Optional[float] = None) -> List[Dict]:
+    """Apply the comparison rules to the aligned tokens and return the flagged words.
+
+    Each entry has the shape expected by the report stage: word, index (position
+    in the OCR1 word array), ocr1, ocr2, rule_triggered and justification.
+    Omissions on either side and fuzzy-similar misspellings are ignored, except
+    that a fuzzy-similar pair is flagged when the Textract line it came from has
+    a confidence (0-100) below `low_confidence`, by default
+    `settings.LOW_CONFIDENCE_THRESHOLD`. With `ocr2_confidences` (one per OCR2
+    word, NaN when unknown) every entry also carries the Textract confidence.
+    """
+    if pairs is None:
+        pairs = align_tokens(ocr1, ocr2)
+    if low_confidence is None:
+        low_confidence = settings.LOW_CONFIDENCE_THRESHOLD
+
+    flagged_words = []
+    for i, j in pairs:
+        if i is None:
+            continue
+
+        word1 = ocr1.words[i]
+        word2 = ocr2.words[j] if j is not None else ""
+        original1 = ocr1.original(i)
+        original2 = ocr2.original(j) if j is not None else ""
+        confidence = ocr2_confidences[j] if ocr2_confidences is not None and j is not None else None
+        if confidence is not None and confidence != confidence:
+            confidence = None
+
+        entry = None
+        if is_alphanumeric_junk(word1):
+            entry = {
+                "word": original1,
+                "index": i,
+                "ocr1": original1,
+                "ocr2": original2,
+                "rule_triggered": RULE_ALPHANUMERIC,
+                "justification": "Word mixes letters and digits, which is typical of OCR misreads.",
+            }
+        elif j is not None and word1 != word2:
+            score = similarity(word1, word2)
+            if score < FUZZY_MATCH_THRESHOLD:
+                entry = {
+                    "word": original1,
+                    "index": i,
+                    "ocr1": original1,
+                    "ocr2": original2,
+                    "rule_triggered": RULE_MISMATCH,
+                    "justification": f"OCR outputs disagree (similarity {score:.2f}).",
+                }
+            elif confidence is not None and confidence < low_confidence:
+                entry = {
+                    "word": original1,
+                    "index": i,
+                    "ocr1": original1,
+                    "ocr2": original2,
+                    "rule_triggered": RULE_LOW_CONFIDENCE,
+                    "justification": f"OCR outputs nearly agree (similarity {score:.2f}) "
+                                     f"but Textract confidence is low ({confidence:.1f}).",
+                }
+
+        if entry is not None:
+            if confidence is not None:
+                entry["confidence"] = round(confidence, 1)
+            flagged_words.append(entry)
+
+    return flagged_words
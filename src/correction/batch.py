@@ -0,0 +1,170 @@
+"""Subject-level batch correction with bounded concurrency and resumable checkpoints.
+
+Every script in a batch runs through the correction pipeline on a pool limited
+to `max_in_flight` concurrent runs. The outcome of each script is written to a
+JSON checkpoint as soon as it finishes, so re-running the same batch skips the
+scripts that already succeeded. A batch runs in one place at a time: its
+runner holds an exclusive lock file next to the checkpoint, shared by every
+server worker and CLI run on the state directory.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import IO, Callable, Dict, List, Optional, Tuple
+
+from correction import settings
+
+logger = logging.getLogger(__name__)
+
+
+def batch_id_for(subject_id: str, script_ids: List[str]) -> str:
+    """Deterministic id for a batch, so re-submitting the same scripts resumes it."""
+    digest = hashlib.sha1(",".join(sorted(str(s) for s in script_ids)).encode("utf-8")).hexdigest()[:12]
+    return f"{subject_id}-{digest}"
+
+
+def checkpoint_path_for(batch_id: str) -> str:
+    return os.path.join(settings.STATE_DIR, "batches", f"{batch_id}.json")
+
+
+def lock_batch(batch_id: str) -> Optional[IO]:
+    """Take a batch's lock; returns the locked file, or None when the batch is already running."""
+    path = os.path.join(settings.STATE_DIR, "batches", f"{batch_id}.lock")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    f = open(path, "a+", encoding="utf-8")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return None
+    return f
+
+
+def unlock_batch(f: IO) -> None:
+    fcntl.flock(f, fcntl.LOCK_UN)
+    f.close()
+
+
+def load_checkpoint(path: str) -> Optional[Dict]:
+    """Read a batch checkpoint, or None if it does not exist or is unreadable."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Could not read batch checkpoint %s: %s", path, e)
+        return None
+
+
+class BatchCheckpoint:
+    """Per-script outcomes of a batch, persisted atomically after every update."""
+
+    def __init__(self, path: str, batch_id: str, subject_id: str, script_ids: List[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        existing = load_checkpoint(path) or {}
+        self.data = {
+            "batch_id": batch_id,
+            "subject_id": str(subject_id),
+            "script_ids": [str(s) for s in script_ids],
+            "status": "running",
+            "started_at": existing.get("started_at", time.time()),
+            "updated_at": time.time(),
+            "results": existing.get("results", {}),
+        }
+
+    def succeeded(self) -> set:
+        return {script_id for script_id, result in self.data["results"].items() if result.get("success")}
+
+    def record(self, script_id: str, success: bool, message: str, duration: float):
+        with self._lock:
+            self.data["results"][str(script_id)] = {
+                "success": success,
+                "message": message,
+                "duration_seconds": round(duration, 3),
+                "finished_at": time.time(),
+            }
+            self._write()
+
+    def finish(self) -> Dict:
+        with self._lock:
+            self.data["status"] = "finished"
+            self._write()
+            return summarize(self.data)
+
+    def _write(self):
+        self.data["updated_at"] = time.time()
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        # A temp name of its own, so no other writer can interleave with or replace this one
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f"{os.path.basename(self.path)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(self.data, f)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+
+def summarize(data: Dict) -> Dict:
+    """Counts plus per-script outcomes for a checkpoint."""
+    results = data.get("results", {})
+    succeeded = [s for s, r in results.items() if r.get("success")]
+    failed = [s for s, r in results.items() if not r.get("success")]
+    return {
+        "batch_id": data.get("batch_id"),
+        "subject_id": data.get("subject_id"),
+        "status": data.get("status"),
+        "total": len(data.get("script_ids", [])),
+        "succeeded": len(succeeded),
+        "failed": len(failed),
+        "pending": len(data.get("script_ids", [])) - len(results),
+        "failed_script_ids": failed,
+        "results": results,
+    }
+
+
+def run_batch(subject_id: str, script_ids: List[str], runner: Callable[[str, str], Tuple[bool, str]],
+              max_in_flight: int = 4, checkpoint_path: Optional[str] = None) -> Dict:
+    """Correct every script of a subject with at most `max_in_flight` concurrent runs.
+
+    Scripts that already succeeded in the checkpoint are skipped; failed ones are retried.
+    """
+    script_ids = list(dict.fromkeys(str(s) for s in script_ids))
+    batch_id = batch_id_for(subject_id, script_ids)
+    checkpoint = BatchCheckpoint(checkpoint_path or checkpoint_path_for(batch_id), batch_id, subject_id, script_ids)
+
+    done = checkpoint.succeeded()
+    todo = [script_id for script_id in script_ids if script_id not in done]
+    logger.info("Batch %s: %s scripts to run, %s already done, max_in_flight=%s",
+                batch_id, len(todo), len(done), max_in_flight)
+
+    def correct(script_id):
+        started = time.time()
+        try:
+            success, message = runner(subject_id, script_id)
+        except Exception as e:
+            success, message = False, f"Error: {str(e)}"
+        checkpoint.record(script_id, success, message, time.time() - started)
+        return script_id, success
+
+    with ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix="correction-batch") as pool:
+        futures = [pool.submit(correct, script_id) for script_id in todo]
+        for future in as_completed(futures):
+            script_id, success = future.result()
+            logger.info("Batch %s: script_id %s %s", batch_id, script_id, 'succeeded' if success else 'failed')
+
+    summary = checkpoint.finish()
+    logger.info("Batch %s finished: %s succeeded, %s failed", batch_id, summary['succeeded'], summary['failed'])
+    return summary
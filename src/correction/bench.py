@@ -0,0 +1,533 @@
+"""Offline throughput benchmark for the correction service.
+
+Runs the real pipeline against a local stub of the Django backend and a
+deterministic fake LLM, so the numbers measure the service's own overhead
+(fetch, extraction, comparison, crew orchestration, save) rather than the
+network or the model:
+
+    bench --pages 1,10,50 --concurrency 1,2,4,8 --requests 16 --llm-latency 0.2
+    bench --mode http ...      # drive the Flask routes of a served instance
+
+For every (pages, concurrency) cell it reports throughput, p50/p95/p99 of the
+end-to-end latency and of each pipeline stage, and the peak RSS of the process
+doing the work. The settings are read from the environment at import time, so
+this module points them at the stub before importing correction.main.
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+BENCH_SUBJECT_ID = "bench"
+
+# Syllables for pronounceable synthetic words
+_SYLLABLES = ("ka", "lo", "mi", "ter", "san", "vo", "rel", "pa", "dis", "on", "ex", "tion",
+              "ma", "ble", "cor", "ri", "ven", "su", "al", "gen", "ste", "ph", "na", "tor")
+
+# Typical OCR confusions used to garble words
+_LOOKALIKES = {"o": "0", "l": "1", "s": "5", "e": "3", "a": "@", "i": "l", "b": "6", "g": "9", "t": "f"}
+
+
+# ---
+# ### 📝 Synthetic Answer Sheets
+# ---
+def _vocabulary(size: int = 400, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 3))))
+    return sorted(words)
+
+
+VOCABULARY = _vocabulary()
+
+
+def _garble(word: str, rng: random.Random) -> str:
+    """One OCR-style misread: a lookalike character, a dropped letter or swapped neighbours."""
+    kind = rng.random()
+    positions = [i for i, ch in enumerate(word) if ch in _LOOKALIKES]
+    if kind < 0.5 and positions:
+        i = rng.choice(positions)
+        return word[:i] + _LOOKALIKES[word[i]] + word[i + 1:]
+    if kind < 0.75 and len(word) > 3:
+        i = rng.randrange(len(word))
+        return word[:i] + word[i + 1:]
+    if len(word) > 2:
+        i = rng.randrange(len(word) - 1)
+        return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+    return word + rng.choice("xz")
+
+
+def generate_combined_data(script_id: str, pages: int, seed: int = 0, lines_per_page: int = 28,
+                           words_per_line: int = 9, disagreement: float = 0.04,
+                           low_confidence: float = 0.05) -> Dict:
+    """A combined-data payload shaped like the backend's: ocr_json, textract_results and context.
+
+    Each OCR side misreads about `disagreement` of the words independently, and
+    about `low_confidence` of the Textract lines get a low confidence score.
+    """
+    rng = random.Random(f"{seed}:{script_id}:{pages}")
+    ocr_blocks = []
+    textract_results = []
+
+    for page_number in range(1, pages + 1):
+        lines = []
+        for _ in range(lines_per_page):
+            words = [rng.choice(VOCABULARY) for _ in range(words_per_line)]
+            ocr1 = [_garble(w, rng) if rng.random() < disagreement else w for w in words]
+            ocr2 = [_garble(w, rng) if rng.random() < disagreement else w for w in words]
+            low = rng.random() < low_confidence
+            confidence = round(rng.uniform(45.0, 79.0) if low else rng.uniform(90.0, 99.9), 2)
+            ocr_blocks.append({"BlockType": "LINE", "Text": " ".join(ocr1), "Confidence": confidence})
+            lines.append({"text": " ".join(ocr2), "confidence": confidence})
+
+        textract_results.append({
+            "page_number": page_number,
+            "extracted_text": {
+                "total_lines": len(lines),
+                "total_blocks": len(lines) * (words_per_line + 1),
+                "s3_key": f"bench/{script_id}/page-{page_number}.png",
+                "job_id": f"bench-{script_id}-{page_number}",
+                "extracted_lines": lines,
+            },
+            "confidence_score": round(sum(line["confidence"] for line in lines) / len(lines), 2),
+            "processing_status": "completed",
+        })
+
+    return {
+        "ocr_json": ocr_blocks,
+        "textract_results": textract_results,
+        "context": f"Synthetic answer sheet {script_id} ({pages} pages)",
+        "structured_json": None,
+    }
+
+
+# ---
+# ### 🧪 Stub Django Backend
+# ---
+class StubDjango:
+    """In-process HTTP stand-in for the transback endpoints the service calls."""
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.scripts: Dict[str, Dict] = {}
+        self.records: Dict[int, Dict] = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def add_script(self, script_id: str, payload: Dict):
+        self.scripts[str(script_id)] = payload
+
+    def start(self) -> "StubDjango":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-django", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this Nagle adds ~40ms per response
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass
+
+            def _reply(self, status: int, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _body(self) -> Dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+            def _route(self):
+                with stub._lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+                parsed = urlparse(self.path)
+                parts = [part for part in parsed.path.split("/") if part]
+                return parts, {key: values[0] for key, values in parse_qs(parsed.query).items()}
+
+            def do_GET(self):
+                parts, query = self._route()
+                if not parts:
+                    return self._reply(200, {"status": "ok"})
+                if parts == ["combined-data"]:
+                    payload = stub.scripts.get(query.get("script_id", ""))
+                    return self._reply(200, payload) if payload else self._reply(404, {"detail": "Not found."})
+                if parts[0] == "compare-text":
+                    with stub._lock:
+                        if len(parts) == 2:
+                            record = stub.records.get(int(parts[1])) if parts[1].isdigit() else None
+                            return self._reply(200, record) if record else self._reply(404, {"detail": "Not found."})
+                        script_id = query.get("script_id")
+                        matches = [record for record in stub.records.values()
+                                   if script_id is None or str(record["script_id"]) == script_id]
+                    return self._reply(200, matches)
+                return self._reply(404, {"detail": "Not found."})
+
+            def do_POST(self):
+                parts, _ = self._route()
+                if parts != ["compare-text"]:
+                    return self._reply(404, {"detail": "Not found."})
+                body = self._body()
+                with stub._lock:
+                    record = dict(body, compare_text_id=len(stub.records) + 1)
+                    stub.records[record["compare_text_id"]] = record
+                return self._reply(201, record)
+
+            def do_PUT(self):
+                parts, _ = self._route()
+                if len(parts) != 2 or parts[0] != "compare-text" or not parts[1].isdigit():
+                    return self._reply(404, {"detail": "Not found."})
+                body = self._body()
+                with stub._lock:
+                    record = stub.records.get(int(parts[1]))
+                    if record is None:
+                        return self._reply(404, {"detail": "Not found."})
+                    record.update(body)
+                    record = dict(record)
+                return self._reply(200, record)
+
+        return Handler
+
+
+# ---
+# ### 🤖 Fake LLM
+# ---
+def make_fake_llm(latency: float = 0.2, latency_per_1k_tokens: float = 0.0):
+    """A deterministic stand-in LLM: fixed (plus per-prompt-size) latency and a canned JSON answer.
+
+    Token usage (prompt length / 4) is reported through crewAI's token
+    callbacks so per-agent token metrics work.
+    """
+    from crewai.llms.base_llm import BaseLLM
+
+    class FakeLLM(BaseLLM):
+        def __init__(self):
+            super().__init__(model="fake-llm", temperature=0)
+            self.calls = 0
+
+        def call(self, messages, tools=None, callbacks=None, available_functions=None,
+                 from_task=None, from_agent=None):
+            if isinstance(messages, str):
+                prompt = messages
+            else:
+                prompt = "\n".join(str(message.get("content", "")) for message in messages)
+            prompt_tokens = max(1, len(prompt) // 4)
+            # Valid for both the report and the final output schema (no corrections)
+            answer = json.dumps({"flagged": [], "patches": {}})
+            response = f"Thought: I now know the final answer\nFinal Answer: {answer}"
+
+            time.sleep(latency + latency_per_1k_tokens * prompt_tokens / 1000.0)
+            self.calls += 1
+            for callback in callbacks or []:
+                token_process = getattr(callback, "token_cost_process", None)
+                if token_process is not None:
+                    token_process.sum_prompt_tokens(prompt_tokens)
+                    token_process.sum_completion_tokens(max(1, len(response) // 4))
+                    token_process.sum_successful_requests(1)
+            return response
+
+        def supports_function_calling(self) -> bool:
+            return False
+
+    return FakeLLM()
+
+
+# ---
+# ### 📈 Measurement Helpers
+# ---
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of `values` (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(pct / 100.0 * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+def rss_bytes(pid: Optional[int] = None) -> int:
+    """Current resident set size of a process (Linux /proc; 0 elsewhere)."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class RssSampler:
+    """Track the peak RSS of a process while a benchmark cell runs."""
+
+    def __init__(self, pid: Optional[int] = None, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, rss_bytes(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, rss_bytes(self.pid))
+
+
+def summarize_cell(samples: List[Dict], wall_seconds: float, peak_rss: int) -> Dict:
+    """Throughput, latency percentiles (total and per stage) and peak RSS for one cell."""
+    succeeded = [sample for sample in samples if sample["success"]]
+    stages: Dict[str, List[float]] = {}
+    for sample in succeeded:
+        for stage, seconds in sample["timings"].items():
+            stages.setdefault(stage, []).append(seconds)
+
+    def quantiles(values):
+        return {f"p{pct}": percentile(values, pct) for pct in (50, 95, 99)}
+
+    return {
+        "requests": len(samples),
+        "errors": len(samples) - len(succeeded),
+        "throughput_rps": len(samples) / wall_seconds if wall_seconds else None,
+        "latency": quantiles([sample["seconds"] for sample in succeeded]),
+        "stages": {stage: quantiles(values) for stage, values in sorted(stages.items())},
+        "peak_rss_mb": round(peak_rss / (1024 * 1024), 1),
+    }
+
+
+def stage_name(timing_key: str) -> str:
+    """'correction_django_fetch_seconds' -> 'django_fetch'."""
+    name = timing_key.split(":", 1)[0]
+    if name.startswith("correction_"):
+        name = name[len("correction_"):]
+    if name.endswith("_seconds"):
+        name = name[:-len("_seconds")]
+    return name
+
+
+# ---
+# ### 🏃 Drivers
+# ---
+def run_pipeline_cell(script_ids: List[str], concurrency: int) -> Dict:
+    """Call run_ocr_correction directly from `concurrency` threads."""
+    from correction.jobs import Job
+    from correction.main import run_ocr_correction
+
+    def one(script_id):
+        job = Job(BENCH_SUBJECT_ID, script_id)
+        started = time.perf_counter()
+        success, message = run_ocr_correction(BENCH_SUBJECT_ID, script_id, job=job)
+        return {
+            "success": success,
+            "message": message,
+            "seconds": time.perf_counter() - started,
+            "timings": {stage_name(key): value for key, value in job.details.get("timings", {}).items()},
+        }
+
+    with RssSampler() as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+            samples = list(pool.map(one, script_ids))
+        wall = time.perf_counter() - started
+    return summarize_cell(samples, wall, sampler.peak)
+
+
+def run_http_cell(base_url: str, server_pid: int, script_ids: List[str], concurrency: int) -> Dict:
+    """POST the synchronous correct_ocr route from `concurrency` threads and read stage timings from the job."""
+    import requests
+
+    local = threading.local()
+
+    def one(script_id):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        response = session.post(f"{base_url}/correction/correct_ocr/{BENCH_SUBJECT_ID}/{script_id}", timeout=600)
+        seconds = time.perf_counter() - started
+        body = response.json() if response.content else {}
+        timings = {}
+        if body.get("job_id"):
+            job = session.get(f"{base_url}/correction/jobs/{body['job_id']}", timeout=30).json()
+            timings = {stage_name(key): value for key, value in job.get("details", {}).get("timings", {}).items()}
+        return {"success": response.status_code == 200, "message": body.get("message"),
+                "seconds": seconds, "timings": timings}
+
+    with RssSampler(pid=server_pid) as sampler:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="bench") as pool:
+            samples = list(pool.map(one, script_ids))
+        wall = time.perf_counter() - started
+    return summarize_cell(samples, wall, sampler.peak)
+
+
+def start_http_server(port: int, django_url: str, args) -> subprocess.Popen:
+    """Serve the app (with the fake LLM) in a child process and wait until it answers."""
+    import requests
+
+    env = dict(os.environ, PORT=str(port), DJANGO_API_BASE_URL=django_url)
+    command = [sys.executable, "-m", "correction.bench", "serve",
+               "--llm-latency", str(args.llm_latency), "--llm-latency-per-1k", str(args.llm_latency_per_1k)]
+    process = subprocess.Popen(command, env=env)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Benchmark server exited with code {process.returncode}")
+        try:
+            if requests.get(f"http://127.0.0.1:{port}/", timeout=1).status_code == 200:
+                return process
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError("Benchmark server did not start within 120s")
+
+
+# ---
+# ### 📋 Reporting
+# ---
+def _ms(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.1f}"
+
+
+def format_report(results: List[Dict]) -> str:
+    lines = []
+    for cell in results:
+        summary = cell["summary"]
+        lines.append(
+            f"pages={cell['pages']:<3} concurrency={cell['concurrency']:<3} "
+            f"requests={summary['requests']:<4} errors={summary['errors']:<3} "
+            f"throughput={summary['throughput_rps'] or 0:.2f} req/s  peak_rss={summary['peak_rss_mb']} MB"
+        )
+        rows = [("total", summary["latency"])] + list(summary["stages"].items())
+        for name, quantiles in rows:
+            lines.append(f"    {name:<20} p50={_ms(quantiles['p50']):>9} ms  "
+                         f"p95={_ms(quantiles['p95']):>9} ms  p99={_ms(quantiles['p99']):>9} ms")
+    return "\n".join(lines)
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(part) for part in value.split(",") if part.strip()]
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="bench", description="Offline throughput benchmark with stubbed Django and LLM")
+    parser.add_argument("command", nargs="?", default="run", choices=("run", "serve"),
+                        help="run the benchmark (default) or serve the app with the fake LLM")
+    parser.add_argument("--mode", choices=("pipeline", "http"), default="pipeline")
+    parser.add_argument("--pages", type=_int_list, default=[1, 10, 50], help="comma-separated page counts (1-50)")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 2, 4, 8], help="comma-separated levels")
+    parser.add_argument("--requests", type=int, default=16, help="requests per (pages, concurrency) cell")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--llm-latency-per-1k", type=float, default=0.0, help="extra seconds per 1k prompt tokens")
+    parser.add_argument("--django-latency", type=float, default=0.005, help="seconds per stub Django request")
+    parser.add_argument("--disagreement", type=float, default=0.04, help="per-word misread rate on each OCR side")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=5099, help="app port in http mode")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", dest="json_path", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def serve(args):
+    """Child process of http mode: the normal app, with every agent on the fake LLM."""
+    from correction.crew import set_llm
+    set_llm(make_fake_llm(args.llm_latency, args.llm_latency_per_1k))
+    from correction.main import run
+    run()
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+
+    # Settings are read at import time: configure them before importing the service
+    state_dir = tempfile.mkdtemp(prefix="correction-bench-")
+    os.environ.setdefault("CORRECTION_STATE_DIR", state_dir)
+    os.environ.setdefault("CORRECTION_RESULT_CACHE", "0")
+    os.environ.setdefault("CORRECTION_LOG_LEVEL", args.log_level)
+    os.environ.setdefault("OPENAI_API_KEY", "bench-not-used")
+
+    if args.command == "serve":
+        return serve(args)
+
+    stub = StubDjango(latency=args.django_latency).start()
+    os.environ["DJANGO_API_BASE_URL"] = stub.url
+
+    server = None
+    if args.mode == "http":
+        server = start_http_server(args.port, stub.url, args)
+    else:
+        from correction.crew import set_llm
+        set_llm(make_fake_llm(args.llm_latency, args.llm_latency_per_1k))
+
+    results = []
+    try:
+        for pages in args.pages:
+            pages = max(1, min(50, pages))
+            script_ids = []
+            for n in range(args.requests):
+                script_id = f"{pages}{n:04d}"
+                stub.add_script(script_id, generate_combined_data(
+                    script_id, pages, seed=args.seed, disagreement=args.disagreement))
+                script_ids.append(script_id)
+
+            for concurrency in args.concurrency:
+                if server is not None:
+                    summary = run_http_cell(f"http://127.0.0.1:{args.port}", server.pid, script_ids, concurrency)
+                else:
+                    summary = run_pipeline_cell(script_ids, concurrency)
+                cell = {"mode": args.mode, "pages": pages, "concurrency": concurrency, "summary": summary}
+                results.append(cell)
+                print(format_report([cell]), flush=True)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        stub.stop()
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""Record/replay cassettes of the Django and LLM traffic of a correction run.
+
+With CORRECTION_CASSETTE_MODE=record every Django request made through
+DjangoClient and every LLM completion made by the crew while a script is being
+corrected is written to a gzipped JSON cassette named after its script_id.
+With CORRECTION_CASSETTE_MODE=replay the same calls are answered from the
+cassette instead of the network, either with the recorded latency
+(CORRECTION_CASSETTE_TIMING=original) or immediately (zero), so pipeline
+changes can be compared on exactly the same inputs offline.
+
+Django interactions are matched by method and URL (relative to the API base)
+in recorded order. LLM completions are replayed in recorded order per track
+(the main crew run, or one track per chunk), and a prompt that no longer
+matches the recording is logged but still answered.
+"""
+import contextvars
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+from correction import settings
+
+logger = logging.getLogger(__name__)
+
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+
+CASSETTE_FORMAT_VERSION = 1
+
+MAIN_TRACK = "main"
+
+_current: contextvars.ContextVar = contextvars.ContextVar("correction_cassette", default=None)
+_track: contextvars.ContextVar = contextvars.ContextVar("correction_cassette_track", default=MAIN_TRACK)
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """Raised in replay mode when a call has no recorded counterpart."""
+
+
+def relative_url(url: str) -> str:
+    """Path and query of `url`, so cassettes work against any API base URL."""
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+def prompt_digest(messages) -> str:
+    text = messages if isinstance(messages, str) else json.dumps(messages, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def cassette_path(script_id: str, directory: Optional[str] = None) -> str:
+    safe = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in str(script_id))
+    return os.path.join(directory or settings.CASSETTE_DIR, f"{safe}.json.gz")
+
+
+class Cassette:
+    """Recorded interactions of one script."""
+
+    def __init__(self, script_id: str, mode: str, timing: str = "original", data: Optional[Dict] = None):
+        self.script_id = str(script_id)
+        self.mode = mode
+        self.timing = timing
+        data = data or {}
+        self.index_entry = data.get("index_entry")
+        self.http: List[Dict] = data.get("http", [])
+        self.llm: Dict[str, List[Dict]] = data.get("llm", {})
+        self._lock = threading.Lock()
+
+        # Replay queues: Django by (method, url), LLM by track
+        self._http_queues: Dict[tuple, deque] = defaultdict(deque)
+        for interaction in self.http:
+            self._http_queues[(interaction["method"], interaction["url"])].append(interaction)
+        self._llm_queues = {track: deque(calls) for track, calls in self.llm.items()}
+
+    @classmethod
+    def load(cls, script_id: str, timing: str = "original", directory: Optional[str] = None) -> "Cassette":
+        path = cassette_path(script_id, directory)
+        if not os.path.exists(path):
+            raise CassetteMiss(f"No cassette recorded for script_id {script_id} ({path})")
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            return cls(script_id, REPLAY, timing, json.load(f))
+
+    def save(self, directory: Optional[str] = None) -> str:
+        path = cassette_path(self.script_id, directory)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = {
+            "version": CASSETTE_FORMAT_VERSION,
+            "script_id": self.script_id,
+            "recorded_at": time.time(),
+            "index_entry": self.index_entry,
+            "http": self.http,
+            "llm": self.llm,
+        }
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+        return path
+
+    def _wait(self, seconds: float):
+        if self.timing == "original" and seconds > 0:
+            time.sleep(seconds)
+
+    # Django traffic
+
+    def record_http(self, method: str, url: str, request_json, response: Optional[requests.Response],
+                    elapsed: float, error: Optional[Exception] = None):
+        interaction = {"method": method, "url": relative_url(url), "elapsed": round(elapsed, 6)}
+        if request_json is not None:
+            interaction["request_json"] = request_json
+        if error is not None:
+            interaction["error"] = f"{type(error).__name__}: {error}"
+        else:
+            interaction["status"] = response.status_code
+            interaction["content_type"] = response.headers.get("Content-Type", "")
+            interaction["body"] = response.text
+        with self._lock:
+            self.http.append(interaction)
+
+    def replay_http(self, method: str, url: str) -> requests.Response:
+        key = (method, relative_url(url))
+        with self._lock:
+            queue = self._http_queues.get(key)
+            interaction = queue.popleft() if queue else None
+        if interaction is None:
+            raise CassetteMiss(f"No recorded {method} {key[1]} left for script_id {self.script_id}")
+
+        self._wait(interaction.get("elapsed", 0))
+        if "error" in interaction:
+            raise requests.exceptions.ConnectionError(f"Replayed error: {interaction['error']}")
+
+        response = requests.Response()
+        response.status_code = interaction["status"]
+        response._content = interaction["body"].encode("utf-8")
+        response.encoding = "utf-8"
+        response.headers["Content-Type"] = interaction.get("content_type", "")
+        response.url = url
+        return response
+
+    # LLM traffic
+
+    def record_llm(self, messages, response, elapsed: float, usage: Dict):
+        call = {"prompt": prompt_digest(messages), "response": response, "elapsed": round(elapsed, 6)}
+        if usage:
+            call["usage"] = usage
+        with self._lock:
+            self.llm.setdefault(_track.get(), []).append(call)
+
+    def replay_llm(self, messages) -> Dict:
+        track = _track.get()
+        with self._lock:
+            queue = self._llm_queues.get(track)
+            call = queue.popleft() if queue else None
+        if call is None:
+            raise CassetteMiss(f"No recorded LLM call left on track '{track}' for script_id {self.script_id}")
+        if call["prompt"] != prompt_digest(messages):
+            logger.info("Replayed LLM call on track '%s' for script_id %s has a different prompt",
+                        track, self.script_id)
+        self._wait(call.get("elapsed", 0))
+        return call
+
+
+def mode() -> str:
+    return settings.CASSETTE_MODE if settings.CASSETTE_MODE in (RECORD, REPLAY) else OFF
+
+
+def current() -> Optional[Cassette]:
+    """Cassette of the script being corrected in this context, if any."""
+    return _current.get()
+
+
+@contextmanager
+def use_cassette(script_id: str):
+    """Record or replay the traffic of one script's correction (no-op when cassettes are off)."""
+    active_mode = mode()
+    if active_mode == OFF:
+        yield None
+        return
+
+    from correction.script_index import get_script_index
+    script_index = get_script_index()
+
+    if active_mode == RECORD:
+        cassette = Cassette(script_id, RECORD)
+        cassette.index_entry = script_index.get(script_id)
+    else:
+        cassette = Cassette.load(script_id, settings.CASSETTE_TIMING)
+        # Start from the index state of the recording so the same Django calls are made
+        if cassette.index_entry:
+            script_index.put(script_id, cassette.index_entry)
+        else:
+            script_index.delete(script_id)
+
+    token = _current.set(cassette)
+    try:
+        yield cassette
+    finally:
+        _current.reset(token)
+        if active_mode == RECORD:
+            path = cassette.save()
+            logger.info("Recorded %s Django and %s LLM calls to %s",
+                        len(cassette.http), sum(len(calls) for calls in cassette.llm.values()), path)
+
+
+@contextmanager
+def track(name: str):
+    """Name the LLM call sequence of the current thread (e.g. one per chunk)."""
+    token = _track.set(name)
+    try:
+        yield
+    finally:
+        _track.reset(token)
+
+
+def _token_processes(callbacks) -> list:
+    return [callback.token_cost_process for callback in callbacks or []
+            if getattr(callback, "token_cost_process", None) is not None]
+
+
+def wrap_llm(inner=None):
+    """An LLM that records/replays through the current cassette around `inner`.
+
+    `inner` defaults to the model crewAI would pick from the environment; in
+    replay mode it is only used for calls made outside a cassette.
+    """
+    from crewai.llms.base_llm import BaseLLM
+    from crewai.utilities.llm_utils import create_llm
+
+    if inner is None and mode() == RECORD:
+        inner = create_llm(None)
+
+    class CassetteLLM(BaseLLM):
+        def __init__(self):
+            super().__init__(model=getattr(inner, "model", "cassette"),
+                             temperature=getattr(inner, "temperature", None),
+                             stop=list(getattr(inner, "stop", None) or []))
+            self.inner = inner
+
+        def call(self, messages, tools=None, callbacks=None, available_functions=None,
+                 from_task=None, from_agent=None):
+            cassette = current()
+            if cassette is not None and cassette.mode == REPLAY:
+                recorded = cassette.replay_llm(messages)
+                usage = recorded.get("usage") or {}
+                for token_process in _token_processes(callbacks):
+                    token_process.sum_prompt_tokens(usage.get("prompt_tokens", 0))
+                    token_process.sum_completion_tokens(usage.get("completion_tokens", 0))
+                    token_process.sum_successful_requests(1)
+                return recorded["response"]
+
+            if self.inner is None:
+                raise CassetteMiss("No LLM configured outside a replayed cassette")
+
+            processes = _token_processes(callbacks)
+            before = [(p.prompt_tokens, p.completion_tokens) for p in processes]
+            started = time.perf_counter()
+            response = self.inner.call(messages, tools=tools, callbacks=callbacks,
+                                       available_functions=available_functions,
+                                       from_task=from_task, from_agent=from_agent)
+            if cassette is not None:
+                usage = {}
+                if processes:
+                    usage = {"prompt_tokens": processes[0].prompt_tokens - before[0][0],
+                             "completion_tokens": processes[0].completion_tokens - before[0][1]}
+                cassette.record_llm(messages, response, time.perf_counter() - started, usage)
+            return response
+
+        def supports_function_calling(self) -> bool:
+            return False
+
+        def supports_stop_words(self) -> bool:
+            return self.inner.supports_stop_words() if self.inner is not None else True
+
+        def get_context_window_size(self) -> int:
+            return self.inner.get_context_window_size() if self.inner is not None else super().get_context_window_size()
+
+    return CassetteLLM()
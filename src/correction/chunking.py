@@ -0,0 +1,118 @@
+"""Split long answer scripts into chunks that can be corrected independently.
+
+Chunk boundaries come from the Textract page structure ("pages" mode) or from
+section markers such as "section ii" in the OCR1 text ("sections" mode). The
+boundaries found on one OCR side are carried over to the other side through
+the token alignment, and each chunk is an exact slice of the original texts so
+the corrected chunks can be stitched back together in order.
+"""
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+from correction.alignment import align_tokens
+from correction.normalize import NormalizedText, normalize_text
+
+CHUNK_MODES = ("off", "pages", "sections")
+
+_SECTION_NUMBER_RE = re.compile(r"^([ivxlcdm]+|\d+|[a-h])$")
+
+
+@dataclass
+class Chunk:
+    """One slice of the script: OCR1 and OCR2 text for the same region."""
+    index: int
+    ocr1: str
+    ocr2: str
+
+
+def _first_token_at(normalized: NormalizedText, char_offset: int) -> int:
+    """Index of the first token starting at or after `char_offset`."""
+    for index, (start, _) in enumerate(normalized.offsets):
+        if start >= char_offset:
+            return index
+    return len(normalized)
+
+
+def section_boundaries(normalized: NormalizedText) -> List[int]:
+    """Token indices where a 'section <number>' marker starts (excluding the script start)."""
+    words = normalized.words
+    return [
+        index for index in range(1, len(words) - 1)
+        if words[index] == "section" and _SECTION_NUMBER_RE.match(words[index + 1])
+    ]
+
+
+def _map_boundaries(pairs: Sequence[Tuple[Optional[int], Optional[int]]], boundaries: List[int],
+                    from_side: int, target_length: int) -> List[int]:
+    """Carry token boundaries from one side of the alignment to the other."""
+    to_side = 1 - from_side
+    mapped = []
+    for boundary in boundaries:
+        target = target_length
+        for pair in pairs:
+            if pair[from_side] is not None and pair[from_side] >= boundary and pair[to_side] is not None:
+                target = pair[to_side]
+                break
+        mapped.append(target)
+    return mapped
+
+
+def _slices(normalized: NormalizedText, boundaries: List[int]) -> List[str]:
+    """Cut the source text at the start offsets of the given token indices.
+
+    The slices are not stripped: joined back together they give the source text
+    byte for byte, separators (line and page breaks) included.
+    """
+    cuts = [0]
+    for boundary in boundaries:
+        cuts.append(normalized.offsets[boundary][0] if boundary < len(normalized) else len(normalized.source))
+    cuts.append(len(normalized.source))
+    return [normalized.source[start:end] for start, end in zip(cuts, cuts[1:])]
+
+
+def plan_chunks(ocr_text: str, textract_page_texts: List[str], mode: str, chunk_size: int) -> List[Chunk]:
+    """Split both OCR texts into aligned chunks of `chunk_size` pages or sections.
+
+    Returns a single chunk when the script is too short to split.
+    """
+    textract_text = " ".join(text for text in textract_page_texts if text)
+    if mode not in ("pages", "sections") or chunk_size < 1:
+        return [Chunk(0, ocr_text, textract_text)]
+
+    ocr1 = normalize_text(ocr_text)
+    ocr2 = normalize_text(textract_text)
+
+    if mode == "pages":
+        # Token index where each page starts in the joined Textract text
+        page_starts, offset = [], 0
+        for text in textract_page_texts:
+            if not text:
+                continue
+            page_starts.append(_first_token_at(ocr2, offset))
+            offset += len(text) + 1
+        ocr2_bounds = page_starts[chunk_size::chunk_size]
+        from_side, source_bounds = 1, ocr2_bounds
+    else:
+        ocr1_bounds = section_boundaries(ocr1)[chunk_size - 1::chunk_size]
+        from_side, source_bounds = 0, ocr1_bounds
+
+    if not source_bounds:
+        return [Chunk(0, ocr_text, textract_text)]
+
+    pairs = align_tokens(ocr1, ocr2)
+    if from_side == 1:
+        ocr1_bounds = _map_boundaries(pairs, source_bounds, 1, len(ocr1))
+    else:
+        ocr2_bounds = _map_boundaries(pairs, source_bounds, 0, len(ocr2))
+
+    # Keep only strictly increasing boundary pairs so every chunk is non-empty on the OCR1 side
+    kept1, kept2 = [], []
+    for b1, b2 in zip(ocr1_bounds, ocr2_bounds):
+        if (not kept1 or b1 > kept1[-1]) and 0 < b1 < len(ocr1) and (not kept2 or b2 >= kept2[-1]):
+            kept1.append(b1)
+            kept2.append(b2)
+
+    ocr1_parts = _slices(ocr1, kept1)
+    ocr2_parts = _slices(ocr2, kept2)
+    return [Chunk(index, part1, part2) for index, (part1, part2) in enumerate(zip(ocr1_parts, ocr2_parts))]
@@ -122,14 +122,33 @@
 #         )
 
 
+import json
+import logging
+import threading
+import time
 from crewai import Agent, Crew, Process, Task
 from crewai.project import CrewBase, agent, crew, task
 from crewai.agents.agent_builder.base_agent import BaseAgent
-from typing import List
+from typing import Dict, List, Optional
+from correction import cassettes, metrics, settings
+from correction.outputs import CorrectionPatches, CorrectionReport, output_guardrail, parse_json_output
+
+logger = logging.getLogger(__name__)
 # If you want to run a snippet of code before or after the crew starts,
 # you can use the @before_kickoff and @after_kickoff decorators
 # https://docs.crewai.com/concepts/crews#example-crew-class-with-decorators
 
+# LLM used by every agent instead of the configured model (see set_llm)
+_llm_override = None
+
+
+def agent_overrides() -> dict:
+    """Extra Agent kwargs applied to every agent: the LLM override, wrapped for cassettes when enabled."""
+    if cassettes.mode() != cassettes.OFF:
+        return {"llm": cassettes.wrap_llm(_llm_override)}
+    return {"llm": _llm_override} if _llm_override is not None else {}
+
+
 @CrewBase
 class Correction():
     """OcrCorrection crew"""
@@ -143,39 +162,44 @@ class Correction():
     
     # If you would like to add tools to your agents, you can learn more about it here:
     # https://docs.crewai.com/concepts/agents#agent-tools
-    @agent
-    def parser_agent(self) -> Agent:
-        return Agent(
-            config=self.agents_config['parser_agent'], # type: ignore[index]
-            verbose=True
-        )
+    # Parsing is done locally by correction.normalize before kickoff
+    # @agent
+    # def parser_agent(self) -> Agent:
+    #     return Agent(
+    #         config=self.agents_config['parser_agent'], # type: ignore[index]
+    #         verbose=True
+    #     )
 
-    @agent
-    def comparison_agent(self) -> Agent:
-        return Agent(
-            config=self.agents_config['comparison_agent'], # type: ignore[index]
-            verbose=True
-        )
+    # Comparison is done locally by correction.alignment before kickoff
+    # @agent
+    # def comparison_agent(self) -> Agent:
+    #     return Agent(
+    #         config=self.agents_config['comparison_agent'], # type: ignore[index]
+    #         verbose=True
+    #     )
         
     @agent
     def logger_agent(self) -> Agent:
         return Agent(
             config=self.agents_config['logger_agent'], # type: ignore[index]
-            verbose=True
+            verbose=settings.CREW_VERBOSE,
+            **agent_overrides()
         )
         
     @agent
     def report_agent(self) -> Agent:
         return Agent(
             config=self.agents_config['report_agent'], # type: ignore[index]final_corrector_agent
-            verbose=True
+            verbose=settings.CREW_VERBOSE,
+            **agent_overrides()
         )
 
     @agent
     def final_corrector_agent(self) -> Agent:
         return Agent(
             config=self.agents_config['final_corrector_agent'], # type: ignore[index]final_corrector_agent
-            verbose=True
+            verbose=settings.CREW_VERBOSE,
+            **agent_overrides()
         )
 
     # @agent
@@ -189,38 +213,43 @@ class Correction():
     # To learn more about structured task outputs,
     # task dependencies, and task callbacks, check out the documentation:
     # https://docs.crewai.com/concepts/tasks#overview-of-a-task
-    @task
-    def ocr_parser_task(self) -> Task:
-        return Task(
-            config=self.tasks_config['ocr_parser_task'], # type: ignore[index]
-        )
+    # Parsing is done locally by correction.normalize before kickoff
+    # @task
+    # def ocr_parser_task(self) -> Task:
+    #     return Task(
+    #         config=self.tasks_config['ocr_parser_task'], # type: ignore[index]
+    #     )
 
-    @task
-    def ocr_comparison_task(self) -> Task:
-        return Task(
-            config=self.tasks_config['ocr_comparison_task'], # type: ignore[index]
-            output_file='report.md'
-        )
+    # Comparison is done locally by correction.alignment before kickoff
+    # @task
+    # def ocr_comparison_task(self) -> Task:
+    #     return Task(
+    #         config=self.tasks_config['ocr_comparison_task'], # type: ignore[index]
+    #         output_file='report.md'
+    #     )
     
+    # No output_file: concurrent runs would all write the same file; outputs are read from the result
     @task
     def ocr_logging_task(self) -> Task:
         return Task(
             config=self.tasks_config['ocr_logging_task'], # type: ignore[index]
-            output_file='report.md'
         )
     
+    # Outputs failing their schema send only that task back to its agent
     @task
     def ocr_report_task(self) -> Task:
         return Task(
             config=self.tasks_config['ocr_report_task'], # type: ignore[index]
-            output_file='report.md'
+            guardrail=output_guardrail(CorrectionReport),
+            guardrail_max_retries=settings.OUTPUT_MAX_RETRIES
         )
 
     @task
     def final_output_task(self) -> Task:
         return Task(
             config=self.tasks_config['final_output_task'], # type: ignore[index]
-            output_file='report.md'
+            guardrail=output_guardrail(CorrectionPatches),
+            guardrail_max_retries=settings.OUTPUT_MAX_RETRIES
         )
 
     # @task
@@ -241,6 +270,187 @@ class Correction():
             agents=self.agents, # Automatically created by the @agent decorator
             tasks=self.tasks, # Automatically created by the @task decorator
             process=Process.sequential,
-            verbose=True,
+            verbose=settings.CREW_VERBOSE,
             # process=Process.hierarchical, # In case you wanna use that instead https://docs.crewai.com/how-to/Hierarchical/
-        )
\ No newline at end of file
+        )
+
+
+# ---
+# Reusable crew template
+# ---
+# Building Correction() re-reads both YAML configs and constructs every Agent and
+# Task, so it is done once per process; each run gets a cheap copy of the template.
+_template = None
+_template_lock = threading.Lock()
+_startup_stats = {}
+_agent_names: List[str] = []
+# Upstream outputs each task consumes: {task: {upstream_task: [fields] or None for the whole output}}
+_task_upstream: Dict[str, Dict[str, Optional[List[str]]]] = {}
+
+
+def validate_crew(crew: Crew) -> None:
+    """Fail fast on configs that would only break at kickoff time."""
+    if not crew.tasks:
+        raise ValueError("Crew config defines no tasks")
+    for crew_task in crew.tasks:
+        if crew_task.agent is None:
+            raise ValueError(f"Task '{crew_task.name}' has no agent")
+        if not crew_task.description or not crew_task.expected_output:
+            raise ValueError(f"Task '{crew_task.name}' needs a description and expected_output")
+
+
+def _upstream_config(builder: "Correction", template: Crew) -> Dict[str, Dict[str, Optional[List[str]]]]:
+    """Read the `upstream` declarations of tasks.yaml, checking they only name earlier tasks."""
+    upstream, earlier = {}, set()
+    for crew_task in template.tasks:
+        declared = builder.tasks_config.get(crew_task.name, {}).get("upstream") or {}
+        for upstream_name in declared:
+            if upstream_name not in earlier:
+                raise ValueError(f"Task '{crew_task.name}' consumes '{upstream_name}', which does not run before it")
+        if declared and "{upstream}" not in crew_task.description:
+            raise ValueError(f"Task '{crew_task.name}' declares upstream outputs but has no {{upstream}} placeholder")
+        upstream[crew_task.name] = {name: list(fields) if fields else None for name, fields in declared.items()}
+        earlier.add(crew_task.name)
+    return upstream
+
+
+def _config_names(builder: "Correction", template: Crew) -> List[str]:
+    """Match each built agent back to its agents.yaml key by role (roles are unique)."""
+    roles = {str(config.get("role", "")).strip(): name for name, config in builder.agents_config.items()}
+    return [roles.get(str(crew_agent.role).strip(), f"agent_{index}")
+            for index, crew_agent in enumerate(template.agents)]
+
+
+def get_crew_template() -> Crew:
+    """Return the process-wide crew template, building and validating it on first use."""
+    global _template
+    if _template is None:
+        with _template_lock:
+            if _template is None:
+                started = time.perf_counter()
+                builder = Correction()
+                template = builder.crew()
+                validate_crew(template)
+                # Tasks get only their declared upstream outputs (see run_tasks), not every earlier one
+                for crew_task in template.tasks:
+                    crew_task.context = []
+                _agent_names[:] = _config_names(builder, template)
+                _task_upstream.clear()
+                _task_upstream.update(_upstream_config(builder, template))
+                build_seconds = time.perf_counter() - started
+
+                _startup_stats.update({
+                    "template_build_seconds": build_seconds,
+                    "built_at": time.time(),
+                    "agents": len(template.agents),
+                    "tasks": len(template.tasks),
+                })
+                metrics.set_gauge("correction_crew_template_build_seconds", build_seconds)
+                logger.info("Crew template built in %.3fs (%s agents, %s tasks)",
+                            build_seconds, len(template.agents), len(template.tasks))
+                _template = template
+    return _template
+
+
+def set_llm(llm) -> None:
+    """Run every agent on `llm` (e.g. a stub LLM for benchmarks; None restores the config).
+
+    The crew template is rebuilt on next use so new copies pick the change up.
+    """
+    global _llm_override, _template
+    with _template_lock:
+        _llm_override = llm
+        _template = None
+
+
+def new_crew() -> Crew:
+    """A per-run copy of the crew template, ready for kickoff with its own inputs."""
+    started = time.perf_counter()
+    run_crew = get_crew_template().copy()
+    metrics.inc_counter("correction_crew_copy_seconds_total", time.perf_counter() - started)
+    metrics.inc_counter("correction_crew_copies_total")
+    return run_crew
+
+
+def crew_startup_stats() -> dict:
+    return dict(_startup_stats)
+
+
+
+def agent_names() -> List[str]:
+    """agents.yaml key of each template agent, in crew order (copies keep the same order)."""
+    return list(_agent_names)
+
+
+def agent_token_usage(run_crew: Crew) -> dict:
+    """Prompt/completion tokens spent by each agent of a finished crew run, keyed by agent name."""
+    names = agent_names()
+    usage = {}
+    for index, crew_agent in enumerate(run_crew.agents):
+        token_process = getattr(crew_agent, "_token_process", None)
+        if token_process is None:
+            continue
+        summary = token_process.get_summary()
+        name = names[index] if index < len(names) else f"agent_{index}"
+        usage[name] = {
+            "prompt_tokens": getattr(summary, "prompt_tokens", 0),
+            "completion_tokens": getattr(summary, "completion_tokens", 0),
+        }
+    return usage
+
+
+def upstream_context(task_name: str, outputs: Dict[str, str]) -> str:
+    """The upstream outputs `task_name` declares, reduced to the declared fields."""
+    parts = []
+    for upstream_name, fields in _task_upstream.get(task_name, {}).items():
+        raw = outputs.get(upstream_name)
+        if raw is None:
+            continue
+        if fields:
+            data = parse_json_output(raw)
+            if data is not None:
+                raw = json.dumps({field: data.get(field) for field in fields}, ensure_ascii=False)
+            else:
+                logger.warning("Output of '%s' is not JSON, passing it whole to '%s'", upstream_name, task_name)
+        parts.append(raw)
+    return "\n\n".join(parts)
+
+
+def run_tasks(run_crew: Crew, inputs: dict):
+    """Run the tasks of `run_crew` in one kickoff, each seeing only the upstream outputs it declares.
+
+    Unlike a plain sequential kickoff, which hands every task all earlier
+    outputs, each task receives only the upstream outputs (or fields) it
+    declares in tasks.yaml, through its {upstream} placeholder: when a task
+    finishes, the next one's description is interpolated again with its own
+    upstream context. Returns the CrewOutput; prompt tokens per task are logged
+    and counted.
+    """
+    tasks = list(run_crew.tasks)
+    outputs: Dict[str, str] = {}
+    task_callback = run_crew.task_callback
+    # Prompt tokens of the running task's agent when it started, and its upstream context size
+    started = {"prompt_tokens": tasks[0].agent._token_process.prompt_tokens, "context_chars": 0}
+
+    def on_task_done(task_output):
+        crew_task = tasks[len(outputs)]
+        outputs[crew_task.name] = task_output.raw
+        prompt_tokens = crew_task.agent._token_process.prompt_tokens - started["prompt_tokens"]
+        metrics.inc_counter("correction_task_prompt_tokens_total", prompt_tokens, task=crew_task.name)
+        logger.info("Task %s: %s prompt tokens (upstream context %s chars)",
+                    crew_task.name, prompt_tokens, started["context_chars"])
+
+        if task_callback is not None:
+            task_callback(task_output)
+
+        if len(outputs) < len(tasks):
+            next_task = tasks[len(outputs)]
+            context = upstream_context(next_task.name, outputs)
+            next_task.interpolate_inputs_and_add_conversation_history(dict(inputs, upstream=context))
+            started.update(prompt_tokens=next_task.agent._token_process.prompt_tokens, context_chars=len(context))
+
+    run_crew.task_callback = on_task_done
+    try:
+        return run_crew.kickoff(inputs=dict(inputs, upstream=upstream_context(tasks[0].name, {})))
+    finally:
+        run_crew.task_callback = task_callback
@@ -0,0 +1,198 @@
+"""Shared HTTP client for the Django backend (transback).
+
+One `requests.Session` owns a keep-alive connection pool, so calls reuse TLS
+connections instead of paying a handshake each time. Every request gets a
+per-endpoint (connect, read) timeout, transient failures (5xx, connection
+errors) are retried with jittered exponential backoff, and a circuit breaker
+fails fast while the backend is down. Point `DJANGO_API_BASE_URL` at a local
+stub server to exercise the service without the real backend.
+"""
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from correction import cassettes, settings
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised without touching the network while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures and lets one trial call through after `reset_timeout`."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    logger.warning("Django API circuit opened after %s consecutive failures", self._failures)
+                self._opened_at = time.monotonic()
+
+
+class DjangoClient:
+    """Pooled, timeout-aware client for the Django API."""
+
+    def __init__(self, base_url: str, pool_size: int = 20, timeouts: Optional[Dict[str, Tuple[float, float]]] = None,
+                 default_timeout: Tuple[float, float] = (3.05, 30.0), max_retries: int = 3,
+                 backoff_base: float = 0.25, backoff_max: float = 4.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.base_url = base_url.rstrip("/")
+        self.timeouts = timeouts or {}
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def url(self, path: str) -> str:
+        """Absolute URL for an API path; absolute URLs are returned unchanged."""
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def endpoint_for(self, url: str) -> str:
+        """Endpoint name used for timeouts: the first path segment (e.g. 'compare-text')."""
+        segments = [segment for segment in urlsplit(url).path.split("/") if segment]
+        return segments[0] if segments else "root"
+
+    def timeout_for(self, endpoint: str) -> Tuple[float, float]:
+        return self.timeouts.get(endpoint, self.default_timeout)
+
+    def request(self, method: str, path: str, timeout=None, **kwargs) -> requests.Response:
+        """Send a request with retries; raises requests.exceptions.RequestException when all attempts fail.
+
+        While a cassette is active (see correction.cassettes) the exchange is
+        recorded, or answered from the recording without touching the network.
+        """
+        method = method.upper()
+        url = self.url(path)
+        cassette = cassettes.current()
+        if cassette is None:
+            return self._send(method, url, timeout, **kwargs)
+        if cassette.mode == cassettes.REPLAY:
+            return cassette.replay_http(method, url)
+
+        started = time.perf_counter()
+        try:
+            response = self._send(method, url, timeout, **kwargs)
+        except requests.exceptions.RequestException as e:
+            cassette.record_http(method, url, kwargs.get("json"), None, time.perf_counter() - started, error=e)
+            raise
+        cassette.record_http(method, url, kwargs.get("json"), response, time.perf_counter() - started)
+        return response
+
+    def _send(self, method: str, url: str, timeout=None, **kwargs) -> requests.Response:
+        timeout = timeout or self.timeout_for(self.endpoint_for(url))
+        attempts = self.max_retries + 1
+
+        for attempt in range(1, attempts + 1):
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Django API circuit is open; skipping {method} {url}")
+
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.exceptions.RequestException as e:
+                self.breaker.record_failure()
+                # A POST that may have reached the server must not be sent twice
+                retryable = method in IDEMPOTENT_METHODS or isinstance(e, requests.exceptions.ConnectTimeout)
+                if not retryable or attempt == attempts:
+                    raise
+                logger.warning("%s %s failed (%s), retrying (%s/%s)", method, url, e, attempt, self.max_retries)
+            else:
+                if response.status_code not in RETRY_STATUS_CODES:
+                    self.breaker.record_success()
+                    return response
+                self.breaker.record_failure()
+                if method not in IDEMPOTENT_METHODS or attempt == attempts:
+                    return response
+                logger.warning("%s %s returned %s, retrying (%s/%s)",
+                               method, url, response.status_code, attempt, self.max_retries)
+
+            self._sleep_backoff(attempt)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def _sleep_backoff(self, attempt: int):
+        # Full jitter: uniform in [0, min(cap, base * 2^attempt)]
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        time.sleep(random.uniform(0, delay))
+
+
+_client: Optional[DjangoClient] = None
+_client_lock = threading.Lock()
+
+
+def get_django_client() -> DjangoClient:
+    """Return the process-wide Django client, creating it from settings on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = DjangoClient(
+                    settings.DJANGO_API_BASE_URL,
+                    pool_size=settings.DJANGO_POOL_SIZE,
+                    timeouts=settings.DJANGO_TIMEOUTS,
+                    default_timeout=(settings.DJANGO_CONNECT_TIMEOUT, settings.DJANGO_READ_TIMEOUT),
+                    max_retries=settings.DJANGO_MAX_RETRIES,
+                    backoff_base=settings.DJANGO_BACKOFF_BASE,
+                    backoff_max=settings.DJANGO_BACKOFF_MAX,
+                    breaker=CircuitBreaker(settings.DJANGO_BREAKER_THRESHOLD, settings.DJANGO_BREAKER_RESET_SECONDS)
+                )
+    return _client
@@ -0,0 +1,45 @@
+"""Module import-time report (`correction --import-report`).
+
+Runs `python -X importtime` in a fresh interpreter so the numbers include
+everything a cold start pays, and summarizes the slowest packages.
+"""
+import subprocess
+import sys
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+DEFAULT_MODULES = ("correction.main", "correction.crew")
+
+
+def measure(modules: Sequence[str]) -> List[Tuple[str, int, int]]:
+    """(module, self_us, cumulative_us) of every import made while importing `modules` in order."""
+    code = "; ".join(f"import {module}" for module in modules)
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                               capture_output=True, text=True, check=False)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else
+                           f"python exited with code {completed.returncode}")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def report(modules: Sequence[str] = DEFAULT_MODULES, top: int = 15) -> str:
+    rows = measure(modules)
+    by_name = {name: cumulative for name, _, cumulative in rows}
+    packages: Dict[str, int] = defaultdict(int)
+    for name, self_us, _ in rows:
+        packages[name.split(".")[0]] += self_us
+
+    lines = ["Import time (cold interpreter, ms)", ""]
+    lines += [f"  {module:<40} {by_name.get(module, 0) / 1000:>9.1f}" for module in modules]
+    lines += ["", f"  {'total':<40} {sum(packages.values()) / 1000:>9.1f}", "",
+              f"Slowest top-level packages (self time, top {top})", ""]
+    for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        lines.append(f"  {package:<40} {self_us / 1000:>9.1f}")
+    return "\n".join(lines)
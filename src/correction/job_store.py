@@ -0,0 +1,176 @@
+"""Job state shared by the server's worker processes.
+
+Each gunicorn worker runs its own `JobManager`, so a status, events or cancel
+request for a job can reach a worker that is not running it. Every worker
+writes its jobs' status and progress events to one SQLite file under the state
+directory, and a worker asked about a job it does not run reads it from there;
+a cancel request for such a job is left in the file for the running worker to
+pick up at its next stage boundary.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional
+
+from correction import settings
+
+logger = logging.getLogger(__name__)
+
+# Columns written from a Job and read back into one
+JOB_FIELDS = ("id", "subject_id", "script_id", "status", "success", "message", "details",
+              "created_at", "started_at", "finished_at", "cancel_requested", "pid")
+
+
+class JobStore:
+    """SQLite copy of each job's status and events, readable from every worker."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " subject_id TEXT NOT NULL,"
+            " script_id TEXT NOT NULL,"
+            " status TEXT NOT NULL,"
+            " success INTEGER,"
+            " message TEXT,"
+            " details TEXT NOT NULL DEFAULT '{}',"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL,"
+            " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+            " pid INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_script ON jobs (script_id, status)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS job_events ("
+            " job_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " data TEXT NOT NULL,"
+            " PRIMARY KEY (job_id, seq))"
+        )
+
+    def save(self, job, event: Optional[Dict] = None) -> None:
+        """Write a job's current state, and with `event` append that event, in one transaction."""
+        row = (job.id, job.subject_id, job.script_id, job.status,
+               None if job.success is None else int(job.success), job.message,
+               json.dumps(job.details, default=str), job.created_at, job.started_at, job.finished_at,
+               int(job.cancel_requested), os.getpid())
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # A cancel requested from another worker is kept until the job has seen it
+                self._conn.execute(
+                    f"INSERT INTO jobs ({', '.join(JOB_FIELDS)}) VALUES ({', '.join('?' * len(JOB_FIELDS))})"
+                    " ON CONFLICT (id) DO UPDATE SET"
+                    " status = excluded.status, success = excluded.success, message = excluded.message,"
+                    " details = excluded.details, started_at = excluded.started_at,"
+                    " finished_at = excluded.finished_at,"
+                    " cancel_requested = MAX(jobs.cancel_requested, excluded.cancel_requested)",
+                    row
+                )
+                if event is not None:
+                    self._conn.execute("INSERT OR REPLACE INTO job_events (job_id, seq, data) VALUES (?, ?, ?)",
+                                       (job.id, event["seq"], json.dumps(event, default=str)))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(JOB_FIELDS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        data = dict(zip(JOB_FIELDS, row))
+        data["details"] = json.loads(data["details"] or "{}")
+        data["success"] = None if data["success"] is None else bool(data["success"])
+        data["cancel_requested"] = bool(data["cancel_requested"])
+        return data
+
+    def events(self, job_id: str, seq: int) -> List[Dict]:
+        """Events of a job with sequence number >= `seq`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM job_events WHERE job_id = ? AND seq >= ? ORDER BY seq", (job_id, seq)
+            ).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def find_active(self, subject_id: str, script_id: str, statuses) -> List[str]:
+        """Ids of the jobs for a subject and script in one of `statuses`, newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id FROM jobs WHERE script_id = ? AND subject_id = ?"
+                f" AND status IN ({', '.join('?' * len(statuses))})"
+                " AND cancel_requested = 0 ORDER BY created_at DESC",
+                (str(script_id), str(subject_id), *statuses)
+            ).fetchall()
+        return [job_id for job_id, in rows]
+
+    def request_cancel(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+
+    def cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def abandon(self, statuses, status: str, message: str, finished_at: float,
+                job_id: Optional[str] = None) -> int:
+        """Finish jobs left in one of `statuses` by workers that are gone (all of them without `job_id`).
+
+        Returns the number of jobs updated.
+        """
+        query = (f"UPDATE jobs SET status = ?, success = 0, message = ?, finished_at = ?"
+                 f" WHERE status IN ({', '.join('?' * len(statuses))})")
+        params = [status, message, finished_at, *statuses]
+        if job_id is not None:
+            query += " AND id = ?"
+            params.append(job_id)
+        with self._lock:
+            cursor = self._conn.execute(query, params)
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def prune(self, cutoff: float) -> None:
+        """Delete jobs (and their events) that finished before `cutoff`."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM job_events WHERE job_id IN"
+                                   " (SELECT id FROM jobs WHERE finished_at < ?)", (cutoff,))
+                self._conn.execute("DELETE FROM jobs WHERE finished_at < ?", (cutoff,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+_store: Optional[JobStore] = None
+_store_lock = threading.Lock()
+
+
+def get_job_store() -> Optional[JobStore]:
+    """Return the process-wide job store, or None when jobs are only tracked in memory."""
+    global _store
+    if not settings.JOB_STORE_ENABLED:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = JobStore(settings.JOB_STORE_PATH)
+    return _store
@@ -0,0 +1,393 @@
+"""In-process background jobs for OCR correction runs.
+
+A bounded thread pool runs the correction pipeline so HTTP requests can return
+immediately with a job id. Submitting a script that already has a queued or
+running job returns that job instead of starting a second crew run. Each job
+keeps an append-only list of progress events that clients can follow while it
+runs, and can be asked to cancel at the next stage boundary.
+
+With a `JobStore` every job's status and events are also written to a file
+shared by the server's workers, so a worker that is not running a job can
+still report it, stream its events and cancel it.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from correction.job_store import JobStore
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# How often a job run by another worker is re-read from the job store while waiting on it
+STORE_POLL_SECONDS = 0.5
+
+
+class JobQueueFull(Exception):
+    """Raised when the job queue has reached its pending limit."""
+
+
+class JobManagerClosed(JobQueueFull):
+    """Raised when a job is submitted while the manager is draining for shutdown."""
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job when cancellation was requested."""
+
+
+class Job:
+    """A single correction run and its outcome."""
+
+    def __init__(self, subject_id: str, script_id: str, store: Optional[JobStore] = None):
+        self.id = uuid.uuid4().hex
+        self.subject_id = str(subject_id)
+        self.script_id = str(script_id)
+        self.status = QUEUED
+        self.success: Optional[bool] = None
+        self.message: Optional[str] = None
+        self.details: Dict = {}
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cancel_requested = False
+        self.events: List[Dict] = []
+        self._events_changed = threading.Condition()
+        self._done = threading.Event()
+        self._store = store
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes; returns False on timeout."""
+        return self._done.wait(timeout)
+
+    def emit(self, event: str, **data) -> None:
+        """Append a progress event and wake up any listeners."""
+        with self._events_changed:
+            entry = dict(data, seq=len(self.events), event=event, time=time.time())
+            self.events.append(entry)
+            self.persist(entry)
+            self._events_changed.notify_all()
+
+    def persist(self, event: Optional[Dict] = None) -> None:
+        """Write the job's state (and `event`) to the job store, if there is one."""
+        if self._store is None:
+            return
+        try:
+            self._store.save(self, event)
+        except sqlite3.Error as e:
+            logger.warning("Could not write job %s to the job store: %s", self.id, e)
+
+    def events_since(self, seq: int, timeout: Optional[float] = None) -> List[Dict]:
+        """Events with sequence number >= `seq`, waiting up to `timeout` for new ones."""
+        with self._events_changed:
+            self._events_changed.wait_for(lambda: len(self.events) > seq or self.done, timeout)
+            return self.events[seq:]
+
+    def cancel(self) -> None:
+        """Ask the job to stop at its next stage boundary."""
+        if not self.done and not self.cancel_requested:
+            self.cancel_requested = True
+            self.emit("cancel_requested")
+
+    def check_cancelled(self) -> None:
+        if not self.cancel_requested and self._cancel_requested_elsewhere():
+            self.cancel()
+        if self.cancel_requested:
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def _cancel_requested_elsewhere(self) -> bool:
+        """True when another worker asked for this job to be cancelled through the job store."""
+        if self._store is None:
+            return False
+        try:
+            return self._store.cancel_requested(self.id)
+        except sqlite3.Error as e:
+            logger.warning("Could not read job %s from the job store: %s", self.id, e)
+            return False
+
+    def to_dict(self) -> Dict:
+        return {
+            "job_id": self.id,
+            "subject_id": self.subject_id,
+            "script_id": self.script_id,
+            "status": self.status,
+            "success": self.success,
+            "message": self.message,
+            "details": self.details,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class StoredJob(Job):
+    """A job run by another worker process, read from the job store.
+
+    Its status is re-read on every check, events are polled from the store and
+    a cancel request is written there for the running worker to pick up.
+    """
+
+    def __init__(self, store: JobStore, data: Dict):
+        super().__init__(data["subject_id"], data["script_id"], store)
+        self.id = data["id"]
+        self._apply(data)
+
+    def _apply(self, data: Dict):
+        for name in ("status", "success", "message", "details", "created_at",
+                     "started_at", "finished_at", "cancel_requested", "pid"):
+            setattr(self, name, data[name])
+        if self.status in ACTIVE_STATUSES and not _process_alive(self.pid):
+            # The worker running it stopped without finishing it (e.g. it was killed)
+            self.status, self.success = FAILED, False
+            self.message = f"Job {self.id} was lost: the worker running it exited"
+            self.finished_at = time.time()
+            self._store.abandon(ACTIVE_STATUSES, FAILED, self.message, self.finished_at, self.id)
+
+    def refresh(self) -> None:
+        data = self._store.load(self.id)
+        if data is not None:
+            self._apply(data)
+
+    @property
+    def done(self) -> bool:
+        self.refresh()
+        return self.status not in ACTIVE_STATUSES
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.done:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            time.sleep(STORE_POLL_SECONDS if remaining is None else min(STORE_POLL_SECONDS, remaining))
+        return True
+
+    def emit(self, event: str, **data) -> None:
+        raise RuntimeError(f"Job {self.id} runs in another worker")
+
+    def events_since(self, seq: int, timeout: Optional[float] = None) -> List[Dict]:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            events = self._store.events(self.id, seq)
+            if events:
+                return events
+            if self.done:
+                # The final events are written together with the finished status
+                return self._store.events(self.id, seq)
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return []
+            time.sleep(STORE_POLL_SECONDS if remaining is None else min(STORE_POLL_SECONDS, remaining))
+
+    def cancel(self) -> None:
+        if not self.done and not self.cancel_requested:
+            self.cancel_requested = True
+            self._store.request_cancel(self.id)
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def abandon_stored_jobs(store: JobStore) -> int:
+    """Finish the jobs a previous server left queued or running (call before workers start)."""
+    return store.abandon(ACTIVE_STATUSES, FAILED, "Job was lost: the server restarted", time.time())
+
+
+class JobManager:
+    """Runs correction jobs on a bounded worker pool and tracks their status."""
+
+    def __init__(self, runner: Callable[..., Tuple[bool, str]], max_workers: int = 4,
+                 max_pending: int = 200, retention_seconds: int = 3600, store: Optional[JobStore] = None):
+        self._runner = runner
+        self._store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="correction-job")
+        self._max_pending = max_pending
+        self._retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        # Active job per (subject_id, script_id)
+        self._active: Dict[Tuple[str, str], Job] = {}
+        self._closed = False
+
+    def submit(self, subject_id: str, script_id: str) -> Tuple[Job, bool]:
+        """Queue a correction run; returns (job, created) where created is False for a reused job."""
+        with self._lock:
+            self._prune()
+
+            key = (str(subject_id), str(script_id))
+            existing = self._active.get(key)
+            if existing is not None and existing.status in ACTIVE_STATUSES and not existing.cancel_requested:
+                logger.info("Reusing active job %s for subject_id: %s, script_id: %s", existing.id, *key)
+                return existing, False
+
+            existing = self._find_stored(*key)
+            if existing is not None:
+                logger.info("Reusing active job %s of worker %s for subject_id: %s, script_id: %s",
+                            existing.id, existing.pid, *key)
+                return existing, False
+
+            if self._closed:
+                raise JobManagerClosed("Job manager is shutting down")
+
+            pending = sum(1 for job in self._active.values() if job.status == QUEUED)
+            if pending >= self._max_pending:
+                raise JobQueueFull(f"Job queue is full ({pending} pending)")
+
+            job = Job(subject_id, script_id, self._store)
+            self._jobs[job.id] = job
+            self._active[key] = job
+            # Still under the lock: drain() cannot shut the executor down between the check and the submit
+            job.persist()
+            self._executor.submit(self._run, job)
+        logger.info("Queued job %s for subject_id: %s, script_id: %s", job.id, subject_id, script_id)
+        return job, True
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """A job of this worker or, from the job store, of another one."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or self._store is None:
+            return job
+        try:
+            data = self._store.load(job_id)
+        except sqlite3.Error as e:
+            logger.warning("Could not read job %s from the job store: %s", job_id, e)
+            return None
+        return StoredJob(self._store, data) if data is not None else None
+
+    def _find_stored(self, subject_id: str, script_id: str) -> Optional[StoredJob]:
+        """An active job for the subject and script run by another worker, if any (caller holds the lock)."""
+        if self._store is None:
+            return None
+        try:
+            for job_id in self._store.find_active(subject_id, script_id, ACTIVE_STATUSES):
+                if job_id in self._jobs:
+                    continue
+                data = self._store.load(job_id)
+                job = StoredJob(self._store, data) if data is not None else None
+                if job is not None and job.status in ACTIVE_STATUSES:
+                    return job
+        except sqlite3.Error as e:
+            logger.warning("Could not read the job store: %s", e)
+        return None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            active = list(self._active.values())
+            return {
+                "queued": sum(1 for job in active if job.status == QUEUED),
+                "running": sum(1 for job in active if job.status == RUNNING),
+                "tracked": len(self._jobs),
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work; with `wait`, block until running jobs finish."""
+        self._executor.shutdown(wait=wait)
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Stop accepting jobs and wait up to `timeout` for queued and running ones to finish.
+
+        Jobs still active at the deadline are asked to cancel, and queued ones are
+        dropped and finished as cancelled so their waiters and event streams end.
+        Returns True when every job finished in time.
+        """
+        with self._lock:
+            self._closed = True
+            active = list(self._active.values())
+        if active:
+            logger.info("Draining %s correction jobs", len(active))
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for job in active:
+            job.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+        unfinished = [job for job in active if not job.done]
+        for job in unfinished:
+            job.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+        # Queued jobs whose futures were just cancelled will never run: finish them here
+        with self._lock:
+            dropped = [job for job in self._active.values() if job.status == QUEUED]
+            for job in dropped:
+                job.status = CANCELLED
+        for job in dropped:
+            job.cancel_requested = True
+            self._finish(job, False, f"Job {job.id} was dropped: the server is shutting down")
+        if unfinished:
+            logger.warning("%s correction jobs did not finish before shutdown", len(unfinished))
+        return not unfinished
+
+    def _run(self, job: Job):
+        with self._lock:
+            # A job dropped by drain() may still be handed to a worker
+            if job.status != QUEUED:
+                return
+            job.status = RUNNING
+        job.started_at = time.time()
+        job.emit("started")
+        try:
+            job.check_cancelled()
+            success, message = self._runner(job.subject_id, job.script_id, job=job)
+        except JobCancelled as e:
+            success, message = False, str(e)
+        except Exception as e:
+            logger.error("Job %s crashed: %s", job.id, e)
+            success, message = False, f"Error: {str(e)}"
+        self._finish(job, success, message)
+
+    def _finish(self, job: Job, success: bool, message: str):
+        """Record a job's outcome, emit its terminal event and wake up its waiters."""
+        job.success = success
+        job.message = message
+        job.finished_at = time.time()
+        if success:
+            job.status = SUCCEEDED
+        else:
+            job.status = CANCELLED if job.cancel_requested else FAILED
+
+        with self._lock:
+            key = (job.subject_id, job.script_id)
+            if self._active.get(key) is job:
+                del self._active[key]
+        job.emit("done", status=job.status, success=success, message=message)
+        job._done.set()
+        with job._events_changed:
+            job._events_changed.notify_all()
+        logger.info("Job %s finished with status %s in %.2fs",
+                    job.id, job.status, job.finished_at - (job.started_at or job.created_at))
+
+    def _prune(self):
+        """Forget finished jobs older than the retention window (caller holds the lock)."""
+        cutoff = time.time() - self._retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and job.finished_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if self._store is not None:
+            try:
+                self._store.prune(cutoff)
+            except sqlite3.Error as e:
+                logger.warning("Could not prune the job store: %s", e)
@@ -0,0 +1,107 @@
+"""Logging configuration for the correction service.
+
+In "json" mode every record is written as one JSON line by a background
+listener thread, so request threads only pay for putting the record on a
+queue. Large payloads (OCR texts, Django responses, save payloads) go to the
+`correction.payloads` logger at DEBUG and are only emitted for a sampled
+fraction of correction runs. "verbose" mode logs everything, payloads included.
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from typing import Optional
+
+from correction import settings
+
+payload_logger = logging.getLogger("correction.payloads")
+access_logger = logging.getLogger("correction.access")
+
+_payloads_sampled = contextvars.ContextVar("correction_payloads_sampled", default=False)
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record; `extra={"fields": {...}}` adds top-level keys."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class PayloadSampler(logging.Filter):
+    """Let payload records through only for runs picked by `sample_payloads()`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return _payloads_sampled.get()
+
+
+def sample_payloads(rate: Optional[float] = None) -> bool:
+    """Decide whether the current run (thread/context) logs full payloads."""
+    if settings.LOG_MODE == "verbose":
+        sampled = True
+    else:
+        rate = settings.LOG_PAYLOAD_SAMPLE_RATE if rate is None else rate
+        sampled = random.random() < rate
+    _payloads_sampled.set(sampled)
+    return sampled
+
+
+def payloads_enabled() -> bool:
+    """True when payload records of the current run would be emitted (guard for costly arguments)."""
+    return _payloads_sampled.get() and payload_logger.isEnabledFor(logging.DEBUG)
+
+
+def _stop_listener() -> None:
+    """Flush and stop the background listener (registered with atexit)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging(mode: Optional[str] = None, level: Optional[str] = None) -> None:
+    """Install the root handler for `mode` ("json" or "verbose"); safe to call more than once."""
+    global _listener
+    mode = mode or settings.LOG_MODE
+    level = level or settings.LOG_LEVEL
+
+    root = logging.getLogger()
+    _stop_listener()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(level)
+
+    # Payload records are DEBUG; the sampler (json mode) decides which runs emit them
+    payload_logger.setLevel(logging.DEBUG)
+    for log_filter in list(payload_logger.filters):
+        payload_logger.removeFilter(log_filter)
+
+    stream = logging.StreamHandler()
+    if mode == "verbose":
+        stream.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+        root.addHandler(stream)
+        return
+
+    stream.setFormatter(JsonFormatter())
+    payload_logger.addFilter(PayloadSampler())
+    records: queue.Queue = queue.Queue(-1)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    _listener = logging.handlers.QueueListener(records, stream, respect_handler_level=True)
+    _listener.start()
+
+
+atexit.register(_stop_listener)
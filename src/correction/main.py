@@ -5,20 +5,45 @@ import warnings
 import logging
 import requests
 import json 
-from flask import Flask, jsonify, request
+import threading
+import time
+import contextvars
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, g, jsonify, request
 from flask_cors import CORS
-from correction.crew import Correction
-from crewai.crews.crew_output import CrewOutput
+from correction.normalize import normalize_text
+from correction.alignment import compare_tokens, align_tokens, agreement_score
+from correction.patches import apply_patches, filter_patches, local_patches
+from correction import metrics
+from correction.jobs import JobManager, JobQueueFull, JobCancelled, abandon_stored_jobs
+from correction.job_store import JobStore, get_job_store
+from correction.batch import (run_batch, batch_id_for, checkpoint_path_for, load_checkpoint, summarize,
+                              lock_batch, unlock_batch)
+from correction import cassettes, settings
+from correction.cassettes import CassetteMiss
+from correction.logging_setup import configure_logging, sample_payloads, payloads_enabled, payload_logger, access_logger
+from correction.django_client import get_django_client
+from correction.script_index import get_script_index
+from correction.result_cache import get_result_cache, cache_key
+from correction.outbox import DeliveryRejected, get_outbox
+from correction.singleflight import get_single_flight
+from correction.chunking import plan_chunks
+from correction.textract import parse_textract
+from correction.outputs import CorrectionPatches, parse_json_output, validate_output
+from correction.suspects import build_suspects, suspects_json
+from correction.prompts import layout_report
+from correction import warmup
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (CORRECTION_LOG_MODE=json|verbose)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Suppress warnings
 warnings.filterwarnings("ignore", category=SyntaxWarning)
 
-# Django API configuration
-DJANGO_API_BASE_URL = "https://transback.transpoze.ai"
+# Django API configuration (override with the DJANGO_API_BASE_URL env var, e.g. for a local stub server)
+DJANGO_API_BASE_URL = settings.DJANGO_API_BASE_URL
 
 # ---
 # ### 🔍 Function to Retrieve Combined Data
@@ -27,15 +52,15 @@ def get_combined_data(subject_id: str, script_id: str):
     """Retrieve ocr_json, textract_json and context data from Django API using combined-data endpoint."""
     try:
         # Log the parameters for debugging
-        logger.info(f"Requesting data for subject_id: {subject_id}, script_id: {script_id}")
+        logger.info("Requesting data for subject_id: %s, script_id: %s", subject_id, script_id)
         
         url = f"{DJANGO_API_BASE_URL}/combined-data/?subject_id={subject_id}&script_id={script_id}"
-        logger.info(f"API URL: {url}")
+        logger.info("API URL: %s", url)
         
-        response = requests.get(url)
+        response = get_django_client().get(url)
         if response.status_code == 200:
             data = response.json()
-            logger.info(f"API Response keys: {list(data.keys())}")
+            logger.info("API Response keys: %s", list(data.keys()))
             
             # Handle the actual response structure with keys: ['context', 'structured_json', 'ocr_json', 'textract_json']
             if 'ocr_json' in data:
@@ -44,17 +69,17 @@ def get_combined_data(subject_id: str, script_id: str):
                 context_data = data.get('context')
                 
                 # Log what we received
-                logger.info(f"OCR data type: {type(ocr_json_data)}")
+                logger.info("OCR data type: %s", type(ocr_json_data))
                 if isinstance(ocr_json_data, (list, dict, str)):
-                    logger.info(f"OCR data length: {len(ocr_json_data)}")
+                    logger.info("OCR data length: %s", len(ocr_json_data))
                 else:
-                    logger.info(f"OCR data value: {ocr_json_data}")
+                    payload_logger.debug("OCR data value: %s", ocr_json_data)
                 
-                logger.info(f"Textract data type: {type(textract_json_data)}")
+                logger.info("Textract data type: %s", type(textract_json_data))
                 if isinstance(textract_json_data, (list, dict, str)):
-                    logger.info(f"Textract data length: {len(textract_json_data)}")
+                    logger.info("Textract data length: %s", len(textract_json_data))
                 else:
-                    logger.info(f"Textract data value: {textract_json_data}")
+                    payload_logger.debug("Textract data value: %s", textract_json_data)
                 
                 # Check if ocr_json is empty or None
                 if not ocr_json_data:
@@ -66,130 +91,25 @@ def get_combined_data(subject_id: str, script_id: str):
             else:
                 return None, None, None, f"No valid data found in response. Available keys: {list(data.keys())}"
         else:
-            logger.error(f"API error: {response.status_code} - {response.text}")
+            logger.error("API error: %s - %s", response.status_code, response.text)
             return None, None, None, f"API error: {response.status_code} - {response.text}"
     except requests.exceptions.RequestException as e:
-        logger.error(f"API request error: {str(e)}")
+        logger.error("API request error: %s", e)
         return None, None, None, f"API request error: {str(e)}"
 
 # ---
-# ### ✂ Function to Extract Textract Text - COMPLETELY FIXED VERSION
+# ### ✂ Function to Extract Textract Text
 # ---
 def extract_textract_text(textract_json_data):
     """Extract and combine text from textract_json data with proper structure handling."""
     if not textract_json_data:
         logger.warning("No textract data provided")
         return ""
-    
-    textract_text = []
-    
+
     try:
-        # Handle different possible data structures
-        if isinstance(textract_json_data, str):
-            # If it's already a string, return it
-            logger.info("Textract data is already a string")
-            return textract_json_data
-            
-        elif isinstance(textract_json_data, list):
-            logger.info(f"Processing textract data as list with {len(textract_json_data)} items")
-            
-            # This handles your actual data structure: list of page objects
-            for page_idx, page in enumerate(textract_json_data):
-                logger.info(f"Processing page {page_idx + 1}")
-                
-                if isinstance(page, dict):
-                    # Handle the structure from your test data
-                    if 'extracted_text' in page and isinstance(page['extracted_text'], dict):
-                        extracted_text = page['extracted_text']
-                        if 'extracted_lines' in extracted_text and isinstance(extracted_text['extracted_lines'], list):
-                            logger.info(f"Found {len(extracted_text['extracted_lines'])} lines in page {page_idx + 1}")
-                            
-                            for line in extracted_text['extracted_lines']:
-                                if isinstance(line, dict) and 'text' in line:
-                                    text_content = line['text'].strip()
-                                    if text_content:  # Only add non-empty text
-                                        textract_text.append(text_content)
-                    
-                    # Handle direct extracted_lines in page (alternative structure)
-                    elif 'extracted_lines' in page and isinstance(page['extracted_lines'], list):
-                        logger.info(f"Found {len(page['extracted_lines'])} lines in page {page_idx + 1}")
-                        
-                        for line in page['extracted_lines']:
-                            if isinstance(line, dict) and 'text' in line:
-                                text_content = line['text'].strip()
-                                if text_content:
-                                    textract_text.append(text_content)
-                    
-                    # Handle single text field in page
-                    elif 'text' in page:
-                        text_content = page['text'].strip()
-                        if text_content:
-                            textract_text.append(text_content)
-                            
-                elif isinstance(page, str):
-                    # If it's a list of strings
-                    text_content = page.strip()
-                    if text_content:
-                        textract_text.append(text_content)
-                        
-        elif isinstance(textract_json_data, dict):
-            logger.info("Processing textract data as dict")
-            
-            # Handle the main textract_results structure (nested case)
-            if 'textract_results' in textract_json_data:
-                logger.info("Found textract_results key")
-                textract_results = textract_json_data['textract_results']
-                
-                if isinstance(textract_results, list):
-                    # Recursively call this function with the list
-                    return extract_textract_text(textract_results)
-                elif 'pages' in textract_results and isinstance(textract_results['pages'], list):
-                    logger.info(f"Found {len(textract_results['pages'])} pages in textract_results")
-                    
-                    for page_idx, page in enumerate(textract_results['pages']):
-                        logger.info(f"Processing page {page_idx + 1}")
-                        
-                        if 'extracted_lines' in page and isinstance(page['extracted_lines'], list):
-                            logger.info(f"Found {len(page['extracted_lines'])} lines in page {page_idx + 1}")
-                            
-                            for line in page['extracted_lines']:
-                                if isinstance(line, dict) and 'text' in line:
-                                    text_content = line['text'].strip()
-                                    if text_content:  # Only add non-empty text
-                                        textract_text.append(text_content)
-                                        
-            # Handle direct pages structure
-            elif 'pages' in textract_json_data and isinstance(textract_json_data['pages'], list):
-                logger.info("Found direct pages structure")
-                
-                for page_idx, page in enumerate(textract_json_data['pages']):
-                    logger.info(f"Processing direct page {page_idx + 1}")
-                    
-                    if 'extracted_lines' in page and isinstance(page['extracted_lines'], list):
-                        for line in page['extracted_lines']:
-                            if isinstance(line, dict) and 'text' in line:
-                                text_content = line['text'].strip()
-                                if text_content:
-                                    textract_text.append(text_content)
-                                    
-            # Handle single dict object with text
-            elif 'text' in textract_json_data:
-                logger.info("Found direct text in dict")
-                return textract_json_data['text']
-        
-        # Join all extracted text
-        final_text = " ".join(textract_text)
-        logger.info(f"Extracted textract text length: {len(final_text)}")
-        logger.info(f"Number of text segments: {len(textract_text)}")
-        
-        # Log first few segments for debugging
-        if textract_text:
-            logger.info(f"First few text segments: {textract_text[:3]}")
-        
-        return final_text
-        
+        return parse_textract(textract_json_data).text
     except Exception as e:
-        logger.error(f"Error extracting textract text: {str(e)}")
+        logger.error("Error extracting textract text: %s", e)
         return ""
 
 def extract_ocr_text(ocr_json_data):
@@ -228,107 +148,15 @@ def extract_ocr_text(ocr_json_data):
     return " ".join(ocr_text)
 
 # ---
-# ### 📊 Function to Get Textract Statistics - COMPLETELY UPDATED
+# ### 📊 Function to Get Textract Statistics
 # ---
 def get_textract_statistics(textract_json_data):
     """Extract statistics from textract data for debugging purposes."""
-    stats = {
-        'total_pages': 0,
-        'total_lines': 0,
-        'total_blocks': 0,
-        'confidence_scores': [],
-        'page_details': []
-    }
-    
-    if not textract_json_data:
-        return stats
-    
     try:
-        # Handle list structure (your actual data format)
-        if isinstance(textract_json_data, list):
-            stats['total_pages'] = len(textract_json_data)
-            
-            for page in textract_json_data:
-                if isinstance(page, dict):
-                    # Handle the structure from your test data
-                    if 'extracted_text' in page and isinstance(page['extracted_text'], dict):
-                        extracted_text = page['extracted_text']
-                        
-                        page_info = {
-                            'page_number': page.get('page_number', 'unknown'),
-                            'total_lines': extracted_text.get('total_lines', 0),
-                            'total_blocks': extracted_text.get('total_blocks', 0),
-                            's3_key': extracted_text.get('s3_key', 'unknown'),
-                            'job_id': extracted_text.get('job_id', 'unknown'),
-                            'confidence_score': page.get('confidence_score', 0),
-                            'processing_status': page.get('processing_status', 'unknown')
-                        }
-                        stats['page_details'].append(page_info)
-                        stats['total_lines'] += extracted_text.get('total_lines', 0)
-                        stats['total_blocks'] += extracted_text.get('total_blocks', 0)
-                        
-                        # Extract confidence scores from extracted_lines
-                        if 'extracted_lines' in extracted_text and isinstance(extracted_text['extracted_lines'], list):
-                            for line in extracted_text['extracted_lines']:
-                                if isinstance(line, dict) and 'confidence' in line:
-                                    stats['confidence_scores'].append(line['confidence'])
-                    
-                    # Handle direct structure (alternative)
-                    elif 'extracted_lines' in page:
-                        page_info = {
-                            'page_number': page.get('page_number', 'unknown'),
-                            'total_lines': len(page.get('extracted_lines', [])),
-                            'total_blocks': page.get('total_blocks', 0),
-                            'confidence_score': page.get('confidence_score', 0)
-                        }
-                        stats['page_details'].append(page_info)
-                        stats['total_lines'] += len(page.get('extracted_lines', []))
-                        stats['total_blocks'] += page.get('total_blocks', 0)
-                        
-                        # Extract confidence scores
-                        for line in page.get('extracted_lines', []):
-                            if isinstance(line, dict) and 'confidence' in line:
-                                stats['confidence_scores'].append(line['confidence'])
-        
-        # Handle the nested textract_results structure
-        elif isinstance(textract_json_data, dict) and 'textract_results' in textract_json_data:
-            # Recursively call with the nested structure
-            return get_textract_statistics(textract_json_data['textract_results'])
-            
-        elif isinstance(textract_json_data, dict) and 'pages' in textract_json_data:
-            textract_results = textract_json_data
-            
-            if isinstance(textract_results['pages'], list):
-                stats['total_pages'] = len(textract_results['pages'])
-                
-                for page in textract_results['pages']:
-                    page_info = {
-                        'page_number': page.get('page_number', 'unknown'),
-                        'total_lines': page.get('total_lines', 0),
-                        'total_blocks': page.get('total_blocks', 0),
-                        'image_filename': page.get('image_filename', 'unknown'),
-                        'average_confidence': page.get('average_confidence', 0)
-                    }
-                    stats['page_details'].append(page_info)
-                    stats['total_lines'] += page.get('total_lines', 0)
-                    stats['total_blocks'] += page.get('total_blocks', 0)
-                    
-                    # Extract confidence scores from extracted_lines
-                    if 'extracted_lines' in page and isinstance(page['extracted_lines'], list):
-                        for line in page['extracted_lines']:
-                            if isinstance(line, dict) and 'confidence' in line:
-                                stats['confidence_scores'].append(line['confidence'])
-        
-        # Calculate average confidence if available
-        if stats['confidence_scores']:
-            stats['average_confidence'] = sum(stats['confidence_scores']) / len(stats['confidence_scores'])
-            stats['min_confidence'] = min(stats['confidence_scores'])
-            stats['max_confidence'] = max(stats['confidence_scores'])
-            
+        return parse_textract(textract_json_data).statistics()
     except Exception as e:
-        logger.warning(f"Error extracting textract statistics: {str(e)}")
-    
-    return stats
+        logger.warning("Error extracting textract statistics: %s", e)
+        return parse_textract(None).statistics()
 
 
 # ---
@@ -340,62 +168,61 @@ def get_existing_vlmdesc(script_id: str):
         # Try multiple possible endpoints to get existing data
         possible_urls = [
             f"{DJANGO_API_BASE_URL}/compare-text/{script_id}/",
-            f"{DJANGO_API_BASE_URL}/compare-text/?script_id={script_id}",
-            f"{DJANGO_API_BASE_URL}/compare-text/"
+            f"{DJANGO_API_BASE_URL}/compare-text/?script_id={script_id}"
         ]
         
         for url in possible_urls:
             try:
-                logger.info(f"Trying to retrieve existing vlmdesc data from: {url}")
-                response = requests.get(url)
+                logger.info("Trying to retrieve existing vlmdesc data from: %s", url)
+                response = get_django_client().get(url)
                 
                 if response.status_code == 200:
                     data = response.json()
-                    logger.info(f"Response data type: {type(data)}")
-                    logger.info(f"Response data preview: {str(data)[:200]}...")
+                    logger.info("Response data type: %s", type(data))
+                    payload_logger.debug("Response data preview: %.200s...", data)
                     
                     # Handle different response formats
                     if isinstance(data, dict):
                         # Single object response
                         existing_vlmdesc = data.get('vlmdesc', {})
-                        logger.info(f"Retrieved existing vlmdesc from dict: {existing_vlmdesc}")
+                        payload_logger.debug("Retrieved existing vlmdesc from dict: %s", existing_vlmdesc)
                         return existing_vlmdesc
                         
                     elif isinstance(data, list):
                         # List response - find matching script_id
-                        logger.info(f"Response is a list with {len(data)} items")
+                        logger.info("Response is a list with %s items", len(data))
                         for item in data:
                             if isinstance(item, dict):
                                 # Check if this item matches our script_id
                                 if (item.get('script_id') == script_id or 
                                     item.get('script_id') == int(script_id) if script_id.isdigit() else False):
                                     existing_vlmdesc = item.get('vlmdesc', {})
-                                    logger.info(f"Found matching script_id in list, vlmdesc: {existing_vlmdesc}")
+                                    payload_logger.debug("Found matching script_id in list, vlmdesc: %s", existing_vlmdesc)
                                     return existing_vlmdesc
                         
                         # If no exact match found, try to get the most recent one
                         if data and isinstance(data[0], dict):
                             existing_vlmdesc = data[0].get('vlmdesc', {})
-                            logger.info(f"No exact match found, using first item vlmdesc: {existing_vlmdesc}")
+                            payload_logger.debug("No exact match found, using first item vlmdesc: %s", existing_vlmdesc)
                             return existing_vlmdesc
                     
                     else:
-                        logger.warning(f"Unexpected data type: {type(data)}")
+                        logger.warning("Unexpected data type: %s", type(data))
                         continue
                         
                 else:
-                    logger.warning(f"API returned status {response.status_code} for {url}")
+                    logger.warning("API returned status %s for %s", response.status_code, url)
                     continue
                     
             except requests.exceptions.RequestException as e:
-                logger.warning(f"Request failed for {url}: {str(e)}")
+                logger.warning("Request failed for %s: %s", url, e)
                 continue
         
-        logger.warning(f"Could not retrieve existing vlmdesc from any endpoint for script_id: {script_id}")
+        logger.warning("Could not retrieve existing vlmdesc from any endpoint for script_id: %s", script_id)
         return {}
     
     except Exception as e:
-        logger.warning(f"Error retrieving existing vlmdesc: {str(e)}")
+        logger.warning("Error retrieving existing vlmdesc: %s", e)
         return {}
 
 
@@ -405,23 +232,35 @@ def get_existing_vlmdesc(script_id: str):
 # ---
 # ### 💾 Function to Save Correction Data to Django API (FIXED VERSION)
 # ---
-def save_correction_data(script_id: str, result: str):
-    """Save the correction data to the Django API compare-text endpoint while preserving existing data."""
+# 4xx responses a retry can still get past (timeouts, conflicts, rate limits)
+RETRYABLE_CLIENT_ERRORS = {408, 409, 425, 429}
+
+def is_rejection(status_code: int) -> bool:
+    """True when Django refused a save for good, e.g. a bad payload or a missing script."""
+    return 400 <= status_code < 500 and status_code not in RETRYABLE_CLIENT_ERRORS
+
+def save_correction_data(script_id: str, result: str, existing_data=None, raise_rejected: bool = False):
+    """Save the correction data to the Django API compare-text endpoint while preserving existing data.
+
+    With `raise_rejected`, a save Django refuses for good raises DeliveryRejected instead of returning
+    (False, message).
+    """
     try:
         base_url = f"{DJANGO_API_BASE_URL}/compare-text/"
-        logger.info(f"Saving correction data to: {base_url}")
+        logger.info("Saving correction data to: %s", base_url)
         
         # First, get existing data to check if record exists and preserve all content
-        existing_data = get_existing_complete_data(script_id)
+        if existing_data is None:
+            existing_data = get_existing_complete_data(script_id)
         
         if existing_data and existing_data.get('compare_text_id'):
             # Record exists - UPDATE it using PUT with ID in URL
             compare_text_id = existing_data.get('compare_text_id')
-            logger.info(f"Updating existing record with compare_text_id: {compare_text_id}")
+            logger.info("Updating existing record with compare_text_id: %s", compare_text_id)
             
             # Use the ID in the URL path, not in the payload
             update_url = f"{base_url}{compare_text_id}/"
-            logger.info(f"Update URL: {update_url}")
+            logger.info("Update URL: %s", update_url)
             
             # Prepare payload for update - FIXED: Don't include compare_text_id in payload
             payload = {
@@ -432,21 +271,25 @@ def save_correction_data(script_id: str, result: str):
             }
             
             headers = {"Content-Type": "application/json"}
-            logger.info(f"Update payload: {payload}")
+            payload_logger.debug("Update payload: %s", payload)
             
             # Use PUT method to update existing record
-            response = requests.put(update_url, json=payload, headers=headers)
+            response = get_django_client().put(update_url, json=payload, headers=headers)
             
             if response.status_code in [200, 201]:
-                logger.info(f"Successfully updated correction data for script_id: {script_id}")
-                return True, response.json()
+                logger.info("Successfully updated correction data for script_id: %s", script_id)
+                response_data = response.json()
+                get_script_index().put(script_id, response_data.get('compare_text_id', compare_text_id))
+                return True, response_data
             else:
-                logger.error(f"Failed to update correction data: {response.status_code} - {response.text}")
+                logger.error("Failed to update correction data: %s - %s", response.status_code, response.text)
+                if raise_rejected and is_rejection(response.status_code):
+                    raise DeliveryRejected(f"API rejected the update: {response.status_code} - {response.text}")
                 return False, f"API error during update: {response.status_code} - {response.text}"
         
         else:
             # Record doesn't exist - CREATE it using POST
-            logger.info(f"Creating new record for script_id: {script_id}")
+            logger.info("Creating new record for script_id: %s", script_id)
             
             # Prepare the payload for creation
             payload = {
@@ -464,187 +307,699 @@ def save_correction_data(script_id: str, result: str):
             }
             
             headers = {"Content-Type": "application/json"}
-            logger.info(f"Create payload: {payload}")
+            payload_logger.debug("Create payload: %s", payload)
             
             # Use POST method to create new record
-            response = requests.post(base_url, json=payload, headers=headers)
+            response = get_django_client().post(base_url, json=payload, headers=headers)
             
             if response.status_code in [200, 201]:
-                logger.info(f"Successfully created correction data for script_id: {script_id}")
-                return True, response.json()
+                logger.info("Successfully created correction data for script_id: %s", script_id)
+                response_data = response.json()
+                get_script_index().put(script_id, response_data.get('compare_text_id'))
+                return True, response_data
             else:
-                logger.error(f"Failed to create correction data: {response.status_code} - {response.text}")
+                logger.error("Failed to create correction data: %s - %s", response.status_code, response.text)
+                if raise_rejected and is_rejection(response.status_code):
+                    raise DeliveryRejected(f"API rejected the creation: {response.status_code} - {response.text}")
                 return False, f"API error during creation: {response.status_code} - {response.text}"
     
     except requests.exceptions.RequestException as e:
-        logger.error(f"Error saving correction data: {str(e)}")
+        logger.error("Error saving correction data: %s", e)
         return False, f"API request error: {str(e)}"
 
+def matches_script_id(item, script_id: str):
+    """True if a compare-text record belongs to script_id (compared as string and int)."""
+    item_script_id = item.get('script_id')
+    script_id_int = int(script_id) if script_id.isdigit() else None
+    return (str(item_script_id) == str(script_id) or
+            (script_id_int is not None and item_script_id == script_id_int))
+
 def get_existing_complete_data(script_id: str):
-    """Retrieve existing complete data for a script_id to preserve MCQ and other content."""
+    """Retrieve existing complete data for a script_id to preserve MCQ and other content.
+
+    Uses the local script_id -> compare_text_id index first and falls back to the
+    filtered compare-text query; the unfiltered list of all records is never fetched.
+    """
     try:
-        # Convert script_id to int for comparison
-        script_id_int = int(script_id) if script_id.isdigit() else None
-        
-        # Try the specific script_id endpoint first
+        script_index = get_script_index()
+
+        # Known record: fetch it directly by id
+        compare_text_id = script_index.get(script_id)
+        if compare_text_id:
+            url_by_id = f"{DJANGO_API_BASE_URL}/compare-text/{compare_text_id}/"
+            logger.info("Trying to retrieve existing data from index entry: %s", url_by_id)
+
+            try:
+                response = get_django_client().get(url_by_id)
+
+                if response.status_code == 200:
+                    data = response.json()
+                    if isinstance(data, dict) and matches_script_id(data, script_id):
+                        logger.info("Found indexed record for script_id: %s", script_id)
+                        return data
+
+                # Stale entry (record deleted or reassigned) - drop it and use the filtered query
+                logger.info("Index entry for script_id %s is stale (status %s)", script_id, response.status_code)
+                script_index.delete(script_id)
+
+            except requests.exceptions.RequestException as e:
+                logger.warning("Request failed for indexed record: %s", e)
+
+        # Filtered query by script_id
         url_with_script = f"{DJANGO_API_BASE_URL}/compare-text/?script_id={script_id}"
-        logger.info(f"Trying to retrieve existing data with script_id filter: {url_with_script}")
+        logger.info("Trying to retrieve existing data with script_id filter: %s", url_with_script)
         
         try:
-            response = requests.get(url_with_script)
+            response = get_django_client().get(url_with_script)
             
             if response.status_code == 200:
                 data = response.json()
-                logger.info(f"Response data type: {type(data)}")
+                logger.info("Response data type: %s", type(data))
                 
                 # Handle list response
                 if isinstance(data, list) and len(data) > 0:
                     # Find exact match by script_id
                     for item in data:
-                        if isinstance(item, dict):
-                            item_script_id = item.get('script_id')
-                            # Check both string and int comparison
-                            if (str(item_script_id) == str(script_id) or 
-                                (script_id_int and item_script_id == script_id_int)):
-                                logger.info(f"Found exact match for script_id: {script_id}")
-                                return item
+                        if isinstance(item, dict) and matches_script_id(item, script_id):
+                            logger.info("Found exact match for script_id: %s", script_id)
+                            script_index.put(script_id, item.get('compare_text_id'))
+                            return item
                     
-                    # If no exact match, return the first item (most recent)
-                    logger.info(f"No exact match found, using first item")
-                    return data[0]
+                    logger.info("No exact match found for script_id: %s", script_id)
                 
                 # Handle single dict response
                 elif isinstance(data, dict):
-                    logger.info(f"Retrieved single dict response")
+                    logger.info("Retrieved single dict response")
+                    if matches_script_id(data, script_id):
+                        script_index.put(script_id, data.get('compare_text_id'))
                     return data
         
         except requests.exceptions.RequestException as e:
-            logger.warning(f"Request failed for script_id endpoint: {str(e)}")
-        
-        # Fallback: try getting all records and filter
-        url_all = f"{DJANGO_API_BASE_URL}/compare-text/"
-        logger.info(f"Trying to retrieve all data and filter: {url_all}")
+            logger.warning("Request failed for script_id endpoint: %s", e)
         
-        try:
-            response = requests.get(url_all)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if isinstance(data, list):
-                    # Find exact match by script_id
-                    for item in data:
-                        if isinstance(item, dict):
-                            item_script_id = item.get('script_id')
-                            # Check both string and int comparison
-                            if (str(item_script_id) == str(script_id) or 
-                                (script_id_int and item_script_id == script_id_int)):
-                                logger.info(f"Found exact match in all records for script_id: {script_id}")
-                                return item
-                    
-                    logger.info(f"No exact match found in all records for script_id: {script_id}")
-                
-        except requests.exceptions.RequestException as e:
-            logger.warning(f"Request failed for all records endpoint: {str(e)}")
-        
-        logger.warning(f"Could not retrieve existing data for script_id: {script_id}")
+        logger.warning("Could not retrieve existing data for script_id: %s", script_id)
         return {}
     
     except Exception as e:
-        logger.warning(f"Error retrieving existing complete data: {str(e)}")
+        logger.warning("Error retrieving existing complete data: %s", e)
         return {}
 # ---
+# ### 🗃 Cached Results
+# ---
+def stored_result(existing_data):
+    """The final_corrected_text result Django holds in a compare-text record, if any."""
+    stored = (existing_data.get('final_corrected_text') or {}) if existing_data else {}
+    return stored.get('result') if isinstance(stored, dict) else None
+
+def save_cached_result(script_id: str, result: str):
+    """Save a cached crew result, skipping the write when Django already holds the same result."""
+    existing_data = get_existing_complete_data(script_id)
+    if stored_result(existing_data) == result:
+        logger.info("Cached result already saved for script_id: %s, skipping save", script_id)
+        return True, f"Success: OCR correction unchanged for script_id {script_id} (cached result already saved)."
+
+    save_success, save_message = save_correction_data(script_id, result, existing_data=existing_data)
+    if not save_success:
+        logger.error("Failed to save cached correction data: %s", save_message)
+        return False, f"OCR correction (cached) found but failed to save: {save_message}"
+
+    return True, f"Success: OCR corrected (cached result) and saved for script_id {script_id}."
+
+# ---
+# ### 📮 Write-behind Outbox
+# ---
+def deliver_result(script_id: str, result: str):
+    """Outbox delivery: save a result to compare-text unless Django already holds it."""
+    existing_data = get_existing_complete_data(script_id)
+    if stored_result(existing_data) == result:
+        logger.info("Result for script_id %s already saved, dropping it from the outbox", script_id)
+        return True, "unchanged"
+    return save_correction_data(script_id, result, existing_data=existing_data, raise_rejected=True)
+
+def start_outbox():
+    """Start this process's outbox flusher (no-op when the outbox is off); returns the outbox."""
+    result_outbox = get_outbox()
+    if result_outbox is not None:
+        result_outbox.start(deliver_result, settings.OUTBOX_FLUSH_INTERVAL)
+    return result_outbox
+
+def queue_result(script_id: str, result: str, job=None) -> bool:
+    """Hand a finished result to the outbox; False when it has to be saved synchronously instead.
+
+    The job's details remember the queued result so its status can report the delivery (see job_status).
+    """
+    # Cassettes record and replay the save as part of the run
+    if cassettes.mode() != cassettes.OFF:
+        return False
+    try:
+        result_outbox = start_outbox()
+        if result_outbox is None:
+            return False
+        enqueued_at = result_outbox.put(script_id, result)
+    except sqlite3.Error as e:
+        logger.error("Could not queue the result for script_id %s, saving it now: %s", script_id, e)
+        return False
+    logger.info("Result for script_id %s queued for saving", script_id)
+    if job is not None:
+        job.details["outbox"] = {"state": "waiting", "enqueued_at": enqueued_at}
+    return True
+
+def job_status(job):
+    """A job's status, with the current delivery state of a result it left in the outbox."""
+    status = job.to_dict()
+    queued = status["details"].get("outbox")
+    result_outbox = get_outbox()
+    if queued and result_outbox is not None:
+        try:
+            state = result_outbox.state(job.script_id, queued["enqueued_at"])
+        except sqlite3.Error as e:
+            logger.warning("Could not read the outbox state of job %s: %s", job.id, e)
+        else:
+            status["details"] = dict(status["details"], outbox=dict(queued, **state))
+    return status
+
+def drain_outbox(timeout: float) -> bool:
+    """Deliver the waiting results before a CLI run exits; True when none are left."""
+    result_outbox = get_outbox()
+    if result_outbox is None:
+        return True
+    delivered = result_outbox.drain(deliver_result, timeout, settings.OUTBOX_FLUSH_INTERVAL)
+    if not delivered:
+        logger.warning("%s results are still waiting in the outbox and will be saved by the next run: %s",
+                       result_outbox.stats()['depth'], settings.OUTBOX_PATH)
+    return delivered
+
+# ---
+# ### 📡 Job Progress Events
+# ---
+# Crew task name -> progress stage reported to clients
+TASK_STAGES = {
+    "ocr_logging_task": "logged",
+    "ocr_report_task": "report_done",
+    # The corrector returns patches; final_text is emitted once they are spliced into OCR1
+    "final_output_task": "patches_done",
+}
+
+def emit_stage(job, stage: str, check_cancel: bool = True, **data):
+    """Report a pipeline stage to the job's listeners and stop here if cancellation was requested.
+
+    Stages past the save point pass check_cancel=False: the result is stored, so the job has succeeded.
+    """
+    if job is None:
+        return
+    job.emit("stage", stage=stage, **data)
+    if check_cancel:
+        job.check_cancelled()
+
+def make_task_callback(job, chunk_index=None):
+    """Crew task callback that turns finished tasks into job progress events."""
+    if job is None:
+        return None
+
+    def on_task_done(task_output):
+        task_name = getattr(task_output, "name", None)
+        stage = TASK_STAGES.get(task_name, task_name or "task_done")
+        data = {"task": task_name}
+        if chunk_index is not None:
+            data["chunk"] = chunk_index
+        emit_stage(job, stage, **data)
+
+    return on_task_done
+
+# ---
 # ### 🧠 Core OCR Correction Logic
 # ---
-def run_ocr_correction(subject_id: str, script_id: str):
+def compare_ocr_texts(ocr_text: str, textract_text: str, textract_document=None):
+    """Normalize, align and flag both OCR texts locally.
+
+    With the parsed Textract document, its line confidences are carried to the
+    OCR2 words so low-confidence near-matches get flagged as well.
+    Returns a dict with both normalized texts, the flagged words and the agreement score.
+    """
+    # Normalize and tokenize both OCR outputs locally (replaces the parser agent)
+    ocr1_normalized = normalize_text(ocr_text)
+    ocr2_normalized = normalize_text(textract_text)
+    logger.info("Normalized word counts: ocr1=%s, ocr2=%s", len(ocr1_normalized), len(ocr2_normalized))
+
+    # Align the word arrays and flag disagreements locally (replaces the comparison agent)
+    pairs = align_tokens(ocr1_normalized, ocr2_normalized)
+    ocr2_confidences = None
+    if textract_document is not None and textract_document.text == textract_text:
+        ocr2_confidences = textract_document.word_confidences(ocr2_normalized)
+    flagged_words = compare_tokens(ocr1_normalized, ocr2_normalized, pairs, ocr2_confidences)
+    score = agreement_score(ocr1_normalized, ocr2_normalized, pairs)
+    logger.info("Flagged words: %s, agreement score: %.4f", len(flagged_words), score)
+
+    return {
+        "ocr1": ocr1_normalized,
+        "ocr2": ocr2_normalized,
+        "flagged_words": flagged_words,
+        "agreement": score
+    }
+
+def build_crew_inputs(context, comparison):
+    """Build the crew inputs from the local comparison of both OCR texts (the texts themselves are not sent)."""
+    flagged_words = comparison["flagged_words"]
+    suspects = build_suspects(comparison["ocr1"], flagged_words, settings.SUSPECT_CONTEXT_WORDS)
+
+    return {
+        "flagged_words": json.dumps(flagged_words),
+        "suspects": suspects_json(suspects),
+        "context": context
+    }
+
+def correct_text(ocr_text: str, textract_text: str, context, comparison=None, task_callback=None):
+    """Run the correction crew on one script (or chunk of a script) and return the corrected-text JSON."""
+    if comparison is None:
+        comparison = compare_ocr_texts(ocr_text, textract_text)
+    # The corrector may only patch flagged words: with none (e.g. a clean chunk) the crew is skipped
+    if not comparison["flagged_words"]:
+        return json.dumps({"flagged_words_corrected_text": comparison["ocr1"].source})
+    inputs = build_crew_inputs(context, comparison)
+
+    # Run the agent; tasks run sequentially, so each task's time is the gap since the previous one finished
+    crew = warmup.load_crew()
+    run_crew = crew.new_crew()
+    task_started = [time.perf_counter()]
+
+    def on_task_done(task_output):
+        now = time.perf_counter()
+        metrics.observe("correction_crew_task_seconds", now - task_started[0],
+                        task=getattr(task_output, "name", None) or "unknown")
+        task_started[0] = now
+        if task_callback is not None:
+            task_callback(task_output)
+
+    run_crew.task_callback = on_task_done
+    # Each task only sees the upstream outputs it declares in tasks.yaml
+    result = crew.run_tasks(run_crew, inputs)
+
+    # Token Usage
+    token_usage = crew.agent_token_usage(run_crew)
+    if settings.LOG_MODE == "verbose":
+        print(f"\nToken Usage:\n{token_usage}\n")
+    else:
+        logger.info("Token usage: %s", token_usage)
+    for agent_name, usage in token_usage.items():
+        metrics.inc_counter("correction_llm_prompt_tokens_total", usage["prompt_tokens"], agent=agent_name)
+        metrics.inc_counter("correction_llm_completion_tokens_total", usage["completion_tokens"], agent=agent_name)
+
+    # The OCR texts must not reach the prompts (the prompt tokens each task used are counted by run_tasks)
+    layout = layout_report(run_crew, ocr_text, textract_text)
+    text_copies = layout["ocr1_copies"] + layout["ocr2_copies"]
+    if text_copies:
+        metrics.inc_counter("correction_prompt_text_copies_total", text_copies)
+        logger.warning("OCR texts found in the crew prompts: %s", layout)
+
+    return apply_crew_patches(comparison, str(result))
+
+def apply_crew_patches(comparison, output: str) -> str:
+    """Splice the corrector's {index: replacement} patches into OCR1.
+
+    Only flagged words can be replaced; every other byte of the OCR1 text is
+    kept as it was.
+    """
+    patches = validate_output(output, CorrectionPatches).patches
+    accepted, rejected = filter_patches(patches, {entry["index"] for entry in comparison["flagged_words"]})
+    if rejected:
+        logger.warning("Ignoring %s patches for words that were not flagged: %s", len(rejected), rejected[:20])
+        metrics.inc_counter("correction_patches_rejected_total", len(rejected))
+    metrics.inc_counter("correction_patches_applied_total", len(accepted))
+    corrected_text = apply_patches(comparison["ocr1"], accepted)
+    return json.dumps({"flagged_words_corrected_text": corrected_text})
+
+def correct_locally(comparison):
+    """Fast-path result for scripts where both OCR engines agree: OCR1 with only local fixes applied."""
+    patches = local_patches(comparison["flagged_words"])
+    corrected_text = apply_patches(comparison["ocr1"], patches)
+    logger.info("Fast path applied %s local corrections", len(patches))
+    return json.dumps({"flagged_words_corrected_text": corrected_text})
+
+def correct_in_chunks(chunks, context, job=None):
+    """Correct chunks concurrently and stitch the corrected texts back together in order.
+
+    Chunks are exact slices of OCR1 (separators included), so concatenating the
+    corrected chunks keeps every byte outside the patched words.
+    """
+    max_workers = max(1, min(settings.CHUNK_CONCURRENCY, len(chunks)))
+    logger.info("Correcting %s chunks with concurrency %s", len(chunks), max_workers)
+
+    def correct_chunk(chunk):
+        with cassettes.track(f"chunk-{chunk.index}"):
+            return correct_text(chunk.ocr1, chunk.ocr2, context, task_callback=make_task_callback(job, chunk.index))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="correction-chunk") as pool:
+        # Each chunk runs in its own copy of this context so it sees the active cassette
+        futures = [pool.submit(contextvars.copy_context().run, correct_chunk, chunk) for chunk in chunks]
+        results = [future.result() for future in futures]
+
+    corrected = []
+    for chunk, result in zip(chunks, results):
+        data = parse_json_output(result)
+        text = data.get("flagged_words_corrected_text") if data else None
+        if not isinstance(text, str):
+            raise ValueError(f"Chunk {chunk.index} returned no flagged_words_corrected_text")
+        corrected.append(text)
+
+    return json.dumps({"flagged_words_corrected_text": "".join(corrected)})
+
+def print_extracted_texts(ocr_text: str, textract_text: str, context):
+    """Dump the extracted texts to stdout (verbose logging mode)."""
+    print("\n" + "="*80)
+    print("📄 EXTRACTED OCR TEXT:")
+    print("="*80)
+    print(ocr_text)
+    print("\n" + "="*80)
+    print("📄 EXTRACTED TEXTRACT TEXT:")
+    print("="*80)
+    print(textract_text)
+    print("\n" + "="*80)
+    print("📝 CONTEXT:")
+    print("="*80)
+    print(context)
+    print("="*80 + "\n")
+
+def record_path(job, path: str):
+    """Record which correction path a run took, on the job and in metrics."""
+    metrics.inc_counter("correction_path_total", path=path)
+    if job is not None:
+        job.details["path"] = path
+
+def run_ocr_correction(subject_id: str, script_id: str, job=None):
     """Run OCR correction pipeline using subject_id and script_id."""
+    sample_payloads()
+    try:
+        # Records or replays the Django/LLM traffic when CORRECTION_CASSETTE_MODE is set
+        with cassettes.use_cassette(script_id):
+            return correct_script(subject_id, script_id, job)
+    except CassetteMiss as e:
+        logger.error("OCR correction failed: %s", e)
+        return False, f"Error: {str(e)}"
+
+
+def correct_script(subject_id: str, script_id: str, job=None):
+    """Fetch, compare, correct and save one script (the body of run_ocr_correction)."""
     try:
         # Retrieve combined data
-        ocr_json_data, textract_json_data, context_data, error = get_combined_data(subject_id, script_id)
+        with metrics.timed("correction_django_fetch_seconds", job):
+            ocr_json_data, textract_json_data, context_data, error = get_combined_data(subject_id, script_id)
         if error:
             return False, error
 
         if not ocr_json_data:
             return False, f"No OCR data found for subject_id: {subject_id}, script_id: {script_id}"
 
-        # Extract OCR text
-        ocr_text = extract_ocr_text(ocr_json_data)
-        if not ocr_text:
-            return False, f"No OCR text could be extracted for script_id: {script_id}"
+        emit_stage(job, "data_fetched")
 
-        # Extract Textract text
-        textract_text = extract_textract_text(textract_json_data)
-        logger.info(f"Extracted textract text preview: {textract_text[:200]}...")
+        with metrics.timed("correction_text_extraction_seconds", job):
+            # Extract OCR text
+            ocr_text = extract_ocr_text(ocr_json_data)
 
-        # Get textract statistics
-        textract_stats = get_textract_statistics(textract_json_data)
-        logger.info(f"Textract statistics: {textract_stats}")
+            # Parse the Textract payload once for the text, statistics and per-page texts
+            textract_document = parse_textract(textract_json_data)
+            textract_text = textract_document.text
+            textract_stats = textract_document.statistics()
+
+        if not ocr_text:
+            return False, f"No OCR text could be extracted for script_id: {script_id}"
+        payload_logger.debug("Extracted textract text preview: %.200s...", textract_text)
+        logger.info("Textract statistics: %s", textract_stats)
+        logger.info("OCR JSON data type: %s", type(ocr_json_data))
+        logger.info("Textract JSON data type: %s", type(textract_json_data))
 
         # Use context data or fallback
         context = context_data if context_data else f"Subject ID: {subject_id}, Script ID: {script_id}"
 
-        # Prepare inputs for the agent
-        inputs = {
-            "ocr1": ocr_text,
-            "ocr2": textract_text,
-            "context": context
-        }
+        # Concurrent runs with the same inputs share one crew run and one save
+        input_key = cache_key(ocr_text, textract_text, context)
+        single_flight = get_single_flight()
+        if single_flight is None:
+            return correct_extracted(script_id, ocr_text, textract_text, textract_document, context, input_key, job)
+        wait_check = job.check_cancelled if job is not None else None
+        (success, message), shared = single_flight.do(
+            (str(subject_id), str(script_id), input_key),
+            lambda: correct_extracted(script_id, ocr_text, textract_text, textract_document, context, input_key, job),
+            wait_check=wait_check
+        )
+        if shared:
+            logger.info("Shared the result of a concurrent correction for script_id: %s", script_id)
+            record_path(job, "shared")
+            if success:
+                emit_stage(job, "saved", check_cancel=False, shared=True)
+        return success, message
 
-        # Log inputs
-        logger.info(f"OCR Text length: {len(ocr_text)}")
-        logger.info(f"Textract Text length: {len(textract_text)}")
-        logger.info(f"Context: {str(context)[:100]}...")
-        logger.info(f"OCR JSON data type: {type(ocr_json_data)}")
-        logger.info(f"Textract JSON data type: {type(textract_json_data)}")
-
-        # Print extracted texts
-        print("\n" + "="*80)
-        print("📄 EXTRACTED OCR TEXT:")
-        print("="*80)
-        print(ocr_text)
-        print("\n" + "="*80)
-        print("📄 EXTRACTED TEXTRACT TEXT:")
-        print("="*80)
-        print(textract_text)
-        print("\n" + "="*80)
-        print("📝 CONTEXT:")
-        print("="*80)
-        print(context)
-        print("="*80 + "\n")
-
-        # Run the agent
-        result = Correction().crew().kickoff(inputs=inputs)
-        
-        # Token Usage
-        print(f"\nToken Usage:\n{result.token_usage}\n")
-        
-        # Convert result to string
-        result = str(result)
-        
-        # Handle string result as plain text
-        logger.info("Crew result is a string")
-        
+    except JobCancelled:
+        logger.info("OCR correction cancelled for script_id: %s", script_id)
+        raise
+    except Exception as e:
+        logger.error("OCR correction failed: %s", e)
+        return False, f"Error: {str(e)}"
+
+
+def correct_extracted(script_id: str, ocr_text: str, textract_text: str, textract_document, context,
+                      input_key: str, job=None):
+    """Compare, correct and save the extracted texts of one script (raises on errors).
+
+    `input_key` is the result cache key of the inputs (see result_cache.cache_key).
+    """
+    # Identical inputs and crew configuration reuse the stored result instead of re-running the crew
+    # (not while recording/replaying cassettes, which must capture the whole run)
+    result_cache = get_result_cache() if cassettes.mode() == cassettes.OFF else None
+    result_key = input_key if result_cache else None
+    if result_cache:
+        cached_result = result_cache.get(result_key)
+        if cached_result is not None:
+            logger.info("Result cache hit for script_id: %s", script_id)
+            record_path(job, "cache")
+            emit_stage(job, "final_text", text=cached_result, cached=True)
+            with metrics.timed("correction_save_seconds", job):
+                queued = queue_result(script_id, cached_result, job)
+                if queued:
+                    success, message = True, f"Success: OCR corrected (cached result) for script_id {script_id}, queued for saving."
+                else:
+                    success, message = save_cached_result(script_id, cached_result)
+            if success:
+                emit_stage(job, "saved", check_cancel=False, queued=queued)
+            return success, message
+
+    # Log inputs
+    logger.info("OCR Text length: %s", len(ocr_text))
+    logger.info("Textract Text length: %s", len(textract_text))
+    logger.info("Context: %s...", str(context)[:100])
+
+    # Print extracted texts (verbose mode only; json mode logs them for sampled runs)
+    if settings.LOG_MODE == "verbose":
+        print_extracted_texts(ocr_text, textract_text, context)
+    elif payloads_enabled():
+        payload_logger.debug("Extracted texts for script_id %s", script_id, extra={"fields": {
+            "ocr_text": ocr_text, "textract_text": textract_text, "context": context}})
+
+    # Compare both OCR outputs locally; when they agree closely enough, skip the crew entirely
+    with metrics.timed("correction_compare_seconds", job):
+        comparison = compare_ocr_texts(ocr_text, textract_text, textract_document)
+    metrics.observe("correction_agreement_score", comparison["agreement"], buckets=metrics.RATIO_BUCKETS)
+    for flagged in comparison["flagged_words"]:
+        metrics.inc_counter("correction_flagged_words_total", rule=flagged["rule_triggered"])
+    if job is not None:
+        job.details["agreement_score"] = round(comparison["agreement"], 4)
+        job.details["flagged_words"] = len(comparison["flagged_words"])
+    emit_stage(job, "parsed", ocr1_words=len(comparison["ocr1"]), ocr2_words=len(comparison["ocr2"]))
+    emit_stage(job, "compared", flagged_words=len(comparison["flagged_words"]),
+               agreement_score=round(comparison["agreement"], 4))
+
+    if comparison["agreement"] >= settings.AGREEMENT_THRESHOLD:
+        logger.info("OCR engines agree (%.4f >= %s), skipping the crew for script_id: %s",
+                    comparison['agreement'], settings.AGREEMENT_THRESHOLD, script_id)
+        record_path(job, "fast_path")
+        result = correct_locally(comparison)
+        emit_stage(job, "final_text", text=result)
+    elif not comparison["flagged_words"]:
+        # Nothing for the crew to patch (e.g. an empty Textract text): keep OCR1 as it is
+        logger.info("No flagged words, skipping the crew for script_id: %s", script_id)
+        record_path(job, "nothing_flagged")
+        result = correct_locally(comparison)
+        emit_stage(job, "final_text", text=result)
+    else:
+        # Long scripts can be split on page/section boundaries and corrected in parallel
+        chunks = []
+        if settings.CHUNK_MODE != "off":
+            chunks = plan_chunks(ocr_text, textract_document.page_texts(), settings.CHUNK_MODE, settings.CHUNK_SIZE)
 
+        if len(chunks) > 1:
+            record_path(job, "chunked_crew")
+            with metrics.timed("correction_crew_seconds", job):
+                result = correct_in_chunks(chunks, context, job)
+            emit_stage(job, "final_text", text=result, chunks=len(chunks))
+        else:
+            record_path(job, "crew")
+            with metrics.timed("correction_crew_seconds", job):
+                result = correct_text(ocr_text, textract_text, context, comparison, make_task_callback(job))
+            emit_stage(job, "final_text", text=result)
+
+    # Cache before saving so a failed save doesn't lose the paid-for result
+    if result_cache:
+        result_cache.put(result_key, result)
 
-        # Save to Django API
+    # Save to Django API: through the durable outbox, or right away when it is off
+    with metrics.timed("correction_save_seconds", job):
+        if queue_result(script_id, result, job):
+            emit_stage(job, "saved", check_cancel=False, queued=True)
+            logger.info("OCR correction completed successfully for script_id: %s", script_id)
+            return True, f"Success: OCR corrected for script_id {script_id}, queued for saving."
         save_success, save_message = save_correction_data(script_id, result)
-        if not save_success:
-            logger.error(f"Failed to save correction data: {save_message}")
-            return False, f"OCR correction completed but failed to save: {save_message}"
+    if not save_success:
+        logger.error("Failed to save correction data: %s", save_message)
+        return False, f"OCR correction completed but failed to save: {save_message}"
 
-        logger.info(f"OCR correction completed successfully for script_id: {script_id}")
-        return True, f"Success: OCR corrected and saved for script_id {script_id}."
+    emit_stage(job, "saved", check_cancel=False)
+    logger.info("OCR correction completed successfully for script_id: %s", script_id)
+    return True, f"Success: OCR corrected and saved for script_id {script_id}."
 
-    except Exception as e:
-        logger.error(f"OCR correction failed: {str(e)}")
-        return False, f"Error: {str(e)}"
+
+# ---
+# ### ⏳ Background Correction Jobs
+# ---
+_job_manager = None
+
+def get_job_manager():
+    """Return the process-wide job manager, creating it on first use."""
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager(
+            run_ocr_correction,
+            max_workers=settings.JOB_WORKERS,
+            max_pending=settings.JOB_MAX_PENDING,
+            retention_seconds=settings.JOB_RETENTION_SECONDS,
+            store=get_job_store()
+        )
+    return _job_manager
+
+
+def abandon_previous_jobs():
+    """Fail the jobs a previous server left queued or running in the job store (call before serving)."""
+    if not settings.JOB_STORE_ENABLED:
+        return
+    # A connection of its own: the process-wide store must not be opened before gunicorn forks
+    store = JobStore(settings.JOB_STORE_PATH)
+    try:
+        lost = abandon_stored_jobs(store)
+    finally:
+        store.close()
+    if lost:
+        logger.warning("%s correction jobs of the previous server run were lost", lost)
+
+
+def collect_queue_gauges():
+    """Set the job queue and outbox gauges of this process."""
+    job_stats = get_job_manager().stats()
+    metrics.set_gauge("correction_jobs_queued", job_stats["queued"])
+    metrics.set_gauge("correction_jobs_running", job_stats["running"])
+    metrics.set_gauge("correction_jobs_tracked", job_stats["tracked"])
+    result_outbox = get_outbox()
+    if result_outbox is not None:
+        result_outbox.update_gauges()
+
+
+def drain_jobs(timeout=None):
+    """Stop taking jobs and wait for in-flight corrections (called when a server worker exits)."""
+    if _job_manager is None:
+        return True
+    return _job_manager.drain(timeout)
+
+
+def wants_async_response():
+    """True when the caller asked for a 202 + job id instead of waiting for the result."""
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+
+def job_accepted_response(job, created):
+    """Build the 202 response for a submitted (or reused) job."""
+    status_url = f"/correction/jobs/{job.id}"
+    response = jsonify({
+        "status": "accepted",
+        "job_id": job.id,
+        "job_status": job.status,
+        "reused": not created,
+        "subject_id": job.subject_id,
+        "script_id": job.script_id,
+        "status_url": status_url
+    })
+    response.headers['Location'] = status_url
+    return response, 202
+
+
+def job_event_stream(job, last_event_id=None, on_close=None):
+    """Server-Sent Events response that follows a job's progress events until it finishes."""
+    next_seq = last_event_id + 1 if last_event_id is not None else 0
+
+    def stream():
+        nonlocal next_seq
+        yield "retry: 3000\n\n"
+        while True:
+            events = job.events_since(next_seq, timeout=15)
+            if not events:
+                if job.done:
+                    return
+                # Keep proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                yield f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+                next_seq = event['seq'] + 1
+                if event['event'] == 'done':
+                    return
+
+    response = Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',
+        'X-Job-Id': job.id
+    })
+    if on_close is not None:
+        response.call_on_close(on_close)
+    return response
+
+
+def requested_last_event_id():
+    """Last-Event-ID sent by a reconnecting EventSource, if any."""
+    value = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+# ---
+# ### 📚 Subject-level Batch Correction
+# ---
+def start_batch(subject_id, script_ids, max_in_flight):
+    """Run a batch in a background thread; returns (batch_id, started).
+
+    started is False when the batch already runs, in this or another worker process.
+    """
+    batch_id = batch_id_for(subject_id, script_ids)
+    batch_lock = lock_batch(batch_id)
+    if batch_lock is None:
+        return batch_id, False
+
+    def worker():
+        try:
+            run_batch(subject_id, script_ids, run_ocr_correction, max_in_flight=max_in_flight)
+        except Exception as e:
+            logger.error("Batch %s crashed: %s", batch_id, e)
+        finally:
+            unlock_batch(batch_lock)
+
+    threading.Thread(target=worker, name=f"correction-batch-{batch_id}", daemon=True).start()
+    return batch_id, True
 
 
 # ---
 # ### 🚀 Flask Application
 # ---
-def run():
-    """Start the Flask application for OCR correction."""
+def create_app():
+    """Build the Flask application for OCR correction."""
     app = Flask(__name__)
     app.secret_key = 'super_secret_key'
     
@@ -656,19 +1011,33 @@ def run():
          supports_credentials=True
     )
 
+    # Requests that hold a server thread until a correction finishes (sync waits,
+    # event streams) get fewer slots than there are threads, so the health and
+    # diagnostics routes are never starved by long correction work
+    long_request_slots = threading.BoundedSemaphore(settings.LONG_REQUEST_SLOTS)
+
+    # Queue gauges are refreshed whenever the metrics are written or scraped
+    metrics.register_collector(collect_queue_gauges)
+
     # Debug middleware to log all requests
     @app.before_request
     def debug_request():
-        logger.info(f"=== INCOMING REQUEST DEBUG ===")
-        logger.info(f"Method: {request.method}")
-        logger.info(f"URL: {request.url}")
-        logger.info(f"Path: {request.path}")
-        logger.info(f"Origin: {request.headers.get('Origin', 'No Origin header')}")
-        logger.info(f"User-Agent: {request.headers.get('User-Agent', 'No User-Agent')}")
-        logger.info(f"All Headers: {dict(request.headers)}")
-        logger.info(f"Remote Address: {request.remote_addr}")
-        logger.info(f"Host: {request.host}")
-        logger.info(f"================================")
+        g.request_started = time.perf_counter()
+        if settings.LOG_MODE != "verbose":
+            if request.method == "OPTIONS":
+                return '', 200
+            return None
+
+        logger.info("=== INCOMING REQUEST DEBUG ===")
+        logger.info("Method: %s", request.method)
+        logger.info("URL: %s", request.url)
+        logger.info("Path: %s", request.path)
+        logger.info("Origin: %s", request.headers.get('Origin', 'No Origin header'))
+        logger.info("User-Agent: %s", request.headers.get('User-Agent', 'No User-Agent'))
+        logger.info("All Headers: %s", dict(request.headers))
+        logger.info("Remote Address: %s", request.remote_addr)
+        logger.info("Host: %s", request.host)
+        logger.info("================================")
         
         # Handle preflight OPTIONS requests - let Flask-CORS handle the headers
         if request.method == "OPTIONS":
@@ -678,10 +1047,23 @@ def run():
     # Debug middleware to log all responses
     @app.after_request
     def debug_response(response):
-        logger.info(f"=== OUTGOING RESPONSE DEBUG ===")
-        logger.info(f"Status: {response.status}")
-        logger.info(f"Response Headers: {dict(response.headers)}")
-        logger.info(f"================================")
+        if settings.LOG_MODE != "verbose":
+            # One structured line per request
+            started = g.get("request_started")
+            access_logger.info("request", extra={"fields": {
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2) if started else None,
+                "remote_addr": request.remote_addr,
+                "response_bytes": response.calculate_content_length(),
+            }})
+            return response
+
+        logger.info("=== OUTGOING RESPONSE DEBUG ===")
+        logger.info("Status: %s", response.status)
+        logger.info("Response Headers: %s", dict(response.headers))
+        logger.info("================================")
         return response
 
     @app.route('/')
@@ -691,16 +1073,30 @@ def run():
             "message": "OCR Correction API is running",
             "endpoints": {
                 "correct_ocr": "/correction/correct_ocr/<subject_id>/<script_id>",
+                "submit_job": "/correction/jobs/<subject_id>/<script_id>",
+                "job_status": "/correction/jobs/<job_id>",
+                "job_events": "/correction/jobs/<job_id>/events",
+                "cancel_job": "/correction/jobs/<job_id>/cancel",
+                "batch": "/correction/batch/<subject_id>",
+                "batch_status": "/correction/batch/<subject_id>/<batch_id>",
                 "test_data": "/correction/test_data/<subject_id>/<script_id>",
                 "test_django": "/correction/test_django_api/<subject_id>/<script_id>",
-                "health_check": "/health"
+                "health_check": "/health",
+                "django_health": "/correction/health",
+                "startup": "/correction/startup",
+                "metrics": "/metrics"
             }
         })
 
     @app.route('/correction/correct_ocr/<subject_id>/<script_id>', methods=['GET', 'OPTIONS', 'POST'])
     def correct_ocr_route(subject_id, script_id):
-        """Endpoint to run OCR correction for a given subject_id and script_id."""
-        logger.info(f"Processing request for subject_id: {subject_id}, script_id: {script_id}")
+        """Endpoint to run OCR correction for a given subject_id and script_id.
+
+        Waits for the result by default, as existing clients expect; with ?async=1
+        or Prefer: respond-async it answers 202 with the job's status URL, like
+        POST /correction/jobs/<subject_id>/<script_id>.
+        """
+        logger.info("Processing request for subject_id: %s, script_id: %s", subject_id, script_id)
         
         if request.method == 'OPTIONS':
             logger.info("Handling OPTIONS request for correct_ocr_route")
@@ -712,19 +1108,147 @@ def run():
                 "message": "Subject ID and Script ID are required"
             }), 400
 
-        logger.info(f"Processing OCR correction for subject_id: {subject_id}, script_id: {script_id}")
-        success, message = run_ocr_correction(subject_id, script_id)
+        logger.info("Processing OCR correction for subject_id: %s, script_id: %s", subject_id, script_id)
+        try:
+            job, created = get_job_manager().submit(subject_id, script_id)
+        except JobQueueFull as e:
+            return jsonify({"status": "error", "message": str(e)}), 503
+
+        if request.args.get('stream', '').lower() in ('1', 'true', 'yes'):
+            if not long_request_slots.acquire(blocking=False):
+                logger.info("No free request slot to stream job %s, responding asynchronously", job.id)
+                return job_accepted_response(job, created)
+            return job_event_stream(job, requested_last_event_id(), on_close=long_request_slots.release)
+
+        if wants_async_response():
+            return job_accepted_response(job, created)
+
+        if not long_request_slots.acquire(blocking=False):
+            logger.info("No free request slot to wait for job %s, responding asynchronously", job.id)
+            return job_accepted_response(job, created)
+        try:
+            job.wait()
+        finally:
+            long_request_slots.release()
+        success, message = job.success, job.message
 
         response_data = {
             "status": "success" if success else "error",
             "subject_id": str(subject_id),
             "script_id": str(script_id),
+            "job_id": job.id,
             "message": message
         }
 
-        logger.info(f"OCR correction result: {response_data}")
+        logger.info("OCR correction result: %s", response_data)
         return jsonify(response_data), 200 if success else 500
 
+    @app.route('/correction/jobs/<subject_id>/<script_id>', methods=['POST', 'OPTIONS'])
+    def submit_job_route(subject_id, script_id):
+        """Queue an OCR correction job and return its id immediately."""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        try:
+            job, created = get_job_manager().submit(subject_id, script_id)
+        except JobQueueFull as e:
+            return jsonify({"status": "error", "message": str(e)}), 503
+
+        return job_accepted_response(job, created)
+
+    @app.route('/correction/jobs/<job_id>', methods=['GET', 'OPTIONS'])
+    def job_status_route(job_id):
+        """Return the status and, once finished, the result of a correction job."""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        job = get_job_manager().get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": f"Unknown job_id: {job_id}"}), 404
+
+        return jsonify(job_status(job))
+
+    @app.route('/correction/jobs/<job_id>/events', methods=['GET', 'OPTIONS'])
+    def job_events_route(job_id):
+        """Stream a job's progress as Server-Sent Events."""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        job = get_job_manager().get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": f"Unknown job_id: {job_id}"}), 404
+
+        if not long_request_slots.acquire(blocking=False):
+            response = jsonify({"status": "error", "message": "Too many open event streams, poll the job status instead",
+                                "status_url": f"/correction/jobs/{job.id}"})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        return job_event_stream(job, requested_last_event_id(), on_close=long_request_slots.release)
+
+    @app.route('/correction/jobs/<job_id>/cancel', methods=['POST', 'OPTIONS'])
+    def cancel_job_route(job_id):
+        """Ask a queued or running job to stop at its next stage boundary."""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        job = get_job_manager().get(job_id)
+        if job is None:
+            return jsonify({"status": "error", "message": f"Unknown job_id: {job_id}"}), 404
+
+        job.cancel()
+        return jsonify({"status": "accepted", "job_id": job.id, "job_status": job.status}), 202
+
+    @app.route('/correction/batch/<subject_id>', methods=['POST', 'OPTIONS'])
+    def batch_route(subject_id):
+        """Start (or resume) OCR correction for a list of script_ids of one subject."""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        body = request.get_json(silent=True) or {}
+        script_ids = body.get('script_ids')
+        if not isinstance(script_ids, list) or not script_ids:
+            return jsonify({
+                "status": "error",
+                "message": "Body must contain a non-empty 'script_ids' list"
+            }), 400
+
+        try:
+            max_in_flight = int(body.get('max_in_flight', settings.BATCH_MAX_IN_FLIGHT))
+        except (TypeError, ValueError):
+            return jsonify({"status": "error", "message": "'max_in_flight' must be an integer"}), 400
+
+        # Deduplicate (keeping order) as run_batch does, so the batch id matches its checkpoint
+        script_ids = list(dict.fromkeys(str(s) for s in script_ids))
+        batch_id, started = start_batch(subject_id, script_ids, max(1, max_in_flight))
+        status_url = f"/correction/batch/{subject_id}/{batch_id}"
+        response = jsonify({
+            "status": "accepted",
+            "batch_id": batch_id,
+            "already_running": not started,
+            "subject_id": str(subject_id),
+            "total": len(script_ids),
+            "status_url": status_url
+        })
+        response.headers['Location'] = status_url
+        return response, 202
+
+    @app.route('/correction/batch/<subject_id>/<batch_id>', methods=['GET', 'OPTIONS'])
+    def batch_status_route(subject_id, batch_id):
+        """Return per-script progress of a batch from its checkpoint."""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        data = load_checkpoint(checkpoint_path_for(batch_id))
+        if data is None or data.get('subject_id') != str(subject_id):
+            return jsonify({"status": "error", "message": f"Unknown batch_id: {batch_id}"}), 404
+
+        return jsonify(summarize(data))
+
+    @app.route('/health', methods=['GET'])
+    def liveness_check():
+        """Cheap liveness check for container health probes (no Django or crew calls)."""
+        return jsonify({"status": "ok", "pid": os.getpid(), "jobs": get_job_manager().stats()})
+
     @app.route('/correction/health', methods=['GET', 'OPTIONS'])
     def health_check():
         """Health check endpoint to verify Django API connectivity."""
@@ -732,7 +1256,7 @@ def run():
             return '', 200
         
         try:
-            response = requests.get(f"{DJANGO_API_BASE_URL}/", timeout=5)
+            response = get_django_client().get(f"{DJANGO_API_BASE_URL}/")
             if response.status_code == 200:
                 return jsonify({
                     "status": "healthy", 
@@ -758,19 +1282,19 @@ def run():
         if request.method == 'OPTIONS':
             return '', 200
         
-        logger.info(f"Testing data retrieval for subject_id: {subject_id}, script_id: {script_id}")
+        logger.info("Testing data retrieval for subject_id: %s, script_id: %s", subject_id, script_id)
         
         try:
             # Test the Django API call directly
             url = f"{DJANGO_API_BASE_URL}/combined-data/?subject_id={subject_id}&script_id={script_id}"
-            logger.info(f"Calling Django API: {url}")
+            logger.info("Calling Django API: %s", url)
             
-            response = requests.get(url)
-            logger.info(f"Django API Response Status: {response.status_code}")
+            response = get_django_client().get(url)
+            logger.info("Django API Response Status: %s", response.status_code)
             
             if response.status_code == 200:
                 raw_data = response.json()
-                logger.info(f"Raw API Response keys: {list(raw_data.keys())}")
+                logger.info("Raw API Response keys: %s", list(raw_data.keys()))
                 
                 # Now test our parsing function
                 ocr_json_data, textract_json_data, context_data, error = get_combined_data(subject_id, script_id)
@@ -828,9 +1352,9 @@ def run():
         try:
             # Test the Django API call directly
             url = f"{DJANGO_API_BASE_URL}/combined-data/?subject_id={subject_id}&script_id={script_id}"
-            logger.info(f"Testing Django API: {url}")
+            logger.info("Testing Django API: %s", url)
             
-            response = requests.get(url, timeout=10)
+            response = get_django_client().get(url, timeout=10)
             
             return jsonify({
                 "subject_id": str(subject_id),
@@ -850,10 +1374,52 @@ def run():
                 "success": False
             })
 
-    # Get port from environment variable (Render sets this) or default to 5000
-    port = int(os.environ.get('PORT', 5055))
-    logger.info(f"Starting Flask app on host=0.0.0.0, port={port}")
-    app.run(host='0.0.0.0', port=port, debug=False)
+    @app.route('/correction/startup', methods=['GET', 'OPTIONS'])
+    def startup_route():
+        """Crew template build metrics recorded at process start."""
+        if request.method == 'OPTIONS':
+            return '', 200
+
+        crew_status = warmup.status()
+        return jsonify({"crew_template": crew_status.pop("crew_template"), "warmup": crew_status})
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics_route():
+        """Prometheus scrape endpoint: stage latencies, token counts, cache and queue metrics (all workers)."""
+        return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+
+    # crewAI takes seconds to import: with "eager" warm-up the crew configs are
+    # loaded and validated before serving (in the gunicorn master when preloading);
+    # otherwise on first use or by the background warm-up once the server is up
+    if settings.CREW_WARMUP == "eager":
+        warmup.load_crew()
+    return app
+
+
+def run():
+    """Start the API server: gunicorn when CORRECTION_SERVER=gunicorn, otherwise Flask's development server."""
+    if settings.SERVER == "gunicorn":
+        serve()
+        return
+
+    abandon_previous_jobs()
+    app = create_app()
+    if settings.CREW_WARMUP == "background":
+        warmup.start_background()
+    # Deliver results left in the outbox by a previous run
+    start_outbox()
+    # Get port from environment variable (Render sets this) or default to 5055
+    port = settings.SERVE_PORT
+    logger.info("Starting Flask app on host=%s, port=%s", settings.SERVE_HOST, port)
+    app.run(host=settings.SERVE_HOST, port=port, debug=False, threaded=True)
+
+
+def serve():
+    """Start the API on gunicorn (workers, threads, preload and recycling from settings)."""
+    from correction.server import serve as serve_gunicorn
+    logger.info("Starting gunicorn on %s:%s with %s workers x %s threads",
+                settings.SERVE_HOST, settings.SERVE_PORT, settings.SERVE_WORKERS, settings.SERVE_THREADS)
+    serve_gunicorn()
                                       
 # -------------------------------
 # Optional CLI: train, test, replay
@@ -864,9 +1430,12 @@ def train():
         print("Usage: python main.py train <n_iterations> <filename>")
         return
     
-    inputs = {'ocr1': 'sample_ocr_text', 'ocr2': 'sample_textract_text', 'context': 'sample_context'}
+    inputs = {'flagged_words': '[]',
+              'suspects': '[]',
+              'upstream': '',
+              'context': 'sample_context'}
     try:
-        Correction().crew().train(n_iterations=int(sys.argv[2]), filename=sys.argv[3], inputs=inputs)
+        warmup.load_crew().new_crew().train(n_iterations=int(sys.argv[2]), filename=sys.argv[3], inputs=inputs)
     except Exception as e:
         raise Exception(f"Error training the crew: {e}")
 
@@ -877,7 +1446,7 @@ def replay():
         return
     
     try:
-        Correction().crew().replay(task_id=sys.argv[2])
+        warmup.load_crew().new_crew().replay(task_id=sys.argv[2])
     except Exception as e:
         raise Exception(f"Error replaying: {e}")
 
@@ -887,32 +1456,86 @@ def test():
         print("Usage: python main.py test <n_iterations> <eval_llm>")
         return
     
-    inputs = {'ocr1': 'sample_ocr_text', 'ocr2': 'sample_textract_text', 'context': 'sample_context'}
+    inputs = {'flagged_words': '[]',
+              'suspects': '[]',
+              'upstream': '',
+              'context': 'sample_context'}
     try:
-        Correction().crew().test(n_iterations=int(sys.argv[2]), eval_llm=sys.argv[3], inputs=inputs)
+        warmup.load_crew().new_crew().test(n_iterations=int(sys.argv[2]), eval_llm=sys.argv[3], inputs=inputs)
     except Exception as e:
         raise Exception(f"Error testing the crew: {e}")
 
+def batch():
+    """Correct a list of scripts of one subject, resuming from the checkpoint if present."""
+    args = sys.argv[1:]
+    if args and args[0] == "batch":
+        args = args[1:]
+    if len(args) < 2:
+        print("Usage: correction batch <subject_id> <script_id,script_id,...|@file> [max_in_flight]")
+        return
+
+    subject_id, scripts = args[0], args[1]
+    if scripts.startswith("@"):
+        with open(scripts[1:], "r", encoding="utf-8") as f:
+            script_ids = [line.strip() for line in f if line.strip()]
+    else:
+        script_ids = [s.strip() for s in scripts.split(",") if s.strip()]
+    max_in_flight = int(args[2]) if len(args) > 2 else settings.BATCH_MAX_IN_FLIGHT
+
+    batch_id = batch_id_for(subject_id, list(dict.fromkeys(script_ids)))
+    batch_lock = lock_batch(batch_id)
+    if batch_lock is None:
+        print(f"Batch {batch_id} is already running in another process")
+        sys.exit(1)
+    try:
+        summary = run_batch(subject_id, script_ids, run_ocr_correction, max_in_flight=max_in_flight)
+    finally:
+        unlock_batch(batch_lock)
+    drain_outbox(settings.OUTBOX_DRAIN_TIMEOUT)
+    print(json.dumps({k: v for k, v in summary.items() if k != "results"}, indent=2))
+    if summary["failed"]:
+        sys.exit(1)
+
 # -------------------------------
 # 🧭 Main entry
 # -------------------------------
-if __name__ == "__main__":
+def main():
+    """Dispatch `correction <command>`; with no command the API server starts."""
+    if "--import-report" in sys.argv[1:]:
+        from correction.importtime import report
+        print(report())
+        return
+
     if len(sys.argv) > 1:
         cmd = sys.argv[1].lower()
         if cmd == "run":
             run()  # 🔥 Start Flask app
+        elif cmd == "serve":
+            serve()
         elif cmd == "train":
             train()
         elif cmd == "replay":
             replay()
         elif cmd == "test":
             test()
+        elif cmd == "batch":
+            batch()
         else:
-            print("Invalid command. Use: run | train | replay | test")
+            print("Invalid command. Use: run | serve | train | replay | test | batch")
+    else:
+        run()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        main()
     else:
-        print("Usage: python main.py <run|train|replay|test>")
+        print("Usage: python main.py <run|serve|train|replay|test|batch>")
         print("Commands:")
         print("  run    - Start the Flask API server")
+        print("  serve  - Start the API server on gunicorn")
         print("  train  - Train the correction crew")
         print("  replay - Replay a specific task")
-        print("  test   - Test the correction crewkk")
\ No newline at end of file
+        print("  test   - Test the correction crewkk")
+        print("  batch  - Correct a list of scripts for one subject")
+        print("Options:")
+        print("  --import-report - Print module import timings of a cold start")
\ No newline at end of file
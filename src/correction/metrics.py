@@ -0,0 +1,305 @@
+"""Process-wide metrics registry (counters, gauges and histograms).
+
+Under gunicorn every worker has its own registry, so a scrape would only see
+the worker that answered it. With `enable_multiprocess` each worker writes its
+series to `<directory>/<pid>.json` every few seconds (and right before
+rendering), and `render_prometheus` merges the files of all workers: counters
+and histograms are summed, and the totals of workers that have exited are
+folded into an archive file so counters never go backwards when a worker is
+recycled. Gauges come from live workers only and are summed, except those
+declared with `shared_gauge` (a value every worker reports alike, such as the
+depth of the shared outbox), which take the maximum.
+"""
+import bisect
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+# Buckets for ratios in [0, 1]
+RATIO_BUCKETS = (0.5, 0.7, 0.8, 0.85, 0.9, 0.93, 0.95, 0.97, 0.98, 0.99, 1.0)
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, Tuple], float] = {}
+_gauges: Dict[Tuple[str, Tuple], float] = {}
+_histograms: Dict[Tuple[str, Tuple], Dict] = {}
+
+# Refresh gauges (queue sizes etc.) before the series are written or rendered
+_collectors: List[Callable[[], None]] = []
+# Gauges merged across workers with max instead of sum
+_shared_gauges = set()
+
+_multiprocess_dir: Optional[str] = None
+_sync_thread: Optional[threading.Thread] = None
+_sync_pid: Optional[int] = None
+
+ARCHIVE_FILE = "archive.json"
+
+
+def _key(name: str, labels: Dict) -> Tuple[str, Tuple]:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def inc_counter(name: str, value: float = 1, **labels) -> None:
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels) -> None:
+    """Record one observation in a bucketed histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = {"buckets": tuple(buckets), "counts": [0] * len(buckets), "sum": 0.0, "count": 0}
+            _histograms[key] = histogram
+        index = bisect.bisect_left(histogram["buckets"], value)
+        if index < len(histogram["counts"]):
+            histogram["counts"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+@contextmanager
+def timed(name: str, job=None, **labels):
+    """Observe the duration of the block in a histogram and, when given, in the job's timings."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        observe(name, elapsed, **labels)
+        if job is not None:
+            timings = job.details.setdefault("timings", {})
+            label = "_".join(str(value) for _, value in sorted(labels.items()))
+            key = f"{name}:{label}" if label else name
+            timings[key] = round(timings.get(key, 0.0) + elapsed, 6)
+
+
+def register_collector(collector: Callable[[], None]) -> None:
+    """Run `collector` (which typically sets gauges) before every write and render of the series."""
+    if collector not in _collectors:
+        _collectors.append(collector)
+
+
+def shared_gauge(name: str) -> None:
+    """Declare a gauge whose value every worker reports alike (merged with max, not sum)."""
+    _shared_gauges.add(name)
+
+
+def _collect():
+    for collector in list(_collectors):
+        try:
+            collector()
+        except Exception as e:
+            logger.warning("Metrics collector failed: %s", e)
+
+
+def snapshot() -> Dict:
+    """Copy of all series as {"counters", "gauges", "histograms"} keyed by (name, labels)."""
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "histograms": {key: dict(value, counts=list(value["counts"])) for key, value in _histograms.items()},
+        }
+
+
+def _format_labels(labels: Tuple, extra: Tuple = ()) -> str:
+    items = tuple(labels) + tuple(extra)
+    if not items:
+        return ""
+    escaped = []
+    for name, value in items:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        escaped.append(f'{name}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Multiprocess mode
+
+def _encode(series: Dict) -> List:
+    return [[name, [list(label) for label in labels], value] for (name, labels), value in series.items()]
+
+
+def _decode(series: List) -> Dict:
+    return {(name, tuple(tuple(label) for label in labels)): value for name, labels, value in series}
+
+
+def _merge_series(data: Dict, other: Dict, gauges: bool = True) -> None:
+    """Add the counters, histograms and (optionally) gauges of `other` into `data`."""
+    for key, value in other["counters"].items():
+        data["counters"][key] = data["counters"].get(key, 0) + value
+    for key, histogram in other["histograms"].items():
+        merged = data["histograms"].get(key)
+        if merged is None or list(merged["buckets"]) != list(histogram["buckets"]):
+            data["histograms"][key] = dict(histogram, counts=list(histogram["counts"]))
+            continue
+        merged["counts"] = [a + b for a, b in zip(merged["counts"], histogram["counts"])]
+        merged["sum"] += histogram["sum"]
+        merged["count"] += histogram["count"]
+    if gauges:
+        for key, value in other["gauges"].items():
+            if key not in data["gauges"]:
+                data["gauges"][key] = value
+            elif key[0] in _shared_gauges:
+                data["gauges"][key] = max(data["gauges"][key], value)
+            else:
+                data["gauges"][key] += value
+
+
+def _empty() -> Dict:
+    return {"counters": {}, "gauges": {}, "histograms": {}}
+
+
+def _read_series(path: str) -> Optional[Dict]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Skipping unreadable metrics file %s: %s", path, e)
+        return None
+    return {kind: _decode(raw.get(kind, [])) for kind in ("counters", "gauges", "histograms")}
+
+
+def _write_series(path: str, data: Dict) -> None:
+    raw = {kind: _encode(data[kind]) for kind in ("counters", "gauges", "histograms")}
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(raw, f, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_process_series() -> None:
+    """Write this process's series to its file in the multiprocess directory."""
+    if _multiprocess_dir is None:
+        return
+    _collect()
+    _write_series(os.path.join(_multiprocess_dir, f"{os.getpid()}.json"), snapshot())
+
+
+def _sync_loop(interval: float):
+    while True:
+        time.sleep(interval)
+        try:
+            write_process_series()
+        except OSError as e:
+            logger.warning("Could not write metrics file: %s", e)
+
+
+def enable_multiprocess(directory: str, interval: float = 5.0) -> None:
+    """Share this process's series with the other workers through `directory` (call after fork)."""
+    global _multiprocess_dir, _sync_thread, _sync_pid
+    os.makedirs(directory, exist_ok=True)
+    _multiprocess_dir = directory
+    if _sync_pid != os.getpid():
+        _sync_pid = os.getpid()
+        _sync_thread = threading.Thread(target=_sync_loop, args=(interval,), name="metrics-sync", daemon=True)
+        _sync_thread.start()
+
+
+def clear_multiprocess_dir(directory: str) -> None:
+    """Remove the series files of a previous server run (call in the master before workers start)."""
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.endswith(".json") or name.endswith(".tmp"):
+            os.remove(os.path.join(directory, name))
+
+
+def merged_snapshot() -> Dict:
+    """Series of all workers: live workers' files plus the archived totals of exited ones."""
+    write_process_series()
+    data = _empty()
+    with open(os.path.join(_multiprocess_dir, ".lock"), "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            archive_path = os.path.join(_multiprocess_dir, ARCHIVE_FILE)
+            archive = _read_series(archive_path) or _empty()
+            archive_changed = False
+            for name in sorted(os.listdir(_multiprocess_dir)):
+                stem, ext = os.path.splitext(name)
+                if ext != ".json" or not stem.isdigit():
+                    continue
+                path = os.path.join(_multiprocess_dir, name)
+                series = _read_series(path)
+                if series is None:
+                    continue
+                if _pid_alive(int(stem)):
+                    _merge_series(data, series)
+                else:
+                    # Exited worker: keep its counters and histograms, drop its gauges
+                    _merge_series(archive, series, gauges=False)
+                    archive_changed = True
+                    os.remove(path)
+            if archive_changed:
+                _write_series(archive_path, archive)
+            _merge_series(data, archive, gauges=False)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return data
+
+
+def render_prometheus() -> str:
+    """All series in the Prometheus text exposition format (version 0.0.4)."""
+    if _multiprocess_dir is not None:
+        data = merged_snapshot()
+    else:
+        _collect()
+        data = snapshot()
+    lines = []
+
+    for kind in ("counters", "gauges"):
+        metric_type = "counter" if kind == "counters" else "gauge"
+        seen = set()
+        for (name, labels), value in sorted(data[kind].items()):
+            if name not in seen:
+                lines.append(f"# TYPE {name} {metric_type}")
+                seen.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+    seen = set()
+    for (name, labels), histogram in sorted(data["histograms"].items()):
+        if name not in seen:
+            lines.append(f"# TYPE {name} histogram")
+            seen.add(name)
+        cumulative = 0
+        for bound, count in zip(histogram["buckets"], histogram["counts"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', repr(float(bound))),))} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {histogram['count']}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram['sum'])}")
+        lines.append(f"{name}_count{_format_labels(labels)} {histogram['count']}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,75 @@
+"""Deterministic text normalization and tokenization for OCR comparison.
+
+This replaces the LLM parser stage: both OCR outputs are lowercased, stripped of
+punctuation and split into word arrays locally, keeping character offsets back
+into the original text so later stages can point at (or splice into) the exact
+source span of every word.
+"""
+import re
+import string
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+# Any run of non-whitespace characters is a candidate word
+_WORD_RE = re.compile(r"\S+")
+
+# Punctuation stripped from the edges of a word
+_EDGE_PUNCTUATION = string.punctuation + "“”‘’«»–—…"
+
+# Separators kept when they sit between two digits (dates, decimals, times)
+_NUMERIC_SEPARATORS = "-./:,"
+
+
+@dataclass
+class NormalizedText:
+    """Normalized word array for one OCR output, with offsets into the source text."""
+    source: str
+    words: List[str] = field(default_factory=list)
+    offsets: List[Tuple[int, int]] = field(default_factory=list)
+
+    def __len__(self):
+        return len(self.words)
+
+    def original(self, index: int) -> str:
+        """Return the word at `index` exactly as it appears in the source text."""
+        start, end = self.offsets[index]
+        return self.source[start:end]
+
+
+def normalize_word(word: str) -> str:
+    """Lowercase a word and drop punctuation, keeping separators inside numbers."""
+    word = word.strip(_EDGE_PUNCTUATION).lower()
+    if not word:
+        return ""
+
+    chars = []
+    last = len(word) - 1
+    for i, ch in enumerate(word):
+        if ch.isalnum():
+            chars.append(ch)
+        elif (ch in _NUMERIC_SEPARATORS and 0 < i < last
+              and word[i - 1].isdigit() and word[i + 1].isdigit()):
+            chars.append(ch)
+    return "".join(chars)
+
+
+def normalize_text(text: str) -> NormalizedText:
+    """Tokenize `text` into normalized words with (start, end) offsets into `text`."""
+    result = NormalizedText(source=text or "")
+
+    for match in _WORD_RE.finditer(result.source):
+        raw = match.group()
+        word = normalize_word(raw)
+        if not word:
+            continue
+
+        # Narrow the offsets to the word without its edge punctuation
+        leading = len(raw) - len(raw.lstrip(_EDGE_PUNCTUATION))
+        trailing = len(raw) - len(raw.rstrip(_EDGE_PUNCTUATION))
+        start = match.start() + leading
+        end = match.end() - trailing
+
+        result.words.append(word)
+        result.offsets.append((start, end))
+
+    return result
@@ -0,0 +1,319 @@
+"""Durable write-behind outbox for correction results.
+
+A finished correction is written to a local SQLite outbox and the job returns
+right away; a background flusher delivers it to Django's compare-text endpoint,
+retrying with capped exponential backoff while Django is unreachable, so a
+backend hiccup no longer turns a paid-for crew result into a failed job.
+
+The outbox holds at most one entry per script_id: a newer result for a script
+that is still waiting replaces the older one (coalescing). Entries survive a
+restart and are picked up by whichever process flushes next; a delivery in
+progress leases its entry so several server workers sharing the file never
+deliver the same result twice at once.
+
+A result Django refuses for good (a 4xx such as a bad payload or a missing
+script), or one still failing after the configured number of attempts, is
+dead-lettered: it stays in the file for inspection but is no longer retried,
+and a newer result for the same script replaces it.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from correction import metrics, settings
+
+logger = logging.getLogger(__name__)
+
+# All workers share one outbox file and report the same depth and lag
+metrics.shared_gauge("correction_outbox_depth")
+metrics.shared_gauge("correction_outbox_lag_seconds")
+metrics.shared_gauge("correction_outbox_dead")
+
+# (script_id, result) -> (success, message)
+Deliver = Callable[[str, str], Tuple[bool, object]]
+
+
+class DeliveryRejected(Exception):
+    """Raised by a deliver function when the result can never be saved; the entry is dead-lettered."""
+
+
+class Outbox:
+    """SQLite-backed queue of results waiting to be saved, one per script_id."""
+
+    def __init__(self, path: str, batch_size: int = 20, lease_seconds: float = 120.0,
+                 backoff_base: float = 1.0, backoff_max: float = 300.0, max_attempts: int = 0):
+        self.path = path
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # 0 retries a failing entry until it is delivered or rejected
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " script_id TEXT PRIMARY KEY,"
+            " result TEXT NOT NULL,"
+            " version INTEGER NOT NULL,"
+            " first_enqueued_at REAL NOT NULL,"
+            " enqueued_at REAL NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " next_attempt_at REAL NOT NULL,"
+            " leased_until REAL NOT NULL DEFAULT 0,"
+            " last_error TEXT,"
+            " dead_at REAL)"
+        )
+        # Outbox files from before dead-lettering
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")]
+        if "dead_at" not in columns:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN dead_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (next_attempt_at)")
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+
+    def put(self, script_id: str, result: str) -> float:
+        """Store a result for delivery; returns its enqueue time, which identifies it in `state`."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT dead_at FROM outbox WHERE script_id = ?", (str(script_id),)
+                ).fetchone()
+                # A replaced entry keeps its first enqueue time so the lag covers the whole wait,
+                # and its lease: the new result is sent once the delivery in flight has finished.
+                # A dead-lettered entry is replaced outright.
+                self._conn.execute(
+                    "INSERT INTO outbox (script_id, result, version, first_enqueued_at, enqueued_at, next_attempt_at)"
+                    " VALUES (?, ?, 1, ?, ?, ?)"
+                    " ON CONFLICT (script_id) DO UPDATE SET"
+                    " result = excluded.result, version = outbox.version + 1, enqueued_at = excluded.enqueued_at,"
+                    " first_enqueued_at = CASE WHEN outbox.dead_at IS NULL THEN outbox.first_enqueued_at"
+                    " ELSE excluded.first_enqueued_at END,"
+                    " attempts = 0, next_attempt_at = excluded.next_attempt_at, last_error = NULL, dead_at = NULL",
+                    (str(script_id), result, now, now, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        metrics.inc_counter("correction_outbox_enqueued_total")
+        if row is not None and row[0] is None:
+            metrics.inc_counter("correction_outbox_coalesced_total")
+            logger.info("Outbox result for script_id %s replaced a result still waiting for delivery", script_id)
+        elif row is not None:
+            logger.info("Outbox result for script_id %s replaced a dead-lettered result", script_id)
+        self._wakeup.set()
+        return now
+
+    def claim(self, limit: Optional[int] = None) -> List[Tuple[str, str, int, float, int]]:
+        """Lease up to `limit` due entries: (script_id, result, version, first_enqueued_at, attempts)."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT script_id, result, version, first_enqueued_at, attempts FROM outbox"
+                    " WHERE dead_at IS NULL AND next_attempt_at <= ? AND leased_until <= ? ORDER BY first_enqueued_at LIMIT ?",
+                    (now, now, limit or self.batch_size)
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET leased_until = ? WHERE script_id = ?",
+                    [(now + self.lease_seconds, row[0]) for row in rows]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def delivered(self, script_id: str, version: int) -> None:
+        """Drop a delivered entry, unless a newer result arrived while it was being sent."""
+        with self._lock:
+            self._conn.execute("DELETE FROM outbox WHERE script_id = ? AND version = ?", (script_id, version))
+            # The newer result's wait starts now that the one it replaced has been saved
+            self._conn.execute("UPDATE outbox SET leased_until = 0, first_enqueued_at = enqueued_at"
+                               " WHERE script_id = ?", (script_id,))
+
+    def failed(self, script_id: str, version: int, attempts: int, error: str) -> float:
+        """Schedule the next attempt of an entry with capped exponential backoff; returns the delay."""
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempts))
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt_at = ?, last_error = ?"
+                " WHERE script_id = ? AND version = ?",
+                (time.time() + delay, error[:1000], script_id, version)
+            )
+            self._conn.execute("UPDATE outbox SET leased_until = 0 WHERE script_id = ?", (script_id,))
+        return delay
+
+    def dead_letter(self, script_id: str, version: int, error: str) -> None:
+        """Stop retrying an entry, unless a newer result arrived while it was being sent."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, dead_at = ?, last_error = ?"
+                " WHERE script_id = ? AND version = ?",
+                (time.time(), error[:1000], script_id, version)
+            )
+            self._conn.execute("UPDATE outbox SET leased_until = 0 WHERE script_id = ?", (script_id,))
+
+    def state(self, script_id: str, enqueued_at: float) -> Dict:
+        """Delivery state of the result `put` at `enqueued_at`.
+
+        "waiting" or "retrying" while it is due to be sent, "dead" once given up on,
+        "replaced" when a newer result for the script is waiting, and "delivered"
+        once the script has nothing left in the outbox.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT enqueued_at, attempts, next_attempt_at, last_error, dead_at FROM outbox WHERE script_id = ?",
+                (str(script_id),)
+            ).fetchone()
+        if row is None:
+            return {"state": "delivered"}
+        entry_enqueued_at, attempts, next_attempt_at, last_error, dead_at = row
+        if entry_enqueued_at != enqueued_at:
+            return {"state": "replaced"}
+        if dead_at is not None:
+            return {"state": "dead", "attempts": attempts, "last_error": last_error}
+        if attempts:
+            return {"state": "retrying", "attempts": attempts, "last_error": last_error,
+                    "next_attempt_at": next_attempt_at}
+        return {"state": "waiting"}
+
+    def flush(self, deliver: Deliver, limit: Optional[int] = None) -> Dict:
+        """Deliver the due entries once; returns the number delivered, failed and dead-lettered."""
+        counts = {"delivered": 0, "failed": 0, "dead": 0}
+        for script_id, result, version, first_enqueued_at, attempts in self.claim(limit):
+            rejected = False
+            try:
+                success, message = deliver(script_id, result)
+            except DeliveryRejected as e:
+                success, message, rejected = False, str(e), True
+            except Exception as e:
+                success, message = False, f"{type(e).__name__}: {e}"
+
+            if success:
+                self.delivered(script_id, version)
+                counts["delivered"] += 1
+                metrics.inc_counter("correction_outbox_deliveries_total", result="ok")
+                metrics.observe("correction_outbox_delivery_lag_seconds", time.time() - first_enqueued_at)
+            elif rejected or (self.max_attempts and attempts + 1 >= self.max_attempts):
+                self.dead_letter(script_id, version, str(message))
+                counts["dead"] += 1
+                metrics.inc_counter("correction_outbox_deliveries_total", result="dead")
+                logger.error("Outbox gave up on the result for script_id %s after %s attempts: %s",
+                             script_id, attempts + 1, message)
+            else:
+                delay = self.failed(script_id, version, attempts, str(message))
+                counts["failed"] += 1
+                metrics.inc_counter("correction_outbox_deliveries_total", result="error")
+                logger.warning("Outbox delivery for script_id %s failed (attempt %s), retrying in %.1fs: %s",
+                               script_id, attempts + 1, delay, message)
+        self.update_gauges()
+        return counts
+
+    def drain(self, deliver: Deliver, timeout: float, interval: float = 1.0) -> bool:
+        """Deliver in the foreground until the outbox is empty or `timeout` passes (e.g. before a CLI exits)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            counts = self.flush(deliver)
+            if self.stats()["depth"] == 0:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if not counts["delivered"]:
+                time.sleep(min(interval, remaining))
+
+    def stats(self) -> Dict:
+        now = time.time()
+        with self._lock:
+            # Dead-lettered entries are no longer waiting: they count apart from the depth and lag
+            depth, oldest, retrying, dead = self._conn.execute(
+                "SELECT COALESCE(SUM(dead_at IS NULL), 0),"
+                " MIN(CASE WHEN dead_at IS NULL THEN first_enqueued_at END),"
+                " COALESCE(SUM(dead_at IS NULL AND attempts > 0), 0), COALESCE(SUM(dead_at IS NOT NULL), 0)"
+                " FROM outbox"
+            ).fetchone()
+        return {
+            "depth": depth,
+            "retrying": retrying,
+            "dead": dead,
+            "lag_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+        }
+
+    def update_gauges(self) -> Dict:
+        stats = self.stats()
+        metrics.set_gauge("correction_outbox_depth", stats["depth"])
+        metrics.set_gauge("correction_outbox_lag_seconds", stats["lag_seconds"])
+        metrics.set_gauge("correction_outbox_dead", stats["dead"])
+        return stats
+
+    # Background flusher
+
+    def start(self, deliver: Deliver, interval: float = 1.0) -> None:
+        """Run the flusher on a daemon thread (once per process; restarted after a fork)."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._thread_pid == os.getpid():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, args=(deliver, interval),
+                                            name="correction-outbox", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self, deliver: Deliver, interval: float):
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                counts = self.flush(deliver)
+            except Exception as e:
+                logger.error("Outbox flush failed: %s", e)
+                counts = {"delivered": 0}
+            # A full batch may mean more entries are due: go again right away
+            if counts["delivered"] < self.batch_size:
+                self._wakeup.wait(interval)
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Stop the flusher after its current pass; waiting entries stay on disk for the next start."""
+        thread = self._thread
+        if thread is None or self._thread_pid != os.getpid():
+            return True
+        self._stopping.set()
+        self._wakeup.set()
+        thread.join(timeout)
+        return not thread.is_alive()
+
+
+_outbox: Optional[Outbox] = None
+_outbox_lock = threading.Lock()
+
+
+def get_outbox() -> Optional[Outbox]:
+    """Return the process-wide outbox, or None when results are saved synchronously."""
+    global _outbox
+    if not settings.OUTBOX_ENABLED:
+        return None
+    if _outbox is None:
+        with _outbox_lock:
+            if _outbox is None:
+                _outbox = Outbox(
+                    settings.OUTBOX_PATH,
+                    batch_size=settings.OUTBOX_BATCH_SIZE,
+                    lease_seconds=settings.OUTBOX_LEASE_SECONDS,
+                    backoff_base=settings.OUTBOX_BACKOFF_BASE,
+                    backoff_max=settings.OUTBOX_BACKOFF_MAX,
+                    max_attempts=settings.OUTBOX_MAX_ATTEMPTS
+                )
+    return _outbox
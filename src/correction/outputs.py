@@ -0,0 +1,97 @@
+"""Helpers for reading the JSON objects the crew tasks return as text.
+
+The report and final tasks have pydantic output models. Their guardrails
+validate each output as soon as the task finishes (pydantic-core parses the
+JSON directly). A failing output sends only that task back to the agent
+with the validation error, and a valid one is replaced by its compact
+canonical JSON.
+"""
+import json
+from typing import Annotated, Any, Dict, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, Field, ValidationError
+
+from correction.alignment import RULE_CODES
+
+
+def extract_json_object(text: str) -> Optional[str]:
+    """The outermost {...} of a task output, tolerating code fences and surrounding prose."""
+    if not text:
+        return None
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.lower().startswith("json"):
+            text = text[4:]
+
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return None
+    return text[start:end + 1]
+
+
+def parse_json_output(text: str) -> Optional[Dict]:
+    """Parse the JSON object in a task output, tolerating code fences and surrounding prose."""
+    candidate = extract_json_object(text)
+    if candidate is None:
+        return None
+    try:
+        data = json.loads(candidate)
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def to_rule_code(value: Any) -> str:
+    """Accept a rule code or a full rule name; anything else is a validation error."""
+    value = str(value).strip()
+    if value in RULE_CODES.values():
+        return value
+    if value in RULE_CODES:
+        return RULE_CODES[value]
+    raise ValueError(f"unknown rule code {value!r} (expected one of {', '.join(RULE_CODES.values())})")
+
+
+RuleCode = Annotated[str, BeforeValidator(to_rule_code)]
+
+# [index, OCR1 word, OCR2 word, rule code]
+FlaggedWord = Tuple[int, str, str, RuleCode]
+
+
+class CorrectionReport(BaseModel):
+    """Output of ocr_report_task."""
+    model_config = ConfigDict(extra="ignore")
+
+    flagged: List[FlaggedWord] = Field(default_factory=list)
+
+
+class CorrectionPatches(BaseModel):
+    """Output of final_output_task: replacement text by OCR1 word index (see correction.patches)."""
+    model_config = ConfigDict(extra="ignore")
+
+    patches: Dict[int, str] = Field(default_factory=dict)
+
+
+def validate_output(text: str, model: Type[BaseModel]) -> BaseModel:
+    """Validate a task output against `model`; raises ValueError with a short reason."""
+    candidate = extract_json_object(text)
+    if candidate is None:
+        raise ValueError("the output contains no JSON object")
+    try:
+        return model.model_validate_json(candidate)
+    except ValidationError as e:
+        problems = "; ".join(f"{'.'.join(str(part) for part in error['loc']) or 'output'}: {error['msg']}"
+                             for error in e.errors()[:5])
+        raise ValueError(problems) from None
+
+
+def output_guardrail(model: Type[BaseModel]):
+    """crewAI guardrail validating a task's output against `model`."""
+    def guardrail(task_output) -> Tuple[bool, Any]:
+        try:
+            parsed = validate_output(task_output.raw, model)
+        except ValueError as e:
+            return False, (f"Invalid output ({e}). Answer again with only the JSON object "
+                           f"described in the expected output.")
+        return True, parsed.model_dump_json()
+    return guardrail
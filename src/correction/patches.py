@@ -0,0 +1,51 @@
+"""Apply word-level corrections to the original OCR1 text.
+
+Replacements are addressed by index into the normalized OCR1 word array and
+spliced into the source text at that word's offsets, so every character outside
+the replaced words is kept exactly as it was.
+"""
+from typing import Collection, Dict, List, Tuple
+
+from correction.alignment import RULE_ALPHANUMERIC, is_alphanumeric_junk
+from correction.normalize import NormalizedText, normalize_word
+
+
+def apply_patches(ocr1: NormalizedText, patches: Dict[int, str]) -> str:
+    """Return the OCR1 source text with the words at the given indices replaced."""
+    if not patches:
+        return ocr1.source
+
+    parts = []
+    cursor = 0
+    for index in sorted(patches):
+        if not 0 <= index < len(ocr1):
+            continue
+        start, end = ocr1.offsets[index]
+        parts.append(ocr1.source[cursor:start])
+        parts.append(patches[index])
+        cursor = end
+    parts.append(ocr1.source[cursor:])
+    return "".join(parts)
+
+
+def filter_patches(patches: Dict[int, str], allowed: Collection[int]) -> Tuple[Dict[int, str], List[int]]:
+    """Split patches into those addressing an allowed (flagged) index and the rejected indices."""
+    accepted, rejected = {}, []
+    for index, replacement in patches.items():
+        if index in allowed:
+            accepted[index] = replacement
+        else:
+            rejected.append(index)
+    return accepted, sorted(rejected)
+
+
+def local_patches(flagged_words: List[Dict]) -> Dict[int, str]:
+    """Corrections that need no LLM: letter/digit junk in OCR1 where OCR2 read a clean word."""
+    patches = {}
+    for flagged in flagged_words:
+        if flagged.get("rule_triggered") != RULE_ALPHANUMERIC:
+            continue
+        replacement = flagged.get("ocr2") or ""
+        if replacement and not is_alphanumeric_junk(normalize_word(replacement)):
+            patches[flagged["index"]] = replacement
+    return patches
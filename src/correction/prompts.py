@@ -0,0 +1,30 @@
+"""Prompt layout: the raw OCR texts are not sent to the crew.
+
+Agent personas (role, goal, backstory) are text-free, and the tasks work from
+the locally computed suspects, which carry both OCR readings of every flagged
+word and its surrounding OCR1 text. `layout_report` checks a finished run for
+copies of the texts in its prompts, so a template change that brings them back
+is noticed; the prompt tokens each task actually used are counted by
+`crew.run_tasks`.
+"""
+from typing import Dict
+
+
+def text_copies(run_crew, text: str) -> int:
+    """Occurrences of `text` in the interpolated personas and task descriptions of a finished run."""
+    if not text:
+        return 0
+    copies = 0
+    for crew_task in run_crew.tasks:
+        crew_agent = crew_task.agent
+        for prompt in (crew_agent.role, crew_agent.goal, crew_agent.backstory, crew_task.description):
+            copies += (prompt or "").count(text)
+    return copies
+
+
+def layout_report(run_crew, ocr1: str, ocr2: str) -> Dict:
+    """Copies of each OCR text found in the run's prompts (expected: none)."""
+    return {
+        "ocr1_copies": text_copies(run_crew, ocr1),
+        "ocr2_copies": text_copies(run_crew, ocr2),
+    }
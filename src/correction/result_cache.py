@@ -0,0 +1,195 @@
+"""Content-addressed cache of final crew results.
+
+Keys hash the exact OCR1 and OCR2 texts and the (whitespace/unicode-normalized)
+context together with a fingerprint of agents.yaml, tasks.yaml, the model
+settings and the settings that pick the correction path (agreement threshold,
+chunking, flagging), so any change to the prompts, model or path invalidates
+old entries. The OCR texts are hashed byte for byte because the result keeps
+the OCR1 layout: two scripts differing only in whitespace must not share a
+result. Values are the final crew output text. Lookups go through an
+in-memory LRU first and then a SQLite file on disk, which is trimmed by age
+and total size.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from correction import metrics, settings
+
+logger = logging.getLogger(__name__)
+
+CONFIG_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config")
+
+# Environment variables that change what the LLM returns
+MODEL_SETTING_VARS = ("MODEL", "OPENAI_MODEL_NAME", "OPENAI_API_BASE", "OPENAI_BASE_URL", "TEMPERATURE")
+
+# Settings that change the correction path (fast path, chunking, flagging) and so the result;
+# their effective values are hashed, defaults included
+PATH_SETTINGS = ("AGREEMENT_THRESHOLD", "CHUNK_MODE", "CHUNK_SIZE",
+                 "LOW_CONFIDENCE_THRESHOLD", "SUSPECT_CONTEXT_WORDS")
+
+# Bump when the stored value format changes
+CACHE_FORMAT_VERSION = "1"
+
+_fingerprint: Optional[str] = None
+
+
+def config_fingerprint() -> str:
+    """Hash of the crew YAML configs and model settings (computed once per process)."""
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256(CACHE_FORMAT_VERSION.encode("utf-8"))
+        for name in ("agents.yaml", "tasks.yaml"):
+            with open(os.path.join(CONFIG_DIR, name), "rb") as f:
+                digest.update(f.read())
+        for var in MODEL_SETTING_VARS:
+            digest.update(f"{var}={os.environ.get(var, '')}\n".encode("utf-8"))
+        for name in PATH_SETTINGS:
+            digest.update(f"settings.{name}={getattr(settings, name)!r}\n".encode("utf-8"))
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+def normalize_input(value) -> str:
+    """Canonical form of an input for hashing: NFC unicode with collapsed whitespace."""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str)
+    return " ".join(unicodedata.normalize("NFC", value).split())
+
+
+def cache_key(ocr1: str, ocr2: str, context) -> str:
+    """Cache key for one crew run (the OCR texts as they are, the context normalized)."""
+    digest = hashlib.sha256(config_fingerprint().encode("utf-8"))
+    for value in (ocr1 or "", ocr2 or "", normalize_input(context)):
+        data = value.encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier (memory LRU + SQLite) cache of crew results."""
+
+    def __init__(self, path: Optional[str], memory_entries: int = 256,
+                 max_bytes: int = 256 * 1024 * 1024, max_age_seconds: float = 30 * 24 * 3600):
+        self.memory_entries = memory_entries
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_trim = 0
+
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)")
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                metrics.inc_counter("correction_result_cache_requests_total", result="hit", tier="memory")
+                return value
+
+            if self._conn is not None:
+                now = time.time()
+                row = self._conn.execute(
+                    "SELECT value, created_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[1] <= self.max_age_seconds:
+                    self._conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._conn.commit()
+                    self._remember(key, row[0])
+                    self.stats["disk_hits"] += 1
+                    metrics.inc_counter("correction_result_cache_requests_total", result="hit", tier="disk")
+                    return row[0]
+
+            self.stats["misses"] += 1
+            metrics.inc_counter("correction_result_cache_requests_total", result="miss", tier="none")
+            return None
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._remember(key, value)
+            if self._conn is None:
+                return
+
+            now = time.time()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now)
+            )
+            self._conn.commit()
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= 50:
+                self._trim(now)
+
+    def _remember(self, key: str, value: str):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _trim(self, now: float):
+        """Drop expired rows, then least recently used rows until under max_bytes (caller holds the lock)."""
+        self._writes_since_trim = 0
+        self._conn.execute("DELETE FROM results WHERE created_at < ?", (now - self.max_age_seconds,))
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total > self.max_bytes:
+            excess = total - self.max_bytes
+            rows = self._conn.execute("SELECT key, size FROM results ORDER BY accessed_at").fetchall()
+            doomed = []
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                doomed.append((key,))
+                excess -= size
+            self._conn.executemany("DELETE FROM results WHERE key = ?", doomed)
+            logger.info("Result cache trimmed %s entries to stay under %s bytes", len(doomed), self.max_bytes)
+        self._conn.commit()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return dict(self.stats, memory_entries=len(self._memory))
+
+
+_cache: Optional[ResultCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> Optional[ResultCache]:
+    """Return the process-wide result cache, or None when caching is disabled."""
+    global _cache
+    if not settings.RESULT_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache(
+                    settings.RESULT_CACHE_PATH or None,
+                    memory_entries=settings.RESULT_CACHE_MEMORY_ENTRIES,
+                    max_bytes=settings.RESULT_CACHE_MAX_BYTES,
+                    max_age_seconds=settings.RESULT_CACHE_MAX_AGE_SECONDS
+                )
+    return _cache
@@ -0,0 +1,71 @@
+"""Persistent `script_id -> compare_text_id` index for compare-text records.
+
+Filled from the responses of compare-text create/update calls and filtered
+lookups, so finding the existing record for a script is a local lookup plus a
+single GET by id, instead of listing every compare-text record.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from correction import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ScriptIndex:
+    """Small SQLite-backed map of script_id to compare_text_id."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS script_index ("
+            " script_id TEXT PRIMARY KEY,"
+            " compare_text_id TEXT NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, script_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT compare_text_id FROM script_index WHERE script_id = ?", (str(script_id),)
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, script_id: str, compare_text_id) -> None:
+        if compare_text_id in (None, ""):
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO script_index (script_id, compare_text_id, updated_at) VALUES (?, ?, ?)",
+                (str(script_id), str(compare_text_id), time.time())
+            )
+            self._conn.commit()
+
+    def delete(self, script_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM script_index WHERE script_id = ?", (str(script_id),))
+            self._conn.commit()
+
+
+_index: Optional[ScriptIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_script_index() -> ScriptIndex:
+    """Return the process-wide script index, opening it on first use."""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = ScriptIndex(settings.SCRIPT_INDEX_PATH)
+    return _index
@@ -0,0 +1,90 @@
+"""Production HTTP serving with gunicorn.
+
+`correction serve` (or CORRECTION_SERVER=gunicorn with `correction run`) runs
+the Flask app from `create_app` on gunicorn's threaded workers instead of the
+development server. With preloading and CORRECTION_CREW_WARMUP=eager the crew
+configs are loaded and validated once in the master before workers fork; with
+"background" each worker loads them on a thread once it is serving. A stopping or recycled worker stops
+taking requests and jobs, then waits for in-flight corrections before exiting;
+every worker runs a flusher for the shared result outbox, writes its metrics
+to a per-worker file that /metrics merges and records its jobs in the shared
+job store, so any worker can answer for any job.
+"""
+from gunicorn.app.base import BaseApplication
+
+from correction import metrics, settings
+from correction.logging_setup import configure_logging
+
+
+def post_fork(server, worker):
+    # The background log listener thread does not survive the fork
+    configure_logging()
+    # Each worker keeps its own registry; /metrics merges the files of all workers
+    metrics.enable_multiprocess(settings.METRICS_DIR, settings.METRICS_SYNC_SECONDS)
+
+
+def post_worker_init(worker):
+    if settings.CREW_WARMUP == "background":
+        from correction import warmup
+        warmup.start_background()
+    # Each worker flushes the shared outbox (the master's thread does not survive the fork)
+    from correction.main import start_outbox
+    start_outbox()
+
+
+def worker_exit(server, worker):
+    from correction.main import drain_jobs
+    from correction.outbox import get_outbox
+    drain_jobs(settings.SERVE_GRACEFUL_TIMEOUT)
+    # Results still waiting stay on disk for the other workers or the next start
+    result_outbox = get_outbox()
+    if result_outbox is not None:
+        result_outbox.stop(settings.OUTBOX_LEASE_SECONDS)
+    # Final totals, folded into the archive once this worker is gone
+    metrics.write_process_series()
+
+
+def gunicorn_options() -> dict:
+    return {
+        "bind": f"{settings.SERVE_HOST}:{settings.SERVE_PORT}",
+        "worker_class": "gthread",
+        "workers": settings.SERVE_WORKERS,
+        "threads": settings.SERVE_THREADS,
+        "preload_app": settings.SERVE_PRELOAD,
+        "timeout": settings.SERVE_TIMEOUT,
+        "graceful_timeout": settings.SERVE_GRACEFUL_TIMEOUT,
+        "max_requests": settings.SERVE_MAX_REQUESTS,
+        "max_requests_jitter": settings.SERVE_MAX_REQUESTS_JITTER,
+        "post_fork": post_fork,
+        "post_worker_init": post_worker_init,
+        "worker_exit": worker_exit,
+    }
+
+
+class CorrectionApplication(BaseApplication):
+    """gunicorn application configured from settings rather than a config file."""
+
+    def __init__(self, options: dict = None):
+        self.options = options if options is not None else gunicorn_options()
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        from correction.main import create_app
+        return create_app()
+
+
+def serve():
+    """Run the API on gunicorn until it is stopped."""
+    from correction.main import abandon_previous_jobs
+    metrics.clear_multiprocess_dir(settings.METRICS_DIR)
+    abandon_previous_jobs()
+    CorrectionApplication().run()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,153 @@
+"""Runtime settings for the correction service, read from the environment."""
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting, falling back to `default` when unset or invalid."""
+    try:
+        return int(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting, falling back to `default` when unset or invalid."""
+    try:
+        return float(os.environ.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting ('1', 'true', 'yes', 'on' are true)."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Directory for local state (checkpoints, indexes, caches)
+STATE_DIR = os.environ.get("CORRECTION_STATE_DIR", os.path.join(os.getcwd(), ".correction_state"))
+
+# Local script_id -> compare_text_id index
+SCRIPT_INDEX_PATH = os.environ.get("CORRECTION_SCRIPT_INDEX_PATH", os.path.join(STATE_DIR, "script_index.sqlite3"))
+
+# Content-addressed cache of crew results (memory LRU + SQLite)
+RESULT_CACHE_ENABLED = env_bool("CORRECTION_RESULT_CACHE", True)
+RESULT_CACHE_PATH = os.environ.get("CORRECTION_RESULT_CACHE_PATH", os.path.join(STATE_DIR, "result_cache.sqlite3"))
+RESULT_CACHE_MEMORY_ENTRIES = env_int("CORRECTION_RESULT_CACHE_MEMORY_ENTRIES", 256)
+RESULT_CACHE_MAX_BYTES = env_int("CORRECTION_RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+RESULT_CACHE_MAX_AGE_SECONDS = env_int("CORRECTION_RESULT_CACHE_MAX_AGE_SECONDS", 30 * 24 * 3600)
+
+# Chunked correction of long scripts: mode is "off", "pages" or "sections";
+# chunk size is the number of pages/sections per chunk
+CHUNK_MODE = os.environ.get("CORRECTION_CHUNK_MODE", "off").strip().lower()
+CHUNK_SIZE = env_int("CORRECTION_CHUNK_SIZE", 2)
+CHUNK_CONCURRENCY = env_int("CORRECTION_CHUNK_CONCURRENCY", 4)
+
+# Agreement fast path: at or above this token agreement between OCR1 and OCR2
+# the result is produced locally without the crew (set above 1 to disable)
+AGREEMENT_THRESHOLD = env_float("CORRECTION_AGREEMENT_THRESHOLD", 0.97)
+
+# Confidence-guided flagging: OCR near-matches from Textract lines below this
+# confidence (0-100) are flagged too; each flagged word reaches the crew with
+# this many words of context on either side
+LOW_CONFIDENCE_THRESHOLD = env_float("CORRECTION_LOW_CONFIDENCE_THRESHOLD", 80.0)
+SUSPECT_CONTEXT_WORDS = env_int("CORRECTION_SUSPECT_CONTEXT_WORDS", 4)
+
+# Record/replay cassettes of Django and LLM traffic: mode is "off", "record"
+# or "replay"; replay timing is "original" (recorded latencies) or "zero"
+CASSETTE_MODE = os.environ.get("CORRECTION_CASSETTE_MODE", "off").strip().lower()
+CASSETTE_DIR = os.environ.get("CORRECTION_CASSETTE_DIR", os.path.join(STATE_DIR, "cassettes"))
+CASSETTE_TIMING = os.environ.get("CORRECTION_CASSETTE_TIMING", "original").strip().lower()
+
+# Times a crew task whose output fails schema validation is sent back to its agent
+OUTPUT_MAX_RETRIES = env_int("CORRECTION_OUTPUT_MAX_RETRIES", 2)
+
+# Durable write-behind outbox: finished results are stored locally and saved to
+# compare-text by a background flusher with retries (off saves synchronously)
+OUTBOX_ENABLED = env_bool("CORRECTION_OUTBOX", True)
+OUTBOX_PATH = os.environ.get("CORRECTION_OUTBOX_PATH", os.path.join(STATE_DIR, "outbox.sqlite3"))
+OUTBOX_FLUSH_INTERVAL = env_float("CORRECTION_OUTBOX_FLUSH_INTERVAL", 1.0)
+OUTBOX_BATCH_SIZE = env_int("CORRECTION_OUTBOX_BATCH_SIZE", 20)
+# Time a delivery in progress keeps its entry from other flushers (should exceed a save's worst case)
+OUTBOX_LEASE_SECONDS = env_float("CORRECTION_OUTBOX_LEASE_SECONDS", 120.0)
+OUTBOX_BACKOFF_BASE = env_float("CORRECTION_OUTBOX_BACKOFF_BASE", 1.0)
+OUTBOX_BACKOFF_MAX = env_float("CORRECTION_OUTBOX_BACKOFF_MAX", 300.0)
+# Failed deliveries of one result before it is dead-lettered (0 retries until Django accepts or rejects it)
+OUTBOX_MAX_ATTEMPTS = env_int("CORRECTION_OUTBOX_MAX_ATTEMPTS", 50)
+# Time a CLI run spends delivering its waiting results before exiting (the rest stay on disk)
+OUTBOX_DRAIN_TIMEOUT = env_float("CORRECTION_OUTBOX_DRAIN_TIMEOUT", 60.0)
+
+# Single-flight deduplication of concurrent corrections of the same script and
+# inputs: "process" (within one process), "file" (also across processes through
+# lock files, e.g. gunicorn workers) or "off"
+SINGLE_FLIGHT_MODE = os.environ.get("CORRECTION_SINGLE_FLIGHT", "process").strip().lower()
+SINGLE_FLIGHT_DIR = os.environ.get("CORRECTION_SINGLE_FLIGHT_DIR", os.path.join(STATE_DIR, "singleflight"))
+# Seconds a finished flight's result file is kept for waiting processes before it is deleted
+SINGLE_FLIGHT_RESULT_TTL = env_float("CORRECTION_SINGLE_FLIGHT_RESULT_TTL", 30.0)
+
+# Background correction jobs
+JOB_WORKERS = env_int("CORRECTION_JOB_WORKERS", 4)
+JOB_MAX_PENDING = env_int("CORRECTION_JOB_MAX_PENDING", 200)
+JOB_RETENTION_SECONDS = env_int("CORRECTION_JOB_RETENTION_SECONDS", 3600)
+# Job status and events shared by all server workers, so any worker can answer for any job
+JOB_STORE_ENABLED = env_bool("CORRECTION_JOB_STORE", True)
+JOB_STORE_PATH = os.environ.get("CORRECTION_JOB_STORE_PATH", os.path.join(STATE_DIR, "jobs.sqlite3"))
+
+# HTTP serving: "gunicorn" (production) or "flask" (development server)
+SERVER = os.environ.get("CORRECTION_SERVER", "flask").strip().lower()
+SERVE_HOST = os.environ.get("CORRECTION_SERVE_HOST", "0.0.0.0")
+SERVE_PORT = env_int("PORT", 5055)
+SERVE_WORKERS = env_int("CORRECTION_SERVE_WORKERS", 2)
+SERVE_THREADS = env_int("CORRECTION_SERVE_THREADS", 8)
+# Threads per worker kept free of long requests (sync corrections, event streams)
+# so health and diagnostics routes are always answered
+SERVE_RESERVED_THREADS = env_int("CORRECTION_SERVE_RESERVED_THREADS", 2)
+LONG_REQUEST_SLOTS = max(1, SERVE_THREADS - SERVE_RESERVED_THREADS)
+SERVE_PRELOAD = env_bool("CORRECTION_SERVE_PRELOAD", True)
+SERVE_TIMEOUT = env_int("CORRECTION_SERVE_TIMEOUT", 120)
+# Time a stopping worker gets to finish in-flight requests and correction jobs
+SERVE_GRACEFUL_TIMEOUT = env_int("CORRECTION_SERVE_GRACEFUL_TIMEOUT", 300)
+# Recycle a worker after this many requests (0 disables), with random jitter
+SERVE_MAX_REQUESTS = env_int("CORRECTION_SERVE_MAX_REQUESTS", 1000)
+SERVE_MAX_REQUESTS_JITTER = env_int("CORRECTION_SERVE_MAX_REQUESTS_JITTER", 100)
+
+# Per-worker metrics files merged on every scrape, so /metrics covers all gunicorn
+# workers; each worker rewrites its file every METRICS_SYNC_SECONDS
+METRICS_DIR = os.environ.get("CORRECTION_METRICS_DIR", os.path.join(STATE_DIR, "metrics"))
+METRICS_SYNC_SECONDS = env_float("CORRECTION_METRICS_SYNC_SECONDS", 5.0)
+
+# Crew warm-up: "lazy" loads crewAI on the first correction, "background" on a
+# thread once the server is up, "eager" before the server starts
+CREW_WARMUP = os.environ.get("CORRECTION_CREW_WARMUP", "background").strip().lower()
+
+# Subject-level batch correction
+BATCH_MAX_IN_FLIGHT = env_int("CORRECTION_BATCH_MAX_IN_FLIGHT", 4)
+
+# Django backend (transback); point at a local stub server for load tests
+DJANGO_API_BASE_URL = os.environ.get("DJANGO_API_BASE_URL", "https://transback.transpoze.ai")
+DJANGO_POOL_SIZE = env_int("DJANGO_POOL_SIZE", 20)
+DJANGO_CONNECT_TIMEOUT = env_float("DJANGO_CONNECT_TIMEOUT", 3.05)
+DJANGO_READ_TIMEOUT = env_float("DJANGO_READ_TIMEOUT", 30.0)
+DJANGO_MAX_RETRIES = env_int("DJANGO_MAX_RETRIES", 3)
+DJANGO_BACKOFF_BASE = env_float("DJANGO_BACKOFF_BASE", 0.25)
+DJANGO_BACKOFF_MAX = env_float("DJANGO_BACKOFF_MAX", 4.0)
+DJANGO_BREAKER_THRESHOLD = env_int("DJANGO_BREAKER_THRESHOLD", 5)
+DJANGO_BREAKER_RESET_SECONDS = env_float("DJANGO_BREAKER_RESET_SECONDS", 30.0)
+
+# Per-endpoint (connect, read) timeouts, keyed by the first URL path segment
+DJANGO_TIMEOUTS = {
+    "combined-data": (DJANGO_CONNECT_TIMEOUT, env_float("DJANGO_TIMEOUT_COMBINED_DATA", 30.0)),
+    "compare-text": (DJANGO_CONNECT_TIMEOUT, env_float("DJANGO_TIMEOUT_COMPARE_TEXT", 15.0)),
+    "root": (DJANGO_CONNECT_TIMEOUT, env_float("DJANGO_TIMEOUT_HEALTH", 5.0)),
+}
+
+# Logging: "json" writes one structured line per record through a background
+# queue; "verbose" keeps the old request/response header dumps, full text
+# prints and verbose crew output
+LOG_MODE = os.environ.get("CORRECTION_LOG_MODE", "json").strip().lower()
+LOG_LEVEL = os.environ.get("CORRECTION_LOG_LEVEL", "INFO").strip().upper()
+# Fraction of correction runs whose full payloads (texts, Django responses) are logged in json mode
+LOG_PAYLOAD_SAMPLE_RATE = env_float("CORRECTION_LOG_PAYLOAD_SAMPLE_RATE", 0.01)
+CREW_VERBOSE = env_bool("CORRECTION_CREW_VERBOSE", LOG_MODE == "verbose")
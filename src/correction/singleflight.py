@@ -0,0 +1,222 @@
+"""Single-flight deduplication of concurrent corrections.
+
+Two corrections of the same script with the same inputs (a double-submitted
+form, two teachers opening one script, a batch overlapping a request) would
+each run the crew and race to save. Runs go through `SingleFlight.do` keyed on
+(subject_id, script_id, input hash): the first caller (the leader) runs the
+pipeline, callers arriving while it runs wait and get its result, so the crew
+runs and the result is saved once.
+
+In "file" mode the guard also spans processes (e.g. gunicorn workers): the
+leader holds an exclusive lock on a small per-key file under the state
+directory and writes its result into it, which waiting processes read once the
+lock is released. The file (and the student text in it) only outlives the
+flight by `result_ttl` seconds, long enough for the waiting processes to read
+it: a sweep then deletes it. A leader that raises (e.g. a cancelled job)
+shares nothing: one of its followers runs the pipeline itself.
+"""
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional, Tuple
+
+from correction import metrics, settings
+
+logger = logging.getLogger(__name__)
+
+OFF = "off"
+PROCESS = "process"
+FILE = "file"
+
+# How often a waiting caller runs its wait check (e.g. job cancellation)
+WAIT_POLL_SECONDS = 0.5
+
+
+class _Flight:
+    """One in-progress call and, once finished, its result."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.failed = False
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its result with concurrent callers."""
+
+    def __init__(self, lock_dir: Optional[str] = None, result_ttl: float = 30.0):
+        self.lock_dir = lock_dir
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        self._flights: Dict[Hashable, _Flight] = {}
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+            # Files left behind by processes that stopped before their sweep
+            self.sweep()
+
+    def do(self, key: Tuple, fn: Callable[[], object],
+           wait_check: Optional[Callable[[], None]] = None) -> Tuple[object, bool]:
+        """Return (result, shared): `fn()` run by this caller, or the result of a concurrent leader.
+
+        `wait_check` is called periodically while waiting and may raise to stop waiting.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+
+            if leader:
+                break
+
+            metrics.inc_counter("correction_single_flight_total", role="follower")
+            logger.info("Waiting for the correction already running for %s", key[:2])
+            while not flight.done.wait(WAIT_POLL_SECONDS):
+                if wait_check is not None:
+                    wait_check()
+            if not flight.failed:
+                return flight.result, True
+            # The leader raised: take over
+
+        metrics.inc_counter("correction_single_flight_total", role="leader")
+        try:
+            if self.lock_dir:
+                flight.result, shared = self._do_locked(key, fn, wait_check)
+            else:
+                flight.result, shared = fn(), False
+            return flight.result, shared
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def lock_path(self, key: Tuple) -> str:
+        digest = hashlib.sha256("\x1f".join(str(part) for part in key).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.lock_dir, f"{digest}.lock")
+
+    def _open_locked(self, path: str, key: Tuple, wait_check: Optional[Callable[[], None]]):
+        """Open and exclusively lock the key's file; returns (file, time waiting started or None)."""
+        waiting_since = None
+        while True:
+            f = open(path, "a+", encoding="utf-8")
+            try:
+                while True:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if waiting_since is None:
+                            waiting_since = time.time()
+                            metrics.inc_counter("correction_single_flight_total", role="process_follower")
+                            logger.info("Waiting for the correction another process runs for %s", key[:2])
+                        if wait_check is not None:
+                            wait_check()
+                        time.sleep(WAIT_POLL_SECONDS)
+                # A sweep may have deleted the file while we waited: lock the one now at the path
+                if self._is_current(f, path):
+                    return f, waiting_since
+            except BaseException:
+                f.close()
+                raise
+            f.close()
+
+    @staticmethod
+    def _is_current(f, path: str) -> bool:
+        try:
+            return os.fstat(f.fileno()).st_ino == os.stat(path).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _do_locked(self, key: Tuple, fn: Callable[[], object],
+                   wait_check: Optional[Callable[[], None]]) -> Tuple[object, bool]:
+        """Cross-process leg: run under the key's file lock, or share the result another process wrote."""
+        f, waiting_since = self._open_locked(self.lock_path(key), key, wait_check)
+        try:
+            if waiting_since is not None:
+                shared = self._read_result(f, waiting_since)
+                if shared is not None:
+                    return shared, True
+
+            result = fn()
+            self._write_result(f, result)
+            return result, False
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+            self._schedule_sweep()
+
+    def _schedule_sweep(self):
+        timer = threading.Timer(self.result_ttl, self.sweep)
+        timer.daemon = True
+        timer.start()
+
+    def sweep(self) -> int:
+        """Delete the files of flights that finished more than `result_ttl` seconds ago."""
+        removed = 0
+        cutoff = time.time() - self.result_ttl
+        for name in os.listdir(self.lock_dir):
+            if not name.endswith(".lock"):
+                continue
+            path = os.path.join(self.lock_dir, name)
+            try:
+                if os.stat(path).st_mtime > cutoff:
+                    continue
+                with open(path, "a+", encoding="utf-8") as f:
+                    try:
+                        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        continue  # a flight is running on it
+                    try:
+                        if self._is_current(f, path):
+                            os.unlink(path)
+                            removed += 1
+                    finally:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+            except FileNotFoundError:
+                continue
+        return removed
+
+    @staticmethod
+    def _read_result(f, finished_after: float):
+        """The result a leader in another process finished after `finished_after`, if any."""
+        f.seek(0)
+        try:
+            data = json.loads(f.read() or "null")
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or data.get("finished_at", 0) < finished_after:
+            return None
+        result = data.get("result")
+        return tuple(result) if isinstance(result, list) else result
+
+    @staticmethod
+    def _write_result(f, result):
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps({"finished_at": time.time(), "result": result}, default=str))
+        f.flush()
+
+
+_single_flight: Optional[SingleFlight] = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight() -> Optional[SingleFlight]:
+    """Return the process-wide guard, or None when deduplication is off."""
+    global _single_flight
+    if settings.SINGLE_FLIGHT_MODE not in (PROCESS, FILE):
+        return None
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                lock_dir = settings.SINGLE_FLIGHT_DIR if settings.SINGLE_FLIGHT_MODE == FILE else None
+                _single_flight = SingleFlight(lock_dir, settings.SINGLE_FLIGHT_RESULT_TTL)
+    return _single_flight
@@ -0,0 +1,55 @@
+"""Compact suspect list handed to the crew instead of the full flagged-word records.
+
+Each suspect carries the OCR1 word index, both readings, the code of the rule
+that flagged it (see alignment.RULE_CODES), the Textract confidence when known
+and a short window of the surrounding OCR1 text (with the word marked), so the
+agents can judge every word in context without re-reading the whole script
+for it.
+"""
+import json
+from typing import Dict, List
+
+from correction.alignment import RULE_CODES
+from correction.normalize import NormalizedText
+
+# Words of OCR1 context kept on each side of a suspect
+DEFAULT_CONTEXT_WORDS = 4
+
+MARK_OPEN = "[["
+MARK_CLOSE = "]]"
+
+
+def context_window(ocr1: NormalizedText, index: int, words: int = DEFAULT_CONTEXT_WORDS) -> str:
+    """OCR1 source text around word `index`, with that word wrapped in [[ ]]."""
+    first = max(0, index - words)
+    last = min(len(ocr1) - 1, index + words)
+    start, end = ocr1.offsets[index]
+    before = ocr1.source[ocr1.offsets[first][0]:start]
+    after = ocr1.source[end:ocr1.offsets[last][1]]
+    return " ".join(f"{before}{MARK_OPEN}{ocr1.source[start:end]}{MARK_CLOSE}{after}".split())
+
+
+def build_suspects(ocr1: NormalizedText, flagged_words: List[Dict],
+                   context_words: int = DEFAULT_CONTEXT_WORDS) -> List[Dict]:
+    """One compact entry per flagged word, in OCR1 order."""
+    suspects = []
+    for flagged in sorted(flagged_words, key=lambda entry: entry["index"]):
+        index = flagged["index"]
+        if not 0 <= index < len(ocr1):
+            continue
+        suspect = {
+            "i": index,
+            "ocr1": flagged.get("ocr1", ""),
+            "ocr2": flagged.get("ocr2", ""),
+            "rule": RULE_CODES.get(flagged.get("rule_triggered", ""), flagged.get("rule_triggered", "")),
+        }
+        if flagged.get("confidence") is not None:
+            suspect["conf"] = flagged["confidence"]
+        suspect["ctx"] = context_window(ocr1, index, context_words)
+        suspects.append(suspect)
+    return suspects
+
+
+def suspects_json(suspects: List[Dict]) -> str:
+    """Serialize suspects for a prompt without any padding whitespace."""
+    return json.dumps(suspects, ensure_ascii=False, separators=(",", ":"))
@@ -0,0 +1,239 @@
+"""Single-pass model of the Textract payload stored in the Django backend.
+
+The payload comes in a few shapes: a list of page objects (with either an
+`extracted_text.extracted_lines` block or a direct `extracted_lines` list), a
+dict with `pages`, the same wrapped in `textract_results`, or plain text.
+`parse_textract` walks it once and keeps the lines in flat columns (text,
+confidence, page index) plus the per-page metadata used for statistics, so the
+joined text, the per-page texts, the statistics and the confidence arrays all
+come from the same traversal.
+"""
+import bisect
+import math
+from array import array
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from correction.normalize import NormalizedText
+
+MISSING_CONFIDENCE = math.nan
+
+
+@dataclass(slots=True)
+class TextractPage:
+    """One page: its slice of the line columns and the metadata reported in statistics."""
+    index: int
+    first_line: int = 0
+    line_count: int = 0
+    total_lines: int = 0
+    total_blocks: int = 0
+    details: Optional[Dict] = None
+
+
+@dataclass(slots=True)
+class TextractDocument:
+    """Lines of a Textract payload in column form; `raw_text` is set for plain-text payloads."""
+    total_pages: int = 0
+    pages: List[TextractPage] = field(default_factory=list)
+    line_text: List[str] = field(default_factory=list)
+    line_confidence: array = field(default_factory=lambda: array("d"))
+    line_page: array = field(default_factory=lambda: array("i"))
+    raw_text: Optional[str] = None
+    missing_confidences: int = 0
+
+    def __len__(self) -> int:
+        return len(self.line_text)
+
+    @property
+    def text(self) -> str:
+        """All non-empty lines joined with single spaces (or the raw text)."""
+        if self.raw_text is not None:
+            return self.raw_text
+        return " ".join(filter(None, self.line_text))
+
+    def page_texts(self) -> List[str]:
+        """Joined text of each page, in order."""
+        if self.raw_text is not None:
+            return [self.raw_text] if self.raw_text else []
+        return [
+            " ".join(filter(None, self.line_text[page.first_line:page.first_line + page.line_count]))
+            for page in self.pages
+        ]
+
+    def confidences(self) -> List[float]:
+        """Confidence of every line that reported one."""
+        if not self.missing_confidences:
+            return self.line_confidence.tolist()
+        return [value for value in self.line_confidence if value == value]  # NaN marks a missing value
+
+    def word_confidences(self, normalized: NormalizedText) -> List[float]:
+        """Confidence of the line each word of `normalized` (tokens of `self.text`) came from.
+
+        Textract reports 0-100; scores on a 0-1 scale are rescaled. Words from
+        lines without a confidence (or from plain-text payloads) get NaN.
+        """
+        if self.raw_text is not None or not len(normalized):
+            return [MISSING_CONFIDENCE] * len(normalized)
+
+        # Start offset and confidence of every line that made it into the joined text
+        starts, confidences, offset = [], [], 0
+        for text, confidence in zip(self.line_text, self.line_confidence):
+            if not text:
+                continue
+            starts.append(offset)
+            confidences.append(confidence)
+            offset += len(text) + 1
+
+        scale = 100.0 if confidences and max((c for c in confidences if c == c), default=100.0) <= 1.0 else 1.0
+        return [confidences[bisect.bisect_right(starts, start) - 1] * scale for start, _ in normalized.offsets]
+
+    def statistics(self) -> Dict:
+        """Page/line/block counts and confidence summary (the dict returned by get_textract_statistics)."""
+        scores = self.confidences()
+        stats = {
+            'total_pages': self.total_pages,
+            'total_lines': sum(page.total_lines for page in self.pages if page.details is not None),
+            'total_blocks': sum(page.total_blocks for page in self.pages if page.details is not None),
+            'confidence_scores': scores,
+            'page_details': [page.details for page in self.pages if page.details is not None]
+        }
+        if scores:
+            stats['average_confidence'] = sum(scores) / len(scores)
+            stats['min_confidence'] = min(scores)
+            stats['max_confidence'] = max(scores)
+        return stats
+
+    def _add_line(self, text: str, confidence, page_index: int):
+        self.line_text.append(text)
+        self.line_page.append(page_index)
+        if confidence is None:
+            self.line_confidence.append(MISSING_CONFIDENCE)
+            self.missing_confidences += 1
+            return
+        try:
+            self.line_confidence.append(float(confidence))
+        except (TypeError, ValueError):
+            self.line_confidence.append(MISSING_CONFIDENCE)
+            self.missing_confidences += 1
+
+    def _add_lines(self, page: TextractPage, lines: list):
+        # Hot loop on large scripts: bind the column appends once
+        add_text, add_confidence = self.line_text.append, self.line_confidence.append
+        added = 0
+        for line in lines:
+            if line.__class__ is not dict:
+                continue
+            text = line.get('text')
+            confidence = line.get('confidence')
+            if text is None and confidence is None:
+                continue
+            add_text(text.strip() if text.__class__ is str else "")
+            if confidence.__class__ is float or confidence.__class__ is int:
+                add_confidence(confidence)
+            elif confidence is None:
+                add_confidence(MISSING_CONFIDENCE)
+                self.missing_confidences += 1
+            else:
+                try:
+                    add_confidence(float(confidence))
+                except (TypeError, ValueError):
+                    add_confidence(MISSING_CONFIDENCE)
+                    self.missing_confidences += 1
+            added += 1
+        self.line_page.extend(array("i", [page.index]) * added)
+
+    def _add_page(self, page: TextractPage, lines: Optional[list] = None, text: Optional[str] = None):
+        page.first_line = len(self.line_text)
+        if lines is not None:
+            self._add_lines(page, lines)
+        elif text is not None:
+            self._add_line(text.strip(), None, page.index)
+        page.line_count = len(self.line_text) - page.first_line
+        self.pages.append(page)
+
+
+def _parse_page_list(document: TextractDocument, pages: list):
+    """Pages as a list of page objects (the shape returned by combined-data)."""
+    document.total_pages = len(pages)
+    for page_index, page in enumerate(pages):
+        model = TextractPage(page_index)
+        if isinstance(page, str):
+            document._add_page(model, text=page)
+            continue
+        if not isinstance(page, dict):
+            document._add_page(model)
+            continue
+
+        extracted_text = page.get('extracted_text')
+        if isinstance(extracted_text, dict):
+            model.total_lines = extracted_text.get('total_lines', 0)
+            model.total_blocks = extracted_text.get('total_blocks', 0)
+            model.details = {
+                'page_number': page.get('page_number', 'unknown'),
+                'total_lines': model.total_lines,
+                'total_blocks': model.total_blocks,
+                's3_key': extracted_text.get('s3_key', 'unknown'),
+                'job_id': extracted_text.get('job_id', 'unknown'),
+                'confidence_score': page.get('confidence_score', 0),
+                'processing_status': page.get('processing_status', 'unknown')
+            }
+            lines = extracted_text.get('extracted_lines')
+            document._add_page(model, lines=lines if isinstance(lines, list) else [])
+        elif isinstance(page.get('extracted_lines'), list):
+            lines = page['extracted_lines']
+            model.total_lines = len(lines)
+            model.total_blocks = page.get('total_blocks', 0)
+            model.details = {
+                'page_number': page.get('page_number', 'unknown'),
+                'total_lines': model.total_lines,
+                'total_blocks': model.total_blocks,
+                'confidence_score': page.get('confidence_score', 0)
+            }
+            document._add_page(model, lines=lines)
+        elif isinstance(page.get('text'), str):
+            document._add_page(model, text=page['text'])
+        else:
+            document._add_page(model)
+
+
+def _parse_page_dict(document: TextractDocument, pages: list):
+    """Pages under a `pages` key (the shape stored by the Textract worker)."""
+    document.total_pages = len(pages)
+    for page_index, page in enumerate(pages):
+        model = TextractPage(page_index)
+        if not isinstance(page, dict):
+            document._add_page(model)
+            continue
+        model.total_lines = page.get('total_lines', 0)
+        model.total_blocks = page.get('total_blocks', 0)
+        model.details = {
+            'page_number': page.get('page_number', 'unknown'),
+            'total_lines': model.total_lines,
+            'total_blocks': model.total_blocks,
+            'image_filename': page.get('image_filename', 'unknown'),
+            'average_confidence': page.get('average_confidence', 0)
+        }
+        lines = page.get('extracted_lines')
+        document._add_page(model, lines=lines if isinstance(lines, list) else [])
+
+
+def parse_textract(textract_json_data) -> TextractDocument:
+    """Build the page/line model of a Textract payload in one pass."""
+    document = TextractDocument()
+    data = textract_json_data
+    # Unwrap any number of textract_results envelopes
+    while isinstance(data, dict) and 'textract_results' in data:
+        data = data['textract_results']
+
+    if not data:
+        return document
+    if isinstance(data, str):
+        document.raw_text = data
+    elif isinstance(data, list):
+        _parse_page_list(document, data)
+    elif isinstance(data, dict):
+        if isinstance(data.get('pages'), list):
+            _parse_page_dict(document, data['pages'])
+        elif 'text' in data:
+            document.raw_text = data['text']
+    return document
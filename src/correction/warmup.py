@@ -0,0 +1,76 @@
+"""Deferred loading of the correction crew.
+
+Importing crewAI (and the langchain/litellm stack under it) takes seconds, so
+neither the server nor the CLI imports `correction.crew` at start-up. The first
+correction (or the optional background warm-up thread started once the server
+is up) imports it and builds the crew template; everything else, including the
+health and diagnostic routes, runs without it.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from correction import metrics
+
+logger = logging.getLogger(__name__)
+
+# Every worker loads the crew once: across workers, report the slowest load
+metrics.shared_gauge("correction_crew_import_seconds")
+metrics.shared_gauge("correction_crew_template_build_seconds")
+
+IDLE = "idle"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+
+_lock = threading.Lock()
+_crew_module = None
+_state: Dict = {"status": IDLE, "import_seconds": None, "error": None}
+_thread: Optional[threading.Thread] = None
+
+
+def load_crew():
+    """Import `correction.crew` and build its template once; returns the module."""
+    global _crew_module
+    if _crew_module is not None:
+        return _crew_module
+    with _lock:
+        if _crew_module is None:
+            _state["status"] = LOADING
+            started = time.perf_counter()
+            try:
+                from correction import crew
+                import_seconds = time.perf_counter() - started
+                crew.get_crew_template()
+            except Exception as e:
+                _state.update(status=FAILED, error=str(e))
+                raise
+            _state.update(status=READY, import_seconds=import_seconds, error=None)
+            metrics.set_gauge("correction_crew_import_seconds", import_seconds)
+            logger.info("Crew loaded in %.3fs (import %.3fs)", time.perf_counter() - started, import_seconds)
+            _crew_module = crew
+    return _crew_module
+
+
+def _warm_up():
+    try:
+        load_crew()
+    except Exception as e:
+        logger.error("Crew warm-up failed: %s", e)
+
+
+def start_background() -> None:
+    """Load the crew on a daemon thread so the first correction doesn't pay for it."""
+    global _thread
+    with _lock:
+        if _crew_module is not None or _thread is not None:
+            return
+        _thread = threading.Thread(target=_warm_up, name="correction-crew-warmup", daemon=True)
+    _thread.start()
+
+
+def status() -> Dict:
+    """Warm-up state and, once loaded, the crew template build stats."""
+    crew_module = _crew_module
+    return dict(_state, crew_template=crew_module.crew_startup_stats() if crew_module is not None else {})
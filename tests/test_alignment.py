@@ -0,0 +1,116 @@
+"""Behavioural tests for the local token alignment and comparison rules (run with pytest)."""
+import random
+
+from correction.alignment import (MAX_BLOCK_SIZE, RULE_ALPHANUMERIC, RULE_MISMATCH, agreement_score,
+                                  align_tokens, compare_tokens, levenshtein)
+from correction.normalize import normalize_text
+
+
+def assert_complete(ocr1, ocr2, pairs):
+    """Every word of both sides appears exactly once, in order."""
+    left = [i for i, _ in pairs if i is not None]
+    right = [j for _, j in pairs if j is not None]
+    assert left == list(range(len(ocr1)))
+    assert right == list(range(len(ocr2)))
+
+
+def words(count, prefix, seed=0):
+    """`count` distinct-looking letter-only words starting with `prefix`."""
+    rng = random.Random(seed)
+    return " ".join(prefix + "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(7))
+                    for _ in range(count))
+
+
+def test_identical_texts_align_one_to_one():
+    ocr1 = normalize_text("The quick brown fox, the lazy dog.")
+    ocr2 = normalize_text("the  quick brown fox the lazy dog")
+
+    pairs = align_tokens(ocr1, ocr2)
+
+    assert pairs == [(i, i) for i in range(len(ocr1))]
+    assert agreement_score(ocr1, ocr2, pairs) == 1.0
+    assert compare_tokens(ocr1, ocr2, pairs) == []
+
+
+def test_empty_sides():
+    empty = normalize_text("")
+    text = normalize_text("one two three")
+
+    assert align_tokens(empty, empty) == []
+    assert agreement_score(empty, empty) == 1.0
+
+    pairs = align_tokens(text, empty)
+    assert pairs == [(0, None), (1, None), (2, None)]
+    assert agreement_score(text, empty, pairs) == 0.0
+    # Words missing from the other OCR are omissions, not errors
+    assert compare_tokens(text, empty, pairs) == []
+
+    pairs = align_tokens(empty, text)
+    assert pairs == [(None, 0), (None, 1), (None, 2)]
+    assert compare_tokens(empty, text, pairs) == []
+
+
+def test_all_different_words_are_flagged():
+    ocr1 = normalize_text("alpha bravo charlie delta")
+    ocr2 = normalize_text("kilo lima mike november oscar")
+
+    pairs = align_tokens(ocr1, ocr2)
+    flagged = compare_tokens(ocr1, ocr2, pairs)
+
+    assert_complete(ocr1, ocr2, pairs)
+    assert agreement_score(ocr1, ocr2, pairs) == 0.0
+    assert [entry["index"] for entry in flagged] == [0, 1, 2, 3]
+    assert {entry["rule_triggered"] for entry in flagged} == {RULE_MISMATCH}
+
+
+def test_long_insert_keeps_the_surrounding_words_aligned():
+    before, after = words(50, "a", seed=1), words(50, "b", seed=2)
+    inserted = words(MAX_BLOCK_SIZE + 50, "c", seed=3)
+    ocr1 = normalize_text(f"{before} {after}")
+    ocr2 = normalize_text(f"{before} {inserted} {after}")
+
+    pairs = align_tokens(ocr1, ocr2)
+
+    assert_complete(ocr1, ocr2, pairs)
+    matched = [(i, j) for i, j in pairs if i is not None and j is not None]
+    assert len(matched) == 100
+    assert all(ocr1.words[i] == ocr2.words[j] for i, j in matched)
+    assert compare_tokens(ocr1, ocr2, pairs) == []
+
+
+def test_long_replaced_stretch_still_covers_every_word():
+    shared = words(20, "s", seed=4)
+    ocr1 = normalize_text(f"{shared} {words(MAX_BLOCK_SIZE + 10, 'p', seed=5)} {shared}")
+    ocr2 = normalize_text(f"{shared} {words(MAX_BLOCK_SIZE + 30, 'q', seed=6)} {shared}")
+
+    pairs = align_tokens(ocr1, ocr2)
+
+    assert_complete(ocr1, ocr2, pairs)
+    assert pairs[:20] == [(i, i) for i in range(20)]
+    assert pairs[-1] == (len(ocr1) - 1, len(ocr2) - 1)
+
+
+def test_repeated_words_without_anchors():
+    ocr1 = normalize_text("the the the cat the the")
+    ocr2 = normalize_text("the the the the cot the")
+
+    pairs = align_tokens(ocr1, ocr2)
+
+    assert_complete(ocr1, ocr2, pairs)
+    assert agreement_score(ocr1, ocr2, pairs) >= 0.8
+
+
+def test_misspellings_and_junk():
+    ocr1 = normalize_text("The colour of the 0rder on the 2nd of May")
+    ocr2 = normalize_text("The color of the order on the 2nd of May")
+
+    flagged = compare_tokens(ocr1, ocr2)
+
+    # A near-match with no confidence data is a shared misspelling; letter/digit junk is always flagged
+    assert [(entry["word"], entry["rule_triggered"]) for entry in flagged] == [("0rder", RULE_ALPHANUMERIC)]
+
+
+def test_levenshtein_stops_past_max_distance():
+    assert levenshtein("kitten", "sitting") == 3
+    assert levenshtein("", "abc") == 3
+    assert levenshtein("kitten", "sitting", max_distance=1) == 2
@@ -0,0 +1,78 @@
+"""Behavioural tests for index-keyed patching of the OCR1 text (run with pytest)."""
+import pytest
+
+from correction.normalize import normalize_text
+from correction.outputs import CorrectionPatches, validate_output
+from correction.patches import apply_patches, filter_patches
+
+
+def test_apply_patches_replaces_words_by_index():
+    ocr1 = normalize_text("The cat sat on teh mat.")
+    assert ocr1.words[4] == "teh"
+
+    assert apply_patches(ocr1, {4: "the"}) == "The cat sat on the mat."
+
+
+def test_apply_patches_keeps_separators_and_punctuation():
+    source = "Page 1\n\nThe  quick,  brwn fox —\tjumpd!\r\n(end)"
+    ocr1 = normalize_text(source)
+    brwn, jumpd = ocr1.words.index("brwn"), ocr1.words.index("jumpd")
+
+    corrected = apply_patches(ocr1, {brwn: "brown", jumpd: "jumped"})
+
+    assert corrected == "Page 1\n\nThe  quick,  brown fox —\tjumped!\r\n(end)"
+    assert apply_patches(ocr1, {}) == source
+
+
+def test_apply_patches_ignores_out_of_range_indices():
+    ocr1 = normalize_text("one two")
+
+    assert apply_patches(ocr1, {-1: "x", 2: "y", 1: "three"}) == "one three"
+
+
+def test_apply_patches_on_adjacent_indices_keeps_the_separator_between_them():
+    ocr1 = normalize_text("thw qick, brown")
+
+    assert apply_patches(ocr1, {1: "quick", 0: "the"}) == "the quick, brown"
+    assert apply_patches(ocr1, {0: "", 1: "Quick"}) == " Quick, brown"
+
+
+def test_apply_patches_replaces_only_the_word_not_its_punctuation():
+    ocr1 = normalize_text('He said "helo," then left.')
+
+    assert apply_patches(ocr1, {2: "hello", 4: "leaves"}) == 'He said "hello," then leaves.'
+
+
+def test_filter_patches_rejects_unflagged_indices():
+    accepted, rejected = filter_patches({0: "The", 3: "on", 4: "the"}, {4})
+
+    assert accepted == {4: "the"}
+    assert rejected == [0, 3]
+
+
+def test_filter_patches_rejects_out_of_range_indices():
+    accepted, rejected = filter_patches({-1: "x", 2: "ok", 99: "y"}, {2})
+
+    assert accepted == {2: "ok"}
+    assert rejected == [-1, 99]
+
+
+def test_duplicate_index_keys_splice_one_replacement():
+    ocr1 = normalize_text("a b c d teh e")
+    patches = validate_output('{"patches": {"4": "tea", "04": "the"}}', CorrectionPatches).patches
+
+    assert list(patches) == [4]
+    assert apply_patches(ocr1, patches) in ("a b c d tea e", "a b c d the e")
+
+
+def test_correction_patches_parse_string_keys_as_indices():
+    output = 'Here you go:\n```json\n{"patches": {"4": "the", "7": "mat"}}\n```'
+
+    patches = validate_output(output, CorrectionPatches).patches
+
+    assert patches == {4: "the", 7: "mat"}
+
+
+def test_correction_patches_reject_non_index_keys():
+    with pytest.raises(ValueError):
+        validate_output('{"patches": {"teh": "the"}}', CorrectionPatches)